@@ -4,29 +4,91 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from deepseek_client import DeepSeekClient, ScenarioManager
-import secrets
+from http_transport import get_transport
+from backend_pool import get_backend_pool
+from warmup import get_warmup
+from model_router import get_model_router
+from streaming import AbortHandle, coalesce_events, dumps
+from response_cache import get_response_cache
+from singleflight import get_singleflight
+from scheduler import PRIORITY_BATCH, get_scheduler
+from errors import OverloadedError
+from session_store import create_session_store
+from metrics import install_flask_metrics
+from batch_executor import BatchExecutor
+from jobs import get_job_manager, resume_jobs
+from config import BATCH_MAX_IN_FLIGHT, BATCH_ITEM_TIMEOUT, BATCH_DEADLINE, JOBS_POLL_INTERVAL
+import os
+import threading
 import time
 
 app = Flask(__name__)
 CORS(app)  # Cho phép CORS
 
-# Lưu trữ sessions
-sessions = {}
+# Lưu trữ sessions (tự hết hạn theo TTL, giới hạn số lượng)
+# SESSION_BACKEND = "sqlite" để nhiều worker process dùng chung session
+sessions = create_session_store()
+warmup = get_warmup()
+
+
+_background_lock = threading.Lock()
+_background_started = False
+
+
+def start_background_tasks():
+    """
+    Khởi động các thread nền của server (gọi nhiều lần chỉ chạy một lần)
+
+    Import module không chạy thread nào: hàm này được gọi trước request đầu
+    tiên (start_on_first_request) hoặc khi chạy `python api_server.py`.
+    WSGI server chạy nhiều worker có thể gọi trực tiếp sau khi fork để
+    warm-up không phải chờ request đầu.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+
+    sessions.start_sweeper()
+
+    # Health check định kỳ các Ollama backend (OLLAMA_BACKENDS)
+    get_backend_pool().start_health_checker()
+
+    # Nạp sẵn model + prefill system prompt các kịch bản (chạy nền, /health báo ready)
+    if warmup:
+        warmup.start()
+
+    # Job batch chạy nền (POST /api/jobs): job dở từ lần chạy trước được chạy
+    # tiếp; chưa có DB job thì request /api/jobs đầu tiên mới tạo
+    resume_jobs()
+
+
+@app.before_request
+def start_on_first_request():
+    """Thread nền chỉ chạy trong process thật sự phục vụ request"""
+    if not _background_started:
+        start_background_tasks()
+
+
+# Số liệu hiệu năng dạng Prometheus tại GET /metrics
+install_flask_metrics(app, sessions=sessions, scheduler=get_scheduler())
 
 def get_or_create_session(session_id=None):
     """Lấy hoặc tạo session mới"""
-    if not session_id:
-        session_id = secrets.token_hex(16)
-    
-    if session_id not in sessions:
-        sessions[session_id] = {
-            'client': DeepSeekClient(),
-            'created_at': time.time(),
-            'last_active': time.time()
-        }
-    
-    sessions[session_id]['last_active'] = time.time()
-    return session_id, sessions[session_id]['client']
+    session_id, session = sessions.get_or_create(session_id)
+    return session_id, session['client']
+
+
+def overloaded_response(error):
+    """Trả lời nhanh khi quá tải: 429 nếu hàng đợi đầy, 503 nếu chờ quá lâu"""
+    response = jsonify({
+        'success': False,
+        'error': str(error),
+        'retry_after': error.retry_after
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, error.http_status
 
 
 # ============================================================================
@@ -36,14 +98,35 @@ def get_or_create_session(session_id=None):
 @app.route('/health', methods=['GET'])
 def health_check():
     """Kiểm tra trạng thái API"""
-    client = DeepSeekClient()
-    connected = client.check_connection()
+    # Theo health check nền, không gọi Ollama ở mỗi lần probe
+    connected = get_backend_pool().connected()
+    cache = get_response_cache()
+    singleflight = get_singleflight()
+    scheduler = get_scheduler()
+    router = get_model_router()
+    # Không tạo JobStore (file DB) chỉ để báo trạng thái
+    jobs = get_job_manager(create=False)
+    ready = connected and (warmup is None or warmup.ready)
+    if not connected:
+        status = 'unhealthy'
+    else:
+        status = 'healthy' if ready else 'warming_up'
     
     return jsonify({
-        'status': 'healthy' if connected else 'unhealthy',
+        'status': status,
+        'ready': ready,
         'timestamp': time.time(),
         'ollama_connected': connected,
-        'active_sessions': len(sessions)
+        'warmup': warmup.stats() if warmup else None,
+        'active_sessions': len(sessions),
+        'sessions': sessions.stats(),
+        'transport': get_transport().stats(),
+        'backends': get_backend_pool().stats(),
+        'routing': router.stats() if router else None,
+        'cache': cache.stats() if cache else None,
+        'singleflight': singleflight.stats() if singleflight else None,
+        'admission': scheduler.stats() if scheduler else None,
+        'jobs': jobs.stats() if jobs else None
     })
 
 
@@ -127,7 +210,7 @@ def chat():
         
         # Chat với AI
         start_time = time.time()
-        response = client.chat(
+        result = client.chat_detailed(
             user_message=message,
             scenario=scenario,
             use_history=use_history,
@@ -135,15 +218,21 @@ def chat():
         )
         elapsed_time = time.time() - start_time
         
-        return jsonify({
-            'success': True,
+        if use_history and result.ok:
+            sessions.save(session_id)
+        
+        body = result.to_dict()
+        body.update({
+            'success': result.ok,
             'session_id': session_id,
-            'response': response,
             'scenario': scenario,
             'elapsed_time': round(elapsed_time, 2),
             'timestamp': time.time()
         })
+        return jsonify(body), 200 if result.ok else result.error.http_status
         
+    except OverloadedError as e:
+        return overloaded_response(e)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -151,12 +240,21 @@ def chat():
         }), 500
 
 
+def sse_event(event):
+    """Đóng gói một sự kiện thành frame SSE (JSON nên không bị vỡ bởi xuống dòng)"""
+    return f"data: {dumps(event)}\n\n"
+
+
 @app.route('/api/chat/stream', methods=['POST'])
 def chat_stream():
     """
-    Chat với streaming response
+    Chat với streaming response (Server-Sent Events)
     
-    Body tương tự /api/chat
+    Body tương tự /api/chat. Mỗi sự kiện là một dòng "data: <json>":
+        {"type": "token", "content": "..."}
+        {"type": "done", "session_id": ..., "source": ..., "elapsed_time": ...,
+         "time_to_first_token": ..., "stats": {...}}
+        {"type": "error", "error": "..."}
     """
     try:
         data = request.json
@@ -168,18 +266,69 @@ def chat_stream():
             }), 400
         
         message = data['message'].strip()
+        if not message:
+            return jsonify({
+                'success': False,
+                'error': 'Message cannot be empty'
+            }), 400
+        
         scenario = data.get('scenario', 'default')
+        session_id = data.get('session_id')
+        use_history = data.get('use_history', False)
         temperature = data.get('temperature')
         
-        client = DeepSeekClient()
+        if session_id or use_history:
+            session_id, client = get_or_create_session(session_id)
+        else:
+            client = DeepSeekClient()
+        
+        start_time = time.time()
+        abort = AbortHandle()
+        events = client.chat_stream_events(
+            message, scenario, temperature, use_history, abort=abort
+        )
+        # Chờ sự kiện đầu tiên trước khi gửi header để còn trả 429/503 khi quá tải
+        try:
+            first_event = next(events)
+        except OverloadedError as e:
+            return overloaded_response(e)
+        primed_time = time.time() - start_time
+        
+        def upstream():
+            yield first_event
+            yield from events
+        
+        # Gộp các token đến sát nhau thành một frame SSE (token đầu tiên gửi ngay)
+        stream = coalesce_events(upstream(), abort=abort)
         
         def generate():
-            for chunk in client.chat_stream(message, scenario, temperature):
-                yield f"data: {chunk}\n\n"
+            first_token_time = primed_time if first_event['type'] == 'token' else None
+            try:
+                for event in stream:
+                    if event['type'] == 'token' and first_token_time is None:
+                        first_token_time = time.time() - start_time
+                    elif event['type'] == 'done':
+                        if use_history:
+                            sessions.save(session_id)
+                        event.update({
+                            'session_id': session_id,
+                            'scenario': scenario,
+                            'elapsed_time': round(time.time() - start_time, 3),
+                            'time_to_first_token': round(first_token_time, 3)
+                            if first_token_time is not None else None
+                        })
+                    yield sse_event(event)
+            finally:
+                # Client ngắt kết nối: đóng stream tới Ollama
+                stream.close()
         
         return app.response_class(
             generate(),
-            mimetype='text/event-stream'
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
         )
         
     except Exception as e:
@@ -196,30 +345,25 @@ def chat_stream():
 @app.route('/api/session', methods=['POST'])
 def create_session():
     """Tạo session mới"""
-    session_id = secrets.token_hex(16)
-    sessions[session_id] = {
-        'client': DeepSeekClient(),
-        'created_at': time.time(),
-        'last_active': time.time()
-    }
+    session_id, session = sessions.create()
     
     return jsonify({
         'success': True,
         'session_id': session_id,
-        'created_at': sessions[session_id]['created_at']
+        'created_at': session['created_at']
     })
 
 
 @app.route('/api/session/<session_id>', methods=['GET'])
 def get_session(session_id):
     """Lấy thông tin session"""
-    if session_id not in sessions:
+    session = sessions.get(session_id)
+    if session is None:
         return jsonify({
             'success': False,
             'error': 'Session not found'
         }), 404
     
-    session = sessions[session_id]
     history = session['client'].get_history()
     
     return jsonify({
@@ -235,8 +379,7 @@ def get_session(session_id):
 @app.route('/api/session/<session_id>', methods=['DELETE'])
 def delete_session(session_id):
     """Xóa session"""
-    if session_id in sessions:
-        del sessions[session_id]
+    if sessions.delete(session_id):
         return jsonify({
             'success': True,
             'message': 'Session deleted'
@@ -251,14 +394,12 @@ def delete_session(session_id):
 @app.route('/api/session/<session_id>/history', methods=['DELETE'])
 def clear_session_history(session_id):
     """Xóa lịch sử chat của session"""
-    if session_id not in sessions:
+    if not sessions.clear_history(session_id):
         return jsonify({
             'success': False,
             'error': 'Session not found'
         }), 404
     
-    sessions[session_id]['client'].clear_history()
-    
     return jsonify({
         'success': True,
         'message': 'History cleared'
@@ -274,12 +415,15 @@ def list_models():
     """Lấy danh sách models đã cài"""
     client = DeepSeekClient()
     models = client.list_models()
+    router = get_model_router()
     
     return jsonify({
         'success': True,
         'count': len(models),
         'models': models,
-        'current_model': client.model_name
+        'current_model': client.model_name,
+        # Độ trễ gần đây theo model (bộ định tuyến dùng để so với latency_slo)
+        'latency': router.stats()['models'] if router else {}
     })
 
 
@@ -287,6 +431,47 @@ def list_models():
 # BATCH PROCESSING
 # ============================================================================
 
+def build_batch_executor(data):
+    """Tạo BatchExecutor từ body request, giới hạn theo cấu hình server"""
+    max_in_flight = min(
+        int(data.get('max_concurrency') or BATCH_MAX_IN_FLIGHT),
+        BATCH_MAX_IN_FLIGHT
+    )
+    item_timeout = min(
+        float(data.get('item_timeout') or BATCH_ITEM_TIMEOUT),
+        BATCH_ITEM_TIMEOUT
+    )
+    deadline = min(
+        float(data.get('deadline') or BATCH_DEADLINE),
+        BATCH_DEADLINE
+    )
+    return BatchExecutor(
+        max_in_flight=max_in_flight,
+        item_timeout=item_timeout,
+        deadline=deadline
+    )
+
+
+def format_batch_result(result):
+    """Chuyển kết quả của BatchExecutor sang format response của API"""
+    formatted = {
+        'index': result['index'],
+        'message': result['item'],
+        'success': result['status'] == 'ok',
+        'elapsed_time': round(result['elapsed'], 2)
+    }
+    if result['status'] == 'ok':
+        chat_result = result['value']
+        formatted['response'] = chat_result.content
+        formatted['source'] = chat_result.source
+        formatted['usage'] = chat_result.usage()
+        formatted['timings'] = chat_result.timings()
+    else:
+        formatted['error'] = result['error']
+        formatted['timed_out'] = result['status'] == 'timeout'
+    return formatted
+
+
 @app.route('/api/batch', methods=['POST'])
 def batch_process():
     """
@@ -296,7 +481,10 @@ def batch_process():
     {
         "messages": ["câu 1", "câu 2", "câu 3"],
         "scenario": "default",
-        "temperature": 0.7
+        "temperature": 0.7,
+        "max_concurrency": 4,   # optional, tối đa BATCH_MAX_IN_FLIGHT
+        "item_timeout": 120,    # optional, giây cho mỗi câu
+        "deadline": 600         # optional, giây cho cả batch
     }
     """
     try:
@@ -317,33 +505,27 @@ def batch_process():
         
         scenario = data.get('scenario', 'default')
         temperature = data.get('temperature')
+        executor = build_batch_executor(data)
         
         client = DeepSeekClient()
-        results = []
         
-        start_time = time.time()
-        
-        for i, message in enumerate(messages):
-            try:
-                response = client.chat(
-                    user_message=message,
-                    scenario=scenario,
-                    temperature=temperature
-                )
-                results.append({
-                    'index': i,
-                    'message': message,
-                    'response': response,
-                    'success': True
-                })
-            except Exception as e:
-                results.append({
-                    'index': i,
-                    'message': message,
-                    'error': str(e),
-                    'success': False
-                })
+        def process(message):
+            result = client.chat_detailed(
+                user_message=message,
+                scenario=scenario,
+                temperature=temperature,
+                timeout=executor.item_timeout,
+                priority=PRIORITY_BATCH
+            )
+            if not result.ok:
+                raise result.error
+            return result
         
+        start_time = time.time()
+        results = [
+            format_batch_result(result)
+            for result in executor.run(messages, process)
+        ]
         total_time = time.time() - start_time
         
         return jsonify({
@@ -351,6 +533,7 @@ def batch_process():
             'total_messages': len(messages),
             'successful': len([r for r in results if r['success']]),
             'failed': len([r for r in results if not r['success']]),
+            'timed_out': len([r for r in results if r.get('timed_out')]),
             'total_time': round(total_time, 2),
             'results': results
         })
@@ -362,6 +545,282 @@ def batch_process():
         }), 500
 
 
+@app.route('/api/batch/stream', methods=['POST'])
+def batch_stream():
+    """
+    Giống /api/batch nhưng trả NDJSON: mỗi câu một dòng ngay khi xong
+    (theo thứ tự hoàn thành, có 'index'), dòng cuối là tổng kết.
+    Server không giữ lại kết quả nên bộ nhớ không tăng theo kích thước batch.
+    
+    Body: giống /api/batch
+    
+    Response (application/x-ndjson):
+        {"type": "result", "index": 2, "message": "...", "success": true, ...}
+        ...
+        {"type": "summary", "total_messages": 3, "successful": 3, ...}
+    """
+    try:
+        data = request.json
+        
+        if not data or 'messages' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Missing required field: messages'
+            }), 400
+        
+        messages = data['messages']
+        if not isinstance(messages, list) or len(messages) == 0:
+            return jsonify({
+                'success': False,
+                'error': 'messages must be a non-empty array'
+            }), 400
+        
+        scenario = data.get('scenario', 'default')
+        temperature = data.get('temperature')
+        executor = build_batch_executor(data)
+        
+        client = DeepSeekClient()
+        
+        def process(message):
+            result = client.chat_detailed(
+                user_message=message,
+                scenario=scenario,
+                temperature=temperature,
+                timeout=executor.item_timeout,
+                priority=PRIORITY_BATCH
+            )
+            if not result.ok:
+                raise result.error
+            return result
+        
+        def generate():
+            start_time = time.time()
+            counts = {'successful': 0, 'failed': 0, 'timed_out': 0}
+            results = executor.iter_completed(messages, process)
+            try:
+                for result in results:
+                    formatted = format_batch_result(result)
+                    if formatted['success']:
+                        counts['successful'] += 1
+                    else:
+                        counts['failed'] += 1
+                        if formatted.get('timed_out'):
+                            counts['timed_out'] += 1
+                    yield dumps(dict(formatted, type='result')) + '\n'
+                
+                yield dumps(dict(
+                    counts,
+                    type='summary',
+                    success=True,
+                    total_messages=len(messages),
+                    total_time=round(time.time() - start_time, 2)
+                )) + '\n'
+            finally:
+                # Client ngắt kết nối: bỏ các câu chưa chạy
+                results.close()
+        
+        return app.response_class(
+            generate(),
+            mimetype='application/x-ndjson',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+# ============================================================================
+# BACKGROUND JOBS
+# ============================================================================
+
+def jobs_disabled():
+    return jsonify({
+        'success': False,
+        'error': 'Background jobs are disabled (JOBS_ENABLED = False)'
+    }), 404
+
+
+def job_manager():
+    """JobManager đã chạy worker (tạo lần đầu khi có request tới /api/jobs)"""
+    manager = get_job_manager()
+    if manager is not None:
+        manager.start()
+    return manager
+
+
+def job_not_found():
+    return jsonify({
+        'success': False,
+        'error': 'Job not found'
+    }), 404
+
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """
+    Tạo job batch chạy nền, trả về job_id ngay (HTTP 202)
+    
+    Body: giống /api/batch (messages, scenario, temperature,
+    max_concurrency, item_timeout); job không có deadline
+    """
+    jobs = job_manager()
+    if not jobs:
+        return jobs_disabled()
+    try:
+        data = request.json
+        
+        if not data or 'messages' not in data:
+            return jsonify({
+                'success': False,
+                'error': 'Missing required field: messages'
+            }), 400
+        
+        messages = data['messages']
+        if not isinstance(messages, list) or len(messages) == 0:
+            return jsonify({
+                'success': False,
+                'error': 'messages must be a non-empty array'
+            }), 400
+        
+        try:
+            job = jobs.submit(
+                messages,
+                scenario=data.get('scenario', 'default'),
+                temperature=data.get('temperature'),
+                max_concurrency=data.get('max_concurrency') or BATCH_MAX_IN_FLIGHT,
+                item_timeout=data.get('item_timeout') or BATCH_ITEM_TIMEOUT
+            )
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'total': job['total']
+        }), 202
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    """Danh sách job gần đây (?limit=50)"""
+    jobs = job_manager()
+    if not jobs:
+        return jobs_disabled()
+    limit = min(request.args.get('limit', 50, type=int), 1000)
+    job_list = jobs.store.list(limit)
+    return jsonify({
+        'success': True,
+        'count': len(job_list),
+        'jobs': job_list
+    })
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Trạng thái và tiến độ của job"""
+    jobs = job_manager()
+    if not jobs:
+        return jobs_disabled()
+    job = jobs.get(job_id)
+    if job is None:
+        return job_not_found()
+    return jsonify(dict(job, success=True))
+
+
+@app.route('/api/jobs/<job_id>/results', methods=['GET'])
+def get_job_results(job_id):
+    """Kết quả theo thứ tự câu hỏi, phân trang bằng ?offset=0&limit=100"""
+    jobs = job_manager()
+    if not jobs:
+        return jobs_disabled()
+    if jobs.store.get(job_id) is None:
+        return job_not_found()
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    results = jobs.store.results(job_id, offset, limit)
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'offset': offset,
+        'count': len(results),
+        'next_offset': offset + len(results) if len(results) == limit else None,
+        'results': results
+    })
+
+
+@app.route('/api/jobs/<job_id>/stream', methods=['GET'])
+def stream_job_results(job_id):
+    """
+    Kết quả theo thứ tự hoàn thành dạng NDJSON, tới khi job kết thúc
+    
+    ?after=<seq>: chỉ gửi các kết quả sau vị trí này (nối lại khi mất kết nối)
+    Dòng cuối: {"type": "summary", "status": ..., "completed": ..., ...}
+    """
+    jobs = job_manager()
+    if not jobs:
+        return jobs_disabled()
+    if jobs.store.get(job_id) is None:
+        return job_not_found()
+    after = max(request.args.get('after', 0, type=int), 0)
+    
+    def generate():
+        seq = after
+        while True:
+            items, finished = jobs.poll_results(job_id, seq)
+            for item in items:
+                seq = item['seq']
+                yield dumps(dict(item, type='result')) + '\n'
+            if finished is not None:
+                yield dumps(dict(finished, type='summary')) + '\n'
+                return
+            if not items:
+                time.sleep(JOBS_POLL_INTERVAL)
+    
+    return app.response_class(
+        generate(),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Hủy job đang chờ / đang chạy (kết quả đã có vẫn được giữ)"""
+    jobs = job_manager()
+    if not jobs:
+        return jobs_disabled()
+    if jobs.store.get(job_id) is None:
+        return job_not_found()
+    if not jobs.cancel(job_id):
+        return jsonify({
+            'success': False,
+            'error': 'Job already finished'
+        }), 409
+    return jsonify({
+        'success': True,
+        'message': 'Job cancelled'
+    })
+
+
 # ============================================================================
 # ERROR HANDLERS
 # ============================================================================
@@ -393,6 +852,7 @@ if __name__ == '__main__':
     print("\n📝 API đang chạy tại: http://localhost:8000")
     print("\n📖 Endpoints:")
     print("   GET  /health                      - Health check")
+    print("   GET  /metrics                     - Số liệu Prometheus")
     print("   GET  /api/scenarios               - Danh sách kịch bản")
     print("   GET  /api/scenarios/<id>          - Chi tiết kịch bản")
     print("   POST /api/chat                    - Chat với AI")
@@ -403,7 +863,17 @@ if __name__ == '__main__':
     print("   DELETE /api/session/<id>/history  - Xóa lịch sử")
     print("   GET  /api/models                  - Danh sách models")
     print("   POST /api/batch                   - Batch processing")
+    print("   POST /api/batch/stream            - Batch processing (NDJSON, từng câu một)")
+    print("   POST /api/jobs                    - Tạo job batch chạy nền")
+    print("   GET  /api/jobs/<id>               - Tiến độ job")
+    print("   GET  /api/jobs/<id>/results       - Kết quả job (phân trang)")
+    print("   GET  /api/jobs/<id>/stream        - Kết quả job (NDJSON)")
+    print("   POST /api/jobs/<id>/cancel        - Hủy job")
     print("\n⚠️  Đảm bảo Ollama đang chạy: ollama serve")
     print("="*70 + "\n")
     
+    # Reloader của Werkzeug (debug=True) chạy server trong process con; process
+    # cha chỉ theo dõi thay đổi file nên không khởi động thread nền
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks()
     app.run(debug=True, host='0.0.0.0', port=8000)
@@ -2,21 +2,66 @@
 # Flask web application cho DeepSeek Custom AI
 
 from flask import Flask, render_template, request, jsonify, session
-from deepseek_client import DeepSeekClient, ScenarioManager
+from deepseek_client import ScenarioManager
 from config import SCENARIOS
+from session_store import create_session_store
+from metrics import install_flask_metrics
+from errors import OverloadedError
+from backend_pool import get_backend_pool
+from warmup import get_warmup
+import os
 import secrets
+import threading
 
 app = Flask(__name__)
 app.secret_key = secrets.token_hex(16)
 
-# Lưu client cho mỗi session
-clients = {}
+# Lưu client cho mỗi session (tự hết hạn theo TTL, giới hạn số lượng)
+clients = create_session_store()
+warmup = get_warmup()
+
+
+_background_lock = threading.Lock()
+_background_started = False
+
+
+def start_background_tasks():
+    """
+    Khởi động các thread nền của web app (gọi nhiều lần chỉ chạy một lần)
+
+    Import module không chạy thread nào: hàm này được gọi trước request đầu
+    tiên hoặc khi chạy `python app.py`.
+    """
+    global _background_started
+    with _background_lock:
+        if _background_started:
+            return
+        _background_started = True
+
+    clients.start_sweeper()
+
+    # Health check định kỳ các Ollama backend (OLLAMA_BACKENDS)
+    get_backend_pool().start_health_checker()
+
+    # Nạp sẵn model + prefill system prompt các kịch bản (chạy nền)
+    if warmup:
+        warmup.start()
+
+
+@app.before_request
+def start_on_first_request():
+    """Thread nền chỉ chạy trong process thật sự phục vụ request"""
+    if not _background_started:
+        start_background_tasks()
+
+
+# Số liệu hiệu năng dạng Prometheus tại GET /metrics
+install_flask_metrics(app, sessions=clients)
 
 def get_client(session_id):
     """Lấy hoặc tạo client cho session"""
-    if session_id not in clients:
-        clients[session_id] = DeepSeekClient()
-    return clients[session_id]
+    _, client_session = clients.get_or_create(session_id)
+    return client_session['client']
 
 @app.route('/')
 def index():
@@ -60,18 +105,38 @@ def chat():
             }), 400
         
         # Gọi AI
-        response = client.chat(
+        result = client.chat_detailed(
             message,
             scenario=scenario,
             use_history=use_history
         )
         
+        if not result.ok:
+            return jsonify({
+                'success': False,
+                'error': str(result.error),
+                'error_type': type(result.error).__name__
+            }), result.error.http_status
+        
+        if use_history:
+            clients.save(session_id)
+        
         return jsonify({
             'success': True,
-            'response': response,
-            'scenario': scenario
+            'response': result.content,
+            'source': result.source,
+            'scenario': scenario,
+            'usage': result.usage(),
+            'timings': result.timings()
         })
         
+    except OverloadedError as e:
+        response = jsonify({
+            'success': False,
+            'error': 'Hệ thống đang quá tải, vui lòng thử lại sau'
+        })
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, e.http_status
     except Exception as e:
         return jsonify({
             'success': False,
@@ -100,8 +165,7 @@ def clear_history():
     if not session_id:
         return jsonify({'success': False, 'error': 'No session'}), 400
     
-    client = get_client(session_id)
-    client.clear_history()
+    clients.clear_history(session_id)
     
     return jsonify({
         'success': True,
@@ -111,13 +175,15 @@ def clear_history():
 @app.route('/api/status', methods=['GET'])
 def check_status():
     """Kiểm tra trạng thái kết nối"""
-    client = DeepSeekClient()
-    connected = client.check_connection()
-    models = client.list_models() if connected else []
+    # Theo health check nền, không gọi Ollama ở mỗi lần kiểm tra
+    pool = get_backend_pool()
+    connected = pool.connected()
+    models = pool.models() if connected else []
     
     return jsonify({
         'success': True,
         'connected': connected,
+        'ready': connected and (warmup is None or warmup.ready),
         'models': models
     })
 
@@ -129,4 +195,8 @@ if __name__ == '__main__':
     print("\n⚠️  Đảm bảo Ollama đang chạy: ollama serve")
     print("="*60 + "\n")
     
+    # Reloader của Werkzeug (debug=True) chạy server trong process con; process
+    # cha chỉ theo dõi thay đổi file nên không khởi động thread nền
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,763 @@
+# asgi_server.py
+# REST API Server cho DeepSeek AI chạy trên ASGI (Starlette + uvicorn) với AsyncDeepSeekClient
+
+import argparse
+import asyncio
+import contextlib
+import time
+from typing import Dict, Optional
+
+import aiohttp
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Match, Route
+
+from async_client import AsyncDeepSeekClient, create_session
+from backend_pool import get_backend_pool
+from batch_executor import AsyncBatchExecutor
+from config import BATCH_MAX_IN_FLIGHT, BATCH_ITEM_TIMEOUT, BATCH_DEADLINE, JOBS_POLL_INTERVAL
+from deepseek_client import ScenarioManager
+from errors import OverloadedError
+from http_transport import get_transport
+from jobs import get_job_manager, resume_jobs
+from metrics import (
+    ACTIVE_SESSIONS,
+    ADMISSION_QUEUED,
+    HTTP_REQUESTS,
+    HTTP_REQUEST_DURATION,
+    REGISTRY,
+    scenario_label,
+)
+from model_router import get_model_router
+from response_cache import get_response_cache
+from scheduler import PRIORITY_BATCH, get_scheduler
+from session_store import create_session_store
+from singleflight import get_singleflight
+from streaming import acoalesce_events, dumps
+from warmup import get_warmup
+
+# aiohttp session dùng chung cho mọi client (tạo khi server khởi động)
+http_session: Optional[aiohttp.ClientSession] = None
+
+
+def new_client() -> AsyncDeepSeekClient:
+    return AsyncDeepSeekClient(session=http_session)
+
+
+# Lưu trữ sessions (giống api_server, nhưng mỗi session giữ một AsyncDeepSeekClient)
+sessions = create_session_store(client_factory=new_client)
+warmup = get_warmup()
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse dùng cùng thư viện JSON với streaming (orjson nếu đã cài)"""
+
+    def render(self, content) -> bytes:
+        return dumps(content).encode("utf-8")
+
+
+def error_response(message: str, status_code: int) -> Response:
+    return FastJSONResponse({'success': False, 'error': message}, status_code=status_code)
+
+
+def overloaded_response(error: OverloadedError) -> Response:
+    """Trả lời nhanh khi quá tải: 429 nếu hàng đợi đầy, 503 nếu chờ quá lâu"""
+    return FastJSONResponse(
+        {'success': False, 'error': str(error), 'retry_after': error.retry_after},
+        status_code=error.http_status,
+        headers={'Retry-After': str(error.retry_after)}
+    )
+
+
+async def read_json(request: Request) -> Optional[Dict]:
+    """Body JSON của request, None nếu không hợp lệ"""
+    try:
+        data = await request.json()
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+async def get_or_create_session(session_id=None):
+    """Lấy hoặc tạo session mới (kho session có thể là SQLite: chạy trong threadpool)"""
+    session_id, session = await run_in_threadpool(sessions.get_or_create, session_id)
+    return session_id, session['client']
+
+
+def set_scenario(request: Request, scenario) -> str:
+    """Ghi nhãn scenario cho MetricsMiddleware (giống install_flask_metrics)"""
+    request.state.scenario = scenario_label(scenario)
+    return scenario
+
+
+# ============================================================================
+# HEALTH CHECK / METRICS
+# ============================================================================
+
+async def health_check(request: Request) -> Response:
+    """Kiểm tra trạng thái API"""
+    # Theo health check nền, không gọi Ollama ở mỗi lần probe
+    connected = get_backend_pool().connected()
+    cache = get_response_cache()
+    singleflight = get_singleflight()
+    scheduler = get_scheduler()
+    router = get_model_router()
+    # Không tạo JobStore (file DB) chỉ để báo trạng thái
+    jobs = get_job_manager(create=False)
+    ready = connected and (warmup is None or warmup.ready)
+    if not connected:
+        status = 'unhealthy'
+    else:
+        status = 'healthy' if ready else 'warming_up'
+
+    return FastJSONResponse({
+        'status': status,
+        'ready': ready,
+        'server': 'asgi',
+        'timestamp': time.time(),
+        'ollama_connected': connected,
+        'warmup': warmup.stats() if warmup else None,
+        'active_sessions': await run_in_threadpool(len, sessions),
+        'sessions': await run_in_threadpool(sessions.stats),
+        'transport': get_transport().stats(),
+        'backends': get_backend_pool().stats(),
+        'routing': router.stats() if router else None,
+        'cache': cache.stats() if cache else None,
+        'singleflight': singleflight.stats() if singleflight else None,
+        'admission': scheduler.stats() if scheduler else None,
+        'jobs': await run_in_threadpool(jobs.stats) if jobs else None
+    })
+
+
+async def metrics_endpoint(request: Request) -> Response:
+    # Gauge đọc bằng callback lúc scrape (số session có thể là COUNT trên SQLite):
+    # render trong threadpool để không chặn event loop
+    text = await run_in_threadpool(REGISTRY.render)
+    return Response(text, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+# ============================================================================
+# SCENARIOS
+# ============================================================================
+
+async def list_scenarios(request: Request) -> Response:
+    """Lấy danh sách tất cả kịch bản"""
+    scenarios = ScenarioManager.list_scenarios()
+    return FastJSONResponse({
+        'success': True,
+        'count': len(scenarios),
+        'scenarios': scenarios
+    })
+
+
+async def get_scenario(request: Request) -> Response:
+    """Lấy chi tiết một kịch bản"""
+    scenario_id = request.path_params['scenario_id']
+    scenario = ScenarioManager.get_scenario(scenario_id)
+    if not scenario:
+        return error_response('Scenario not found', 404)
+    return FastJSONResponse({
+        'success': True,
+        'scenario_id': scenario_id,
+        'scenario': scenario
+    })
+
+
+# ============================================================================
+# CHAT
+# ============================================================================
+
+def parse_chat_request(data: Optional[Dict]):
+    """Kiểm tra body của /api/chat và /api/chat/stream, trả về (message, lỗi)"""
+    if not data or 'message' not in data:
+        return None, error_response('Missing required field: message', 400)
+    message = str(data['message']).strip()
+    if not message:
+        return None, error_response('Message cannot be empty', 400)
+    return message, None
+
+
+async def chat(request: Request) -> Response:
+    """Chat với AI (body giống api_server: message, scenario, session_id, use_history, temperature)"""
+    data = await read_json(request)
+    message, error = parse_chat_request(data)
+    if error is not None:
+        return error
+
+    scenario = set_scenario(request, data.get('scenario', 'default'))
+    use_history = data.get('use_history', False)
+    session_id, client = await get_or_create_session(data.get('session_id'))
+
+    start_time = time.time()
+    try:
+        result = await client.chat_detailed(
+            user_message=message,
+            scenario=scenario,
+            use_history=use_history,
+            temperature=data.get('temperature')
+        )
+    except OverloadedError as e:
+        return overloaded_response(e)
+    elapsed_time = time.time() - start_time
+
+    if use_history and result.ok:
+        await run_in_threadpool(sessions.save, session_id)
+
+    body = result.to_dict()
+    body.update({
+        'success': result.ok,
+        'session_id': session_id,
+        'scenario': scenario,
+        'elapsed_time': round(elapsed_time, 2),
+        'timestamp': time.time()
+    })
+    return FastJSONResponse(body, status_code=200 if result.ok else result.error.http_status)
+
+
+def sse_event(event: Dict) -> str:
+    """Đóng gói một sự kiện thành frame SSE"""
+    return f"data: {dumps(event)}\n\n"
+
+
+async def chat_stream(request: Request) -> Response:
+    """Chat streaming (Server-Sent Events), cùng định dạng sự kiện với api_server"""
+    data = await read_json(request)
+    message, error = parse_chat_request(data)
+    if error is not None:
+        return error
+
+    scenario = set_scenario(request, data.get('scenario', 'default'))
+    session_id = data.get('session_id')
+    use_history = data.get('use_history', False)
+    if session_id or use_history:
+        session_id, client = await get_or_create_session(session_id)
+    else:
+        client = new_client()
+
+    start_time = time.time()
+    events = client.chat_stream_events(message, scenario, data.get('temperature'), use_history)
+    # Chờ sự kiện đầu tiên trước khi gửi header để còn trả 429/503 khi quá tải
+    try:
+        first_event = await events.__anext__()
+    except OverloadedError as e:
+        return overloaded_response(e)
+    primed_time = time.time() - start_time
+
+    async def upstream():
+        try:
+            yield first_event
+            async for event in events:
+                yield event
+        finally:
+            await events.aclose()
+
+    # Gộp các token đến sát nhau thành một frame SSE (token đầu tiên gửi ngay)
+    stream = acoalesce_events(upstream())
+
+    async def generate():
+        first_token_time = primed_time if first_event['type'] == 'token' else None
+        try:
+            async for event in stream:
+                if event['type'] == 'token' and first_token_time is None:
+                    first_token_time = time.time() - start_time
+                elif event['type'] == 'done':
+                    if use_history:
+                        await run_in_threadpool(sessions.save, session_id)
+                    event.update({
+                        'session_id': session_id,
+                        'scenario': scenario,
+                        'elapsed_time': round(time.time() - start_time, 3),
+                        'time_to_first_token': round(first_token_time, 3)
+                        if first_token_time is not None else None
+                    })
+                yield sse_event(event)
+        finally:
+            # Client ngắt kết nối: hủy luôn request tới Ollama
+            await stream.aclose()
+
+    return StreamingResponse(
+        generate(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+# ============================================================================
+# SESSION MANAGEMENT
+# ============================================================================
+
+async def create_session_endpoint(request: Request) -> Response:
+    """Tạo session mới"""
+    session_id, session = await run_in_threadpool(sessions.create)
+    return FastJSONResponse({
+        'success': True,
+        'session_id': session_id,
+        'created_at': session['created_at']
+    })
+
+
+async def get_session(request: Request) -> Response:
+    """Lấy thông tin session"""
+    session_id = request.path_params['session_id']
+    session = await run_in_threadpool(sessions.get, session_id)
+    if session is None:
+        return error_response('Session not found', 404)
+
+    history = session['client'].get_history()
+    return FastJSONResponse({
+        'success': True,
+        'session_id': session_id,
+        'created_at': session['created_at'],
+        'last_active': session['last_active'],
+        'message_count': len(history),
+        'history': history
+    })
+
+
+async def delete_session(request: Request) -> Response:
+    """Xóa session"""
+    if not await run_in_threadpool(sessions.delete, request.path_params['session_id']):
+        return error_response('Session not found', 404)
+    return FastJSONResponse({'success': True, 'message': 'Session deleted'})
+
+
+async def clear_session_history(request: Request) -> Response:
+    """Xóa lịch sử chat của session"""
+    if not await run_in_threadpool(sessions.clear_history, request.path_params['session_id']):
+        return error_response('Session not found', 404)
+    return FastJSONResponse({'success': True, 'message': 'History cleared'})
+
+
+# ============================================================================
+# MODELS
+# ============================================================================
+
+async def list_models(request: Request) -> Response:
+    """Lấy danh sách models đã cài"""
+    client = new_client()
+    models = await client.list_models()
+    router = get_model_router()
+    return FastJSONResponse({
+        'success': True,
+        'count': len(models),
+        'models': models,
+        'current_model': client.model_name,
+        'latency': router.stats()['models'] if router else {}
+    })
+
+
+# ============================================================================
+# BATCH PROCESSING
+# ============================================================================
+
+def build_batch_executor(data: Dict) -> AsyncBatchExecutor:
+    """Tạo AsyncBatchExecutor từ body request, giới hạn theo cấu hình server"""
+    max_in_flight = min(int(data.get('max_concurrency') or BATCH_MAX_IN_FLIGHT), BATCH_MAX_IN_FLIGHT)
+    item_timeout = min(float(data.get('item_timeout') or BATCH_ITEM_TIMEOUT), BATCH_ITEM_TIMEOUT)
+    deadline = min(float(data.get('deadline') or BATCH_DEADLINE), BATCH_DEADLINE)
+    return AsyncBatchExecutor(
+        max_in_flight=max_in_flight,
+        item_timeout=item_timeout,
+        deadline=deadline
+    )
+
+
+def format_batch_result(result: Dict) -> Dict:
+    """Chuyển kết quả của AsyncBatchExecutor sang format response của API"""
+    formatted = {
+        'index': result['index'],
+        'message': result['item'],
+        'success': result['status'] == 'ok',
+        'elapsed_time': round(result['elapsed'], 2)
+    }
+    if result['status'] == 'ok':
+        chat_result = result['value']
+        formatted['response'] = chat_result.content
+        formatted['source'] = chat_result.source
+        formatted['usage'] = chat_result.usage()
+        formatted['timings'] = chat_result.timings()
+    else:
+        formatted['error'] = result['error']
+        formatted['timed_out'] = result['status'] == 'timeout'
+    return formatted
+
+
+async def parse_batch_request(request: Request):
+    """Kiểm tra body của /api/batch và /api/batch/stream, trả về (messages, process, executor, lỗi)"""
+    data = await read_json(request)
+    if data:
+        set_scenario(request, data.get('scenario', 'default'))
+    if not data or 'messages' not in data:
+        return None, None, None, error_response('Missing required field: messages', 400)
+
+    messages = data['messages']
+    if not isinstance(messages, list) or len(messages) == 0:
+        return None, None, None, error_response('messages must be a non-empty array', 400)
+
+    scenario = data.get('scenario', 'default')
+    temperature = data.get('temperature')
+    executor = build_batch_executor(data)
+    client = new_client()
+
+    async def process(message):
+        # Không truyền timeout cho client: executor hủy task (và request tới Ollama) khi quá hạn
+        result = await client.chat_detailed(
+            user_message=message,
+            scenario=scenario,
+            temperature=temperature,
+            priority=PRIORITY_BATCH
+        )
+        if not result.ok:
+            raise result.error
+        return result
+
+    return messages, process, executor, None
+
+
+async def batch_process(request: Request) -> Response:
+    """Xử lý nhiều câu hỏi cùng lúc (body và response giống api_server)"""
+    messages, process, executor, error = await parse_batch_request(request)
+    if error is not None:
+        return error
+
+    start_time = time.time()
+    results = [format_batch_result(result) for result in await executor.run(messages, process)]
+    total_time = time.time() - start_time
+
+    return FastJSONResponse({
+        'success': True,
+        'total_messages': len(messages),
+        'successful': len([r for r in results if r['success']]),
+        'failed': len([r for r in results if not r['success']]),
+        'timed_out': len([r for r in results if r.get('timed_out')]),
+        'total_time': round(total_time, 2),
+        'results': results
+    })
+
+
+async def batch_stream(request: Request) -> Response:
+    """Giống /api/batch nhưng trả NDJSON từng câu ngay khi xong, dòng cuối là tổng kết"""
+    messages, process, executor, error = await parse_batch_request(request)
+    if error is not None:
+        return error
+
+    async def generate():
+        start_time = time.time()
+        counts = {'successful': 0, 'failed': 0, 'timed_out': 0}
+        results = executor.aiter_completed(messages, process)
+        try:
+            async for result in results:
+                formatted = format_batch_result(result)
+                if formatted['success']:
+                    counts['successful'] += 1
+                else:
+                    counts['failed'] += 1
+                    if formatted.get('timed_out'):
+                        counts['timed_out'] += 1
+                yield dumps(dict(formatted, type='result')) + '\n'
+
+            yield dumps(dict(
+                counts,
+                type='summary',
+                success=True,
+                total_messages=len(messages),
+                total_time=round(time.time() - start_time, 2)
+            )) + '\n'
+        finally:
+            # Client ngắt kết nối: hủy các câu đang chạy
+            await results.aclose()
+
+    return StreamingResponse(
+        generate(),
+        media_type='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+# ============================================================================
+# BACKGROUND JOBS
+# ============================================================================
+# Job chạy trong worker thread của JobManager (DeepSeekClient đồng bộ),
+# các endpoint đọc / ghi SQLite qua threadpool để không chặn event loop
+
+def query_int(request: Request, name: str, default: int) -> int:
+    try:
+        return int(request.query_params.get(name, default))
+    except ValueError:
+        return default
+
+
+def job_manager():
+    """JobManager đã chạy worker (tạo lần đầu khi có request tới /api/jobs)"""
+    manager = get_job_manager()
+    if manager is not None:
+        manager.start()
+    return manager
+
+
+def jobs_disabled() -> Response:
+    return error_response('Background jobs are disabled (JOBS_ENABLED = False)', 404)
+
+
+async def create_job(request: Request) -> Response:
+    """Tạo job batch chạy nền, trả về job_id ngay (HTTP 202)"""
+    jobs = await run_in_threadpool(job_manager)
+    if not jobs:
+        return jobs_disabled()
+    data = await read_json(request)
+    if data:
+        set_scenario(request, data.get('scenario', 'default'))
+    if not data or 'messages' not in data:
+        return error_response('Missing required field: messages', 400)
+    messages = data['messages']
+    if not isinstance(messages, list) or len(messages) == 0:
+        return error_response('messages must be a non-empty array', 400)
+
+    try:
+        job = await run_in_threadpool(
+            jobs.submit,
+            messages,
+            scenario=data.get('scenario', 'default'),
+            temperature=data.get('temperature'),
+            max_concurrency=data.get('max_concurrency') or BATCH_MAX_IN_FLIGHT,
+            item_timeout=data.get('item_timeout') or BATCH_ITEM_TIMEOUT
+        )
+    except ValueError as e:
+        return error_response(str(e), 400)
+    return FastJSONResponse({
+        'success': True,
+        'job_id': job['job_id'],
+        'status': job['status'],
+        'total': job['total']
+    }, status_code=202)
+
+
+async def list_jobs(request: Request) -> Response:
+    """Danh sách job gần đây (?limit=50)"""
+    jobs = await run_in_threadpool(job_manager)
+    if not jobs:
+        return jobs_disabled()
+    job_list = await run_in_threadpool(jobs.store.list, min(query_int(request, 'limit', 50), 1000))
+    return FastJSONResponse({'success': True, 'count': len(job_list), 'jobs': job_list})
+
+
+async def get_job(request: Request) -> Response:
+    """Trạng thái và tiến độ của job"""
+    jobs = await run_in_threadpool(job_manager)
+    if not jobs:
+        return jobs_disabled()
+    job = await run_in_threadpool(jobs.get, request.path_params['job_id'])
+    if job is None:
+        return error_response('Job not found', 404)
+    return FastJSONResponse(dict(job, success=True))
+
+
+async def get_job_results(request: Request) -> Response:
+    """Kết quả theo thứ tự câu hỏi, phân trang bằng ?offset=0&limit=100"""
+    jobs = await run_in_threadpool(job_manager)
+    if not jobs:
+        return jobs_disabled()
+    job_id = request.path_params['job_id']
+    if await run_in_threadpool(jobs.store.get, job_id) is None:
+        return error_response('Job not found', 404)
+    offset = max(query_int(request, 'offset', 0), 0)
+    limit = min(max(query_int(request, 'limit', 100), 1), 1000)
+    results = await run_in_threadpool(jobs.store.results, job_id, offset, limit)
+    return FastJSONResponse({
+        'success': True,
+        'job_id': job_id,
+        'offset': offset,
+        'count': len(results),
+        'next_offset': offset + len(results) if len(results) == limit else None,
+        'results': results
+    })
+
+
+async def stream_job_results(request: Request) -> Response:
+    """Kết quả theo thứ tự hoàn thành dạng NDJSON (?after=<seq>), dòng cuối là tổng kết"""
+    jobs = await run_in_threadpool(job_manager)
+    if not jobs:
+        return jobs_disabled()
+    job_id = request.path_params['job_id']
+    if await run_in_threadpool(jobs.store.get, job_id) is None:
+        return error_response('Job not found', 404)
+    after = max(query_int(request, 'after', 0), 0)
+
+    async def generate():
+        seq = after
+        while True:
+            items, finished = await run_in_threadpool(jobs.poll_results, job_id, seq)
+            for item in items:
+                seq = item['seq']
+                yield dumps(dict(item, type='result')) + '\n'
+            if finished is not None:
+                yield dumps(dict(finished, type='summary')) + '\n'
+                return
+            if not items:
+                await asyncio.sleep(JOBS_POLL_INTERVAL)
+
+    return StreamingResponse(
+        generate(),
+        media_type='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+async def cancel_job(request: Request) -> Response:
+    """Hủy job đang chờ / đang chạy (kết quả đã có vẫn được giữ)"""
+    jobs = await run_in_threadpool(job_manager)
+    if not jobs:
+        return jobs_disabled()
+    job_id = request.path_params['job_id']
+    if await run_in_threadpool(jobs.store.get, job_id) is None:
+        return error_response('Job not found', 404)
+    if not await run_in_threadpool(jobs.cancel, job_id):
+        return error_response('Job already finished', 409)
+    return FastJSONResponse({'success': True, 'message': 'Job cancelled'})
+
+
+# ============================================================================
+# APP
+# ============================================================================
+
+async def not_found(request: Request, exc) -> Response:
+    return error_response('Endpoint not found', 404)
+
+
+async def internal_error(request: Request, exc) -> Response:
+    return error_response('Internal server error', 500)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global http_session
+    http_session = create_session()
+    sessions.start_sweeper()
+    # Không chặn event loop: lần kiểm tra đầu chạy trong thread của health checker
+    get_backend_pool().start_health_checker()
+    if warmup:
+        warmup.start()
+    # Chưa có DB job thì request /api/jobs đầu tiên mới tạo
+    await run_in_threadpool(resume_jobs)
+    try:
+        yield
+    finally:
+        await http_session.close()
+
+
+routes = [
+    Route('/health', health_check, methods=['GET']),
+    Route('/metrics', metrics_endpoint, methods=['GET']),
+    Route('/api/scenarios', list_scenarios, methods=['GET']),
+    Route('/api/scenarios/{scenario_id}', get_scenario, methods=['GET']),
+    Route('/api/chat', chat, methods=['POST']),
+    Route('/api/chat/stream', chat_stream, methods=['POST']),
+    Route('/api/session', create_session_endpoint, methods=['POST']),
+    Route('/api/session/{session_id}', get_session, methods=['GET']),
+    Route('/api/session/{session_id}', delete_session, methods=['DELETE']),
+    Route('/api/session/{session_id}/history', clear_session_history, methods=['DELETE']),
+    Route('/api/models', list_models, methods=['GET']),
+    Route('/api/batch', batch_process, methods=['POST']),
+    Route('/api/batch/stream', batch_stream, methods=['POST']),
+    Route('/api/jobs', create_job, methods=['POST']),
+    Route('/api/jobs', list_jobs, methods=['GET']),
+    Route('/api/jobs/{job_id}', get_job, methods=['GET']),
+    Route('/api/jobs/{job_id}/results', get_job_results, methods=['GET']),
+    Route('/api/jobs/{job_id}/stream', stream_job_results, methods=['GET']),
+    Route('/api/jobs/{job_id}/cancel', cancel_job, methods=['POST']),
+]
+
+
+class MetricsMiddleware:
+    """
+    Đo request HTTP giống install_flask_metrics; streaming tính tới khi gửi
+    xong body. Middleware không đọc body: nhãn scenario do handler ghi vào
+    request.state (set_scenario)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] == '/metrics':
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = "unmatched"
+        for route in routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                endpoint = route.path
+                break
+
+        start = time.perf_counter()
+        status = "500"
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = str(message['status'])
+            await send(message)
+
+        # request.state của handler ghi vào scope["state"] (cùng dict với scope này)
+        scope.setdefault('state', {})
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            scenario = scope['state'].get('scenario', "")
+            HTTP_REQUESTS.inc(endpoint, scenario, status)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, endpoint, scenario)
+
+
+ACTIVE_SESSIONS.set_function(lambda: len(sessions))
+if get_scheduler() is not None:
+    ADMISSION_QUEUED.set_function(lambda: get_scheduler().stats()['queued'])
+
+app = Starlette(
+    routes=routes,
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+        Middleware(MetricsMiddleware),
+    ],
+    exception_handlers={404: not_found, 500: internal_error},
+    lifespan=lifespan
+)
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="DeepSeek REST API trên ASGI (uvicorn)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Số process (nên dùng SESSION_BACKEND = \"sqlite\" khi > 1)")
+    args = parser.parse_args()
+
+    print("\n" + "="*70)
+    print("🚀 DEEPSEEK AI - REST API SERVER (ASGI)")
+    print("="*70)
+    print(f"\n📝 API đang chạy tại: http://localhost:{args.port}")
+    print("   Endpoints giống api_server.py (xem CURL_API_GUIDE.md)")
+    print("\n⚠️  Đảm bảo Ollama đang chạy: ollama serve")
+    print("="*70 + "\n")
+
+    uvicorn.run(
+        "asgi_server:app" if args.workers > 1 else app,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level="warning"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,411 @@
+# async_client.py
+# Client asyncio để giao tiếp với DeepSeek AI (không chặn event loop)
+
+import asyncio
+import time
+from contextlib import nullcontext
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from config import (
+    MODEL_NAME,
+    CONVERSATION_MODE,
+    OLLAMA_POOL_MAXSIZE,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_READ_TIMEOUT,
+)
+from backend_pool import FAILOVER_STATUS, Backend, BackendPool
+from model_router import ModelRouter
+from scheduler import PRIORITY_INTERACTIVE, AdmissionController, get_scheduler
+from streaming import aiter_ndjson
+from deepseek_client import CHAT_PATH, GENERATE_PATH, BaseDeepSeekClient
+from metrics import UpstreamTimer
+from chat_result import ChatResult
+from errors import (
+    DeepSeekError,
+    UpstreamConnectionError,
+    UpstreamError,
+    UpstreamTimeoutError,
+)
+from response_cache import ResponseCache
+from template_index import TemplateIndex
+
+
+def create_session(
+    pool_size: int = OLLAMA_POOL_MAXSIZE,
+    connect_timeout: float = OLLAMA_CONNECT_TIMEOUT,
+    read_timeout: float = OLLAMA_READ_TIMEOUT
+) -> aiohttp.ClientSession:
+    """
+    Tạo aiohttp session với connector có pool keep-alive giới hạn
+
+    Một session có thể dùng chung cho nhiều AsyncDeepSeekClient trong cùng
+    event loop (ví dụ: một session cho cả server).
+    """
+    connector = aiohttp.TCPConnector(limit=pool_size, limit_per_host=pool_size)
+    timeout = aiohttp.ClientTimeout(
+        sock_connect=connect_timeout,
+        sock_read=read_timeout
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+class AsyncDeepSeekClient(BaseDeepSeekClient):
+    """
+    Phiên bản asyncio của DeepSeekClient
+
+    Chưa gộp request giống hệt đang chạy (SingleFlight chỉ dùng cho client
+    đồng bộ): các request xác định trùng nhau gửi tới cùng lúc đều gọi
+    Ollama, chỉ request đến sau khi đã có câu trả lời mới dùng được cache.
+    """
+
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        session: Optional[aiohttp.ClientSession] = None,
+        cache: Optional[ResponseCache] = None,
+        templates: Optional[TemplateIndex] = None,
+        conversation_mode: str = CONVERSATION_MODE,
+        backends: Optional[BackendPool] = None,
+        router: Optional[ModelRouter] = None,
+        scheduler: Optional[AdmissionController] = None,
+        route_models: Optional[bool] = None
+    ):
+        super().__init__(
+            model_name, cache, templates, conversation_mode, backends, router, route_models
+        )
+        self._session = session
+        # Chỉ đóng session do client tự tạo
+        self._owns_session = session is None
+        # Dùng chung bộ kiểm soát tải với client sync trong cùng process
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
+
+    @staticmethod
+    def _typed_error(error: Exception) -> DeepSeekError:
+        """Chuyển exception của aiohttp thành lỗi có kiểu trong errors.py"""
+        if isinstance(error, DeepSeekError):
+            return error
+        if isinstance(error, asyncio.TimeoutError):
+            return UpstreamTimeoutError("Timeout - AI mất quá nhiều thời gian để phản hồi")
+        if isinstance(error, aiohttp.ClientConnectionError):
+            return UpstreamConnectionError(
+                "Không thể kết nối với Ollama. Bạn đã chạy 'ollama serve' chưa?"
+            )
+        if isinstance(error, aiohttp.ClientResponseError):
+            return UpstreamError(str(error), status_code=error.status)
+        return DeepSeekError(str(error))
+
+    def _slot(self, priority: int):
+        """Chờ tới lượt gọi Ollama trong event loop (raise OverloadedError khi quá tải)"""
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot_async(priority)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = create_session()
+            self._owns_session = True
+        return self._session
+
+    async def close(self):
+        """Đóng session (nếu client tự tạo)"""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _fetch_models(self, backend: Backend) -> Optional[List[str]]:
+        """Danh sách model của một backend, None nếu không kết nối được"""
+        try:
+            async with self._get_session().get(f"{backend.url}/api/tags") as response:
+                if response.status != 200:
+                    return None
+                data = await response.json()
+                return [model['name'] for model in data.get('models', [])]
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            return None
+
+    async def check_connection(self) -> bool:
+        """Kiểm tra kết nối với Ollama (ít nhất một backend trả lời)"""
+        for backend in self.backends.backends:
+            if await self._fetch_models(backend) is not None:
+                return True
+        return False
+
+    async def list_models(self) -> List[str]:
+        """Lấy danh sách models đã cài trên các backend"""
+        names = set()
+        for backend in self.backends.backends:
+            names.update(await self._fetch_models(backend) or [])
+        return sorted(names)
+
+    async def _open(
+        self,
+        path: str,
+        body: Dict,
+        timeout: Optional[aiohttp.ClientTimeout] = None
+    ) -> Tuple[Optional[Backend], aiohttp.ClientResponse]:
+        """Giống DeepSeekClient._open: chọn backend, chuyển backend khác khi lỗi trước phản hồi"""
+        model = body['model']
+        tried: List[Backend] = []
+        while True:
+            backend = self.backends.acquire(model, exclude=tried)
+            tried.append(backend)
+            try:
+                response = await self._get_session().post(
+                    f"{backend.url}{path}", json=body, timeout=timeout
+                )
+            except aiohttp.ClientConnectionError as e:
+                self.backends.release(backend, error=e)
+                if not self.backends.has_alternative(model, tried):
+                    raise
+                self.backends.record_failover()
+                continue
+            except BaseException as e:
+                self.backends.release(backend, error=e)
+                raise
+
+            retry = False
+            if response.status in FAILOVER_STATUS:
+                retry = True
+                self.backends.release(backend, error=UpstreamError(
+                    f"HTTP {response.status}", status_code=response.status
+                ))
+            elif response.status == 404 and 'not found' in await response.text():
+                retry = True
+                self.backends.mark_missing_model(backend, model)
+                self.backends.release(backend)
+
+            if retry:
+                if self.backends.has_alternative(model, tried):
+                    response.release()
+                    self.backends.record_failover()
+                    continue
+                return None, response
+            return backend, response
+
+    def _release(self, backend: Optional[Backend], error: Optional[BaseException]):
+        if backend is None:
+            return
+        if isinstance(error, UpstreamError) and error.status_code is not None \
+                and error.status_code < 500:
+            error = None
+        self.backends.release(backend, error=error)
+
+    async def chat(
+        self,
+        user_message: str,
+        scenario: str = "default",
+        use_history: bool = False,
+        temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> str:
+        """
+        Gửi tin nhắn và nhận phản hồi (async)
+
+        Tham số và giá trị trả về giống DeepSeekClient.chat
+        """
+        reply = await self.chat_detailed(
+            user_message,
+            scenario=scenario,
+            use_history=use_history,
+            temperature=temperature,
+            timeout=timeout,
+            priority=priority
+        )
+        return reply.response
+
+    async def chat_detailed(
+        self,
+        user_message: str,
+        scenario: str = "default",
+        use_history: bool = False,
+        temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> ChatResult:
+        """
+        Giống DeepSeekClient.chat_detailed (async)
+
+        Raises:
+            OverloadedError: Hàng đợi đầy hoặc chờ quá lâu
+        """
+        start = time.perf_counter()
+        system_prompt, temp = self._resolve_scenario(scenario, temperature)
+        messages = self._build_messages(user_message, system_prompt, use_history, scenario)
+        payload = self._build_payload(
+            messages, temp, stream=False, model=self._requested_model(scenario)
+        )
+
+        # Chỉ định tuyến model khi không có câu trả lời từ câu mẫu / cache
+        local, cache_key = self._lookup_local(scenario, user_message, payload)
+        if local is None:
+            local, cache_key = self._route_payload(scenario, payload, cache_key)
+        model = payload["model"]
+        if local is not None:
+            if use_history:
+                self._record_turn(user_message, local.content)
+            local.elapsed = time.perf_counter() - start
+            return local
+
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        use_context = use_history and self._context_usable(scenario, model)
+        if use_context:
+            path = GENERATE_PATH
+            body = self._build_generate_payload(
+                user_message, system_prompt, temp, stream=False, model=model
+            )
+        else:
+            path = CHAT_PATH
+            body = payload
+
+        # Giữ lượt chạy trong lúc chờ Ollama trả lời
+        async with self._slot(priority):
+            timer = UpstreamTimer(body['model'])
+            backend = None
+            error = None
+            try:
+                backend, response = await self._open(path, body, request_timeout)
+                async with response:
+                    if response.status == 200:
+                        result = await response.json()
+                        timer.finish(result)
+                        self._observe_latency(timer)
+                        if use_context:
+                            ai_response = result['response']
+                        else:
+                            ai_response = result['message']['content']
+
+                        if cache_key is not None:
+                            self.cache.set(cache_key, ai_response)
+
+                        if use_history:
+                            self._record_turn(user_message, ai_response)
+                            if use_context:
+                                self._save_context(scenario, result.get('context'), model)
+
+                        return ChatResult.from_ollama(
+                            ai_response,
+                            result,
+                            model=model,
+                            elapsed=time.perf_counter() - start
+                        )
+                    else:
+                        text = await response.text()
+                        error = UpstreamError(
+                            f"{response.status} - {text}",
+                            status_code=response.status
+                        )
+
+            except Exception as e:
+                error = self._typed_error(e)
+            finally:
+                timer.fail()
+                self._release(backend, error)
+            return ChatResult.failure(error, model=model, elapsed=time.perf_counter() - start)
+
+    async def chat_stream(
+        self,
+        user_message: str,
+        scenario: str = "default",
+        temperature: Optional[float] = None,
+        use_history: bool = False,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> AsyncIterator[str]:
+        """
+        Chat với streaming response (async generator trả về từng phần)
+        """
+        async for event in self.chat_stream_events(
+            user_message, scenario, temperature, use_history, priority
+        ):
+            if event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "error":
+                yield event["error"]
+
+    async def chat_stream_events(
+        self,
+        user_message: str,
+        scenario: str = "default",
+        temperature: Optional[float] = None,
+        use_history: bool = False,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> AsyncIterator[Dict]:
+        """
+        Giống DeepSeekClient.chat_stream_events (async generator)
+
+        Khi quá tải, OverloadedError được raise trước sự kiện đầu tiên.
+        """
+        system_prompt, temp = self._resolve_scenario(scenario, temperature)
+        messages = self._build_messages(user_message, system_prompt, use_history, scenario)
+        payload = self._build_payload(
+            messages, temp, stream=True, model=self._requested_model(scenario)
+        )
+
+        # Chỉ định tuyến model khi không có câu trả lời từ câu mẫu / cache
+        local, cache_key = self._lookup_local(scenario, user_message, payload)
+        if local is None:
+            local, cache_key = self._route_payload(scenario, payload, cache_key)
+        model = payload["model"]
+        if local is not None:
+            for event in self._local_stream_events(user_message, local, use_history):
+                yield event
+            return
+
+        use_context = use_history and self._context_usable(scenario, model)
+        if use_context:
+            path = GENERATE_PATH
+            body = self._build_generate_payload(
+                user_message, system_prompt, temp, stream=True, model=model
+            )
+        else:
+            path = CHAT_PATH
+            body = payload
+
+        # Giữ lượt chạy cho tới khi stream kết thúc hoặc bị đóng
+        async with self._slot(priority):
+            parts = []
+            final = None
+            timer = UpstreamTimer(body['model'])
+            backend = None
+            error = None
+            try:
+                backend, response = await self._open(path, body)
+                async with response:
+                    if response.status != 200:
+                        raise UpstreamError(
+                            f"{response.status} - {await response.text()}",
+                            status_code=response.status
+                        )
+                    async for data in aiter_ndjson(response.content.iter_any()):
+                        content = self._stream_chunk_content(data)
+                        if content:
+                            timer.first_token()
+                            parts.append(content)
+                            yield {"type": "token", "content": content}
+                        if data.get('done'):
+                            final = data
+                            timer.finish(data)
+                            self._observe_latency(timer)
+                            break
+            except (GeneratorExit, asyncio.CancelledError):
+                timer.fail("cancelled")
+                raise
+            except Exception as e:
+                error = e
+                yield self._error_event(e)
+                return
+            finally:
+                timer.fail()
+                self._release(backend, error)
+
+        yield self._finish_stream(
+            user_message, scenario, model, parts, final, cache_key, use_history, use_context
+        )
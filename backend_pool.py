@@ -0,0 +1,267 @@
+# backend_pool.py
+# Nhiều Ollama backend phía sau một client: chọn backend ít request đang chạy nhất
+
+import itertools
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set
+
+import requests
+
+from config import (
+    OLLAMA_BACKENDS,
+    BACKEND_FAILURE_THRESHOLD,
+    BACKEND_EJECT_SECONDS,
+    BACKEND_HEALTH_INTERVAL,
+)
+from errors import NoBackendAvailableError
+from http_transport import OllamaTransport, get_transport
+
+# Mã HTTP cho thấy backend đang có vấn đề (không phải lỗi của request)
+FAILOVER_STATUS = (502, 503, 504)
+
+
+class Backend:
+    """Một Ollama instance và trạng thái của nó"""
+
+    def __init__(self, url: str):
+        self.url = url.rstrip('/')
+        self.outstanding = 0
+        # None = chưa biết backend có những model nào (coi như có đủ)
+        self.models: Optional[Set[str]] = None
+        self.consecutive_failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_used = 0
+
+    def has_model(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def available(self, now: float) -> bool:
+        """Không bị loại (hoặc đã hết thời gian loại - cho thử lại)"""
+        return now >= self.ejected_until
+
+
+class BackendPool:
+    """
+    Chọn Ollama backend cho từng request
+
+    - Chỉ chọn backend có model cần dùng (theo /api/tags), trong đó chọn
+      backend có ít request đang chạy nhất; bằng nhau thì xoay vòng
+    - Lỗi liên tiếp `failure_threshold` lần: loại backend `eject_seconds`
+      giây, sau đó cho thử lại. Health check nền cập nhật trạng thái và
+      danh sách model
+    - Khi mọi backend đều bị loại vẫn thử backend ít việc nhất thay vì từ chối
+    """
+
+    def __init__(
+        self,
+        urls: Iterable[str] = OLLAMA_BACKENDS,
+        transport: Optional[OllamaTransport] = None,
+        failure_threshold: int = BACKEND_FAILURE_THRESHOLD,
+        eject_seconds: float = BACKEND_EJECT_SECONDS,
+        health_interval: float = BACKEND_HEALTH_INTERVAL
+    ):
+        self.backends: List[Backend] = [Backend(url) for url in urls]
+        if not self.backends:
+            raise ValueError("Cần ít nhất một Ollama backend")
+        self.transport = transport or get_transport()
+        self.failure_threshold = failure_threshold
+        self.eject_seconds = eject_seconds
+        self.health_interval = health_interval
+        self._lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._stop = threading.Event()
+        self._checker: Optional[threading.Thread] = None
+        self.failovers = 0
+        # Thời điểm health check gần nhất (None = chưa kiểm tra lần nào)
+        self.last_check: Optional[float] = None
+        self._checking = False
+
+    def __len__(self) -> int:
+        return len(self.backends)
+
+    def acquire(self, model: str, exclude: Iterable[Backend] = ()) -> Backend:
+        """
+        Chọn backend cho một request (nhớ gọi release() khi xong)
+
+        Raises:
+            NoBackendAvailableError: Đã thử hết các backend
+        """
+        excluded = set(id(b) for b in exclude)
+        now = time.time()
+        with self._lock:
+            candidates = [b for b in self.backends if id(b) not in excluded]
+            if not candidates:
+                raise NoBackendAvailableError("Không có Ollama backend nào khả dụng")
+            # Không backend nào có model: để Ollama trả lỗi "model not found"
+            with_model = [b for b in candidates if b.has_model(model)] or candidates
+            healthy = [b for b in with_model if b.available(now)] or with_model
+            backend = min(healthy, key=lambda b: (b.outstanding, b.last_used))
+            backend.outstanding += 1
+            backend.requests += 1
+            backend.last_used = next(self._seq)
+            return backend
+
+    def has_alternative(self, model: str, exclude: Iterable[Backend]) -> bool:
+        """Còn backend nào khác (có model, chưa thử) để chuyển sang không"""
+        excluded = set(id(b) for b in exclude)
+        return any(id(b) not in excluded and b.has_model(model) for b in self.backends)
+
+    def release(self, backend: Backend, error: Optional[BaseException] = None):
+        """Trả backend sau request; error khác None nghĩa là backend có vấn đề"""
+        with self._lock:
+            backend.outstanding -= 1
+            if error is None:
+                backend.consecutive_failures = 0
+                return
+            backend.errors += 1
+            backend.consecutive_failures += 1
+            backend.last_error = f"{type(error).__name__}: {error}"
+            if backend.consecutive_failures >= self.failure_threshold:
+                backend.ejected_until = time.time() + self.eject_seconds
+
+    def record_failover(self):
+        with self._lock:
+            self.failovers += 1
+
+    def mark_missing_model(self, backend: Backend, model: str):
+        """Backend trả "model not found": không chọn nó cho model này nữa"""
+        with self._lock:
+            if backend.models is None:
+                backend.models = set()
+            backend.models.discard(model)
+
+    def model_available(self, model: str) -> bool:
+        """Có backend nào đang hoạt động và có model này không"""
+        now = time.time()
+        with self._lock:
+            return any(b.available(now) and b.has_model(model) for b in self.backends)
+
+    def models(self) -> List[str]:
+        """Tất cả model có trên ít nhất một backend"""
+        names: Set[str] = set()
+        for backend in self.backends:
+            if backend.models:
+                names.update(backend.models)
+        return sorted(names)
+
+    # ------------------------------------------------------------------
+    # Health check
+    # ------------------------------------------------------------------
+
+    def check_backend(self, backend: Backend) -> bool:
+        """Gọi /api/tags: cập nhật trạng thái và danh sách model của backend"""
+        try:
+            response = self.transport.get(f"{backend.url}/api/tags", timeout=(2, 5))
+            response.raise_for_status()
+            models = {model['name'] for model in response.json().get('models', [])}
+        except (requests.exceptions.RequestException, ValueError) as e:
+            with self._lock:
+                backend.last_error = f"{type(e).__name__}: {e}"
+                backend.ejected_until = time.time() + self.eject_seconds
+            return False
+
+        with self._lock:
+            backend.models = models
+            backend.consecutive_failures = 0
+            backend.ejected_until = 0.0
+        return True
+
+    def check_health(self) -> int:
+        """Kiểm tra mọi backend, trả về số backend khỏe"""
+        healthy = sum(self.check_backend(backend) for backend in self.backends)
+        self.last_check = time.time()
+        return healthy
+
+    def check_health_background(self):
+        """Chạy một lần check_health() trong thread nền nếu chưa có lần nào đang chạy"""
+        with self._lock:
+            if self._checking:
+                return
+            self._checking = True
+
+        def run():
+            try:
+                self.check_health()
+            finally:
+                with self._lock:
+                    self._checking = False
+
+        threading.Thread(target=run, name='backend-health-once', daemon=True).start()
+
+    def connected(self) -> bool:
+        """
+        Có backend nào khỏe theo lần health check gần nhất (không gọi Ollama)
+
+        Chưa kiểm tra lần nào: chạy một lần check nền, trả False tới khi có kết quả
+        """
+        if self.last_check is None:
+            self.check_health_background()
+            return False
+        now = time.time()
+        with self._lock:
+            return any(b.available(now) for b in self.backends)
+
+    def _health_loop(self):
+        # Lần kiểm tra đầu chạy ngay trong thread nền để không chặn lúc khởi động
+        self.check_health()
+        while not self._stop.wait(self.health_interval):
+            self.check_health()
+
+    def start_health_checker(self):
+        """Chạy health check định kỳ trong thread nền (daemon), không chặn"""
+        if self._checker is not None and self._checker.is_alive():
+            return
+        self._stop.clear()
+        self._checker = threading.Thread(
+            target=self._health_loop,
+            name='backend-health',
+            daemon=True
+        )
+        self._checker.start()
+
+    def stop_health_checker(self):
+        self._stop.set()
+        if self._checker is not None:
+            self._checker.join(timeout=5)
+            self._checker = None
+
+    def stats(self) -> Dict:
+        """Trạng thái từng backend"""
+        now = time.time()
+        with self._lock:
+            backends = [
+                {
+                    'url': b.url,
+                    'healthy': b.available(now),
+                    'outstanding': b.outstanding,
+                    'requests': b.requests,
+                    'errors': b.errors,
+                    'models': sorted(b.models) if b.models is not None else None,
+                    'ejected_for': round(max(b.ejected_until - now, 0), 1),
+                    'last_error': b.last_error
+                }
+                for b in self.backends
+            ]
+        return {
+            'backends': backends,
+            'healthy': sum(1 for b in backends if b['healthy']),
+            'failovers': self.failovers
+        }
+
+
+_pool: Optional[BackendPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_backend_pool() -> BackendPool:
+    """Lấy pool backend dùng chung của process (khởi tạo lần đầu)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = BackendPool()
+    return _pool
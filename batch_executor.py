@@ -0,0 +1,233 @@
+# batch_executor.py
+# Chạy nhiều tác vụ song song với giới hạn số lượng đồng thời, timeout và deadline
+
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional
+
+from config import BATCH_MAX_IN_FLIGHT, BATCH_ITEM_TIMEOUT, BATCH_DEADLINE
+
+
+class BatchExecutor:
+    """
+    Bộ thực thi batch dùng worker pool có giới hạn
+
+    - Tối đa `max_in_flight` item chạy cùng lúc, item được lấy dần từ
+      iterable nên bộ nhớ không tăng theo kích thước batch
+    - Item chạy quá `item_timeout` giây bị đánh dấu timeout
+    - Hết `deadline` giây, các item chưa xong đều bị đánh dấu timeout
+
+    Mỗi kết quả là dict:
+        {'index', 'item', 'status': 'ok'|'error'|'timeout',
+         'value', 'error', 'elapsed'}
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = BATCH_MAX_IN_FLIGHT,
+        item_timeout: Optional[float] = BATCH_ITEM_TIMEOUT,
+        deadline: Optional[float] = BATCH_DEADLINE
+    ):
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.item_timeout = item_timeout
+        self.deadline = deadline
+
+    @staticmethod
+    def _result(index: int, item: Any, status: str, value: Any = None,
+                error: Optional[str] = None, elapsed: float = 0.0) -> Dict:
+        return {
+            'index': index,
+            'item': item,
+            'status': status,
+            'value': value,
+            'error': error,
+            'elapsed': elapsed
+        }
+
+    def iter_completed(
+        self,
+        items: Iterable,
+        fn: Callable[[Any], Any]
+    ) -> Iterator[Dict]:
+        """
+        Chạy fn(item) cho từng item, trả kết quả theo thứ tự hoàn thành
+
+        Thread không dừng được giữa chừng: item bị timeout vẫn chiếm worker
+        tới khi fn trả về, nên vẫn được tính vào `max_in_flight` và item mới
+        chỉ được gửi khi có worker rảnh thật. Nhờ vậy item luôn chạy ngay khi
+        được gửi và item_timeout tính từ lúc gửi.
+        """
+        deadline_at = time.monotonic() + self.deadline if self.deadline else None
+        started: Dict[int, float] = {}
+        pending = {}
+        # Item đã bị đánh dấu timeout nhưng thread vẫn đang chạy
+        abandoned = set()
+        source = enumerate(items)
+        exhausted = False
+
+        def elapsed_of(index):
+            return time.monotonic() - started[index]
+
+        pool = ThreadPoolExecutor(
+            max_workers=self.max_in_flight,
+            thread_name_prefix='batch'
+        )
+        try:
+            while True:
+                abandoned = {future for future in abandoned if not future.done()}
+                past_deadline = deadline_at is not None and time.monotonic() >= deadline_at
+
+                # Nạp thêm item cho đủ số worker (hết deadline: các item còn lại đều timeout)
+                while not exhausted and (
+                    past_deadline or len(pending) + len(abandoned) < self.max_in_flight
+                ):
+                    try:
+                        index, item = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if past_deadline:
+                        yield self._result(index, item, 'timeout',
+                                           error='Batch deadline exceeded')
+                        continue
+                    started[index] = time.monotonic()
+                    pending[pool.submit(fn, item)] = (index, item)
+
+                if not pending and (exhausted or not abandoned):
+                    break
+
+                done, _ = wait(
+                    set(pending) | abandoned,
+                    timeout=self._next_wakeup(pending, started, deadline_at),
+                    return_when=FIRST_COMPLETED
+                )
+
+                for future in done:
+                    if future not in pending:
+                        continue
+                    index, item = pending.pop(future)
+                    try:
+                        value = future.result()
+                        yield self._result(index, item, 'ok', value=value,
+                                           elapsed=elapsed_of(index))
+                    except Exception as e:
+                        yield self._result(index, item, 'error', error=str(e),
+                                           elapsed=elapsed_of(index))
+
+                now = time.monotonic()
+
+                # Item chạy quá lâu: bỏ qua kết quả (worker chỉ rảnh khi fn trả về)
+                if self.item_timeout:
+                    for future, (index, item) in list(pending.items()):
+                        if now - started[index] >= self.item_timeout:
+                            del pending[future]
+                            abandoned.add(future)
+                            yield self._result(index, item, 'timeout',
+                                               error='Item timeout exceeded',
+                                               elapsed=now - started[index])
+
+                # Hết deadline: mọi item còn dở đều timeout
+                if deadline_at is not None and now >= deadline_at:
+                    for future, (index, item) in list(pending.items()):
+                        abandoned.add(future)
+                        yield self._result(index, item, 'timeout',
+                                           error='Batch deadline exceeded',
+                                           elapsed=elapsed_of(index))
+                    pending.clear()
+        finally:
+            for future in pending:
+                future.cancel()
+            # Không chờ các item đã bị bỏ qua chạy xong
+            pool.shutdown(wait=False)
+
+    def run(self, items: Iterable, fn: Callable[[Any], Any]) -> List[Dict]:
+        """Chạy cả batch, trả kết quả theo đúng thứ tự đầu vào"""
+        results = list(self.iter_completed(items, fn))
+        results.sort(key=lambda r: r['index'])
+        return results
+
+    def _next_wakeup(self, pending, started, deadline_at) -> Optional[float]:
+        """Thời gian chờ tối đa trước lần kiểm tra timeout tiếp theo"""
+        now = time.monotonic()
+        wakeups = []
+        if deadline_at is not None:
+            wakeups.append(deadline_at - now)
+        if self.item_timeout:
+            for index, _ in pending.values():
+                wakeups.append(started[index] + self.item_timeout - now)
+        if not wakeups:
+            return None
+        return max(min(wakeups), 0)
+
+
+class AsyncBatchExecutor(BatchExecutor):
+    """
+    Giống BatchExecutor cho coroutine (asgi_server): mỗi item là một task
+    asyncio thay vì một thread; item quá hạn bị hủy luôn thay vì chạy tiếp nền
+    """
+
+    async def _call(self, fn: Callable[[Any], Awaitable], item: Any,
+                    deadline_at: Optional[float]):
+        timeout = self.item_timeout
+        if deadline_at is not None:
+            remaining = deadline_at - time.monotonic()
+            if timeout is None or remaining < timeout:
+                try:
+                    return await asyncio.wait_for(fn(item), remaining)
+                except asyncio.TimeoutError:
+                    raise asyncio.TimeoutError('Batch deadline exceeded') from None
+        try:
+            return await asyncio.wait_for(fn(item), timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError('Item timeout exceeded') from None
+
+    async def aiter_completed(
+        self,
+        items: Iterable,
+        fn: Callable[[Any], Awaitable]
+    ) -> AsyncIterator[Dict]:
+        """Chạy await fn(item) cho từng item, trả kết quả theo thứ tự hoàn thành"""
+        deadline_at = time.monotonic() + self.deadline if self.deadline else None
+        pending: Dict[asyncio.Task, tuple] = {}
+        source = enumerate(items)
+        exhausted = False
+
+        try:
+            while True:
+                while not exhausted and len(pending) < self.max_in_flight:
+                    try:
+                        index, item = next(source)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    if deadline_at is not None and time.monotonic() >= deadline_at:
+                        yield self._result(index, item, 'timeout',
+                                           error='Batch deadline exceeded')
+                        continue
+                    task = asyncio.ensure_future(self._call(fn, item, deadline_at))
+                    pending[task] = (index, item, time.monotonic())
+
+                if not pending:
+                    break
+
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    index, item, start = pending.pop(task)
+                    elapsed = time.monotonic() - start
+                    try:
+                        value = task.result()
+                        yield self._result(index, item, 'ok', value=value, elapsed=elapsed)
+                    except asyncio.TimeoutError as e:
+                        yield self._result(index, item, 'timeout', error=str(e), elapsed=elapsed)
+                    except Exception as e:
+                        yield self._result(index, item, 'error', error=str(e), elapsed=elapsed)
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def run(self, items: Iterable, fn: Callable[[Any], Awaitable]) -> List[Dict]:
+        """Chạy cả batch, trả kết quả theo đúng thứ tự đầu vào"""
+        results = [result async for result in self.aiter_completed(items, fn)]
+        results.sort(key=lambda r: r['index'])
+        return results
@@ -0,0 +1,362 @@
+# benchmark.py
+# Đo hiệu năng api_server (Flask) / asgi_server với mock Ollama, so sánh với baseline để phát hiện chậm đi
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Chỉ số được so sánh với baseline: (tên, True nếu càng lớn càng tốt)
+COMPARED_METRICS = (
+    ("p50", False),
+    ("p95", False),
+    ("p99", False),
+    ("rps", True),
+)
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Phân vị q (0-100) theo nội suy tuyến tính, None nếu không có dữ liệu"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(latencies: List[float], errors: int, wall_time: float) -> Dict:
+    """Tóm tắt độ trễ (giây) và thông lượng của một loạt request"""
+    def rounded(value: Optional[float]) -> Optional[float]:
+        return round(value, 4) if value is not None else None
+
+    total = len(latencies) + errors
+    return {
+        "requests": total,
+        "errors": errors,
+        "error_rate": round(errors / total, 4) if total else 0.0,
+        "p50": rounded(percentile(latencies, 50)),
+        "p95": rounded(percentile(latencies, 95)),
+        "p99": rounded(percentile(latencies, 99)),
+        "mean": rounded(sum(latencies) / len(latencies)) if latencies else None,
+        "max": rounded(max(latencies)) if latencies else None,
+        "rps": round(len(latencies) / wall_time, 2) if wall_time > 0 else None,
+    }
+
+
+# ============================================================================
+# PROCESS
+# ============================================================================
+
+def wait_until_ready(url: str, timeout: float = 30) -> bool:
+    """Chờ tới khi URL trả HTTP 200"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return True
+        except requests.exceptions.RequestException:
+            pass
+        time.sleep(0.1)
+    return False
+
+
+def start_mock(args) -> subprocess.Popen:
+    command = [
+        sys.executable, os.path.join(HERE, "mock_ollama.py"),
+        "--host", "127.0.0.1",
+        "--port", str(args.mock_port),
+        "--latency", str(args.mock_latency),
+        "--tokens-per-second", str(args.mock_tps),
+        "--response-tokens", str(args.mock_tokens),
+        "--error-rate", str(args.mock_error_rate),
+        "--seed", "0",
+    ]
+    return subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def start_api_server(args, server: str = "flask") -> subprocess.Popen:
+    """Chạy api_server (Flask, không debug / reloader) hoặc asgi_server (uvicorn) trỏ tới mock Ollama"""
+    # Chạy trong thư mục tạm: file SQLite của server (session, job) không rơi vào repo
+    env = dict(
+        os.environ,
+        OLLAMA_BASE_URL=f"http://127.0.0.1:{args.mock_port}",
+        PYTHONPATH=os.pathsep.join(filter(None, [HERE, os.environ.get("PYTHONPATH")]))
+    )
+    if server == "asgi":
+        code = (
+            "import uvicorn, asgi_server; "
+            f"uvicorn.run(asgi_server.app, host='127.0.0.1', port={args.api_port}, "
+            "log_level='warning')"
+        )
+    else:
+        code = (
+            "import api_server; "
+            f"api_server.app.run(host='127.0.0.1', port={args.api_port}, threaded=True)"
+        )
+    return subprocess.Popen(
+        [sys.executable, "-c", code],
+        cwd=tempfile.mkdtemp(prefix="deepseek-benchmark-"),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+
+
+def process_rss_mb(pid: int) -> Optional[float]:
+    """Bộ nhớ (RSS, MB) của một process, None nếu không đọc được (không phải Linux)"""
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def stop(process: subprocess.Popen):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+# ============================================================================
+# WORKLOAD
+# ============================================================================
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = _local.session = requests.Session()
+    return session
+
+
+def chat_request(base_url: str, index: int) -> Dict:
+    response = _session().post(
+        f"{base_url}/api/chat",
+        json={"message": f"Câu hỏi benchmark số {index}"},
+        timeout=120
+    )
+    return {"ok": response.status_code == 200}
+
+
+def stream_request(base_url: str, index: int) -> Dict:
+    start = time.perf_counter()
+    ttft = None
+    ok = False
+    with _session().post(
+        f"{base_url}/api/chat/stream",
+        json={"message": f"Câu hỏi streaming số {index}"},
+        stream=True,
+        timeout=120
+    ) as response:
+        if response.status_code != 200:
+            return {"ok": False}
+        for line in response.iter_lines():
+            if not line.startswith(b"data: "):
+                continue
+            event = json.loads(line[6:])
+            if event["type"] == "token" and ttft is None:
+                ttft = time.perf_counter() - start
+            elif event["type"] == "done":
+                ok = True
+            elif event["type"] == "error":
+                ok = False
+    return {"ok": ok, "ttft": ttft}
+
+
+def batch_request(base_url: str, index: int) -> Dict:
+    response = _session().post(
+        f"{base_url}/api/batch",
+        json={"messages": [f"Batch {index} câu {i}" for i in range(4)]},
+        timeout=300
+    )
+    return {"ok": response.status_code == 200 and response.json().get("failed") == 0}
+
+
+WORKLOADS: Dict[str, Callable[[str, int], Dict]] = {
+    "chat": chat_request,
+    "chat_stream": stream_request,
+    "batch": batch_request,
+}
+
+
+def run_workload(name: str, base_url: str, n_requests: int, concurrency: int) -> Dict:
+    """Chạy n_requests request (closed-loop, `concurrency` luồng) và tóm tắt kết quả"""
+    fn = WORKLOADS[name]
+    latencies: List[float] = []
+    ttfts: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(index: int):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            outcome = fn(base_url, index)
+        except requests.exceptions.RequestException:
+            outcome = {"ok": False}
+        elapsed = time.perf_counter() - start
+        with lock:
+            if outcome["ok"]:
+                latencies.append(elapsed)
+                if outcome.get("ttft") is not None:
+                    ttfts.append(outcome["ttft"])
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(n_requests)))
+    wall_time = time.perf_counter() - start
+
+    summary = summarize(latencies, errors, wall_time)
+    if ttfts:
+        summary["ttft_p50"] = round(percentile(ttfts, 50), 4)
+        summary["ttft_p95"] = round(percentile(ttfts, 95), 4)
+    return summary
+
+
+# ============================================================================
+# BASELINE
+# ============================================================================
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """So sánh với baseline, trả về danh sách chỉ số bị chậm đi quá ngưỡng"""
+    regressions = []
+    print(f"\n{'workload':<18} {'chỉ số':<6} {'baseline':>10} {'hiện tại':>10} {'thay đổi':>9}")
+    for name, current in results["workloads"].items():
+        previous = baseline.get("workloads", {}).get(name)
+        if not previous:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS:
+            old, new = previous.get(metric), current.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if higher_is_better else change
+            flag = " ❌" if worse > tolerance else ""
+            print(f"{name:<18} {metric:<6} {old:>10} {new:>10} {change:>+8.1%}{flag}")
+            if worse > tolerance:
+                regressions.append(f"{name}.{metric}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark api_server với mock Ollama")
+    parser.add_argument("--server", choices=("flask", "asgi", "both"), default="flask",
+                        help="Server cần đo; kết quả của asgi được lưu với tiền tố \"asgi:\"")
+    parser.add_argument("--workloads", default="chat,chat_stream,batch",
+                        help=f"Danh sách workload, cách nhau bởi dấu phẩy ({', '.join(WORKLOADS)})")
+    parser.add_argument("--requests", type=int, default=200, help="Số request mỗi workload")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10, help="Số request chạy thử, không tính")
+    parser.add_argument("--api-port", type=int, default=18000)
+    parser.add_argument("--mock-port", type=int, default=18434)
+    parser.add_argument("--mock-latency", type=float, default=0.05)
+    parser.add_argument("--mock-tps", type=float, default=200.0)
+    parser.add_argument("--mock-tokens", type=int, default=32)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", default="benchmark_baseline.json")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Ghi kết quả lần này làm baseline mới")
+    parser.add_argument("--tolerance", type=float, default=0.15,
+                        help="Mức chậm đi cho phép so với baseline (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    workloads = [name.strip() for name in args.workloads.split(",") if name.strip()]
+    unknown = [name for name in workloads if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"Workload không hợp lệ: {', '.join(unknown)}")
+
+    servers = ["flask", "asgi"] if args.server == "both" else [args.server]
+    base_url = f"http://127.0.0.1:{args.api_port}"
+    results = {
+        "timestamp": time.time(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mock_latency": args.mock_latency,
+            "mock_tps": args.mock_tps,
+            "mock_tokens": args.mock_tokens,
+            "mock_error_rate": args.mock_error_rate,
+            "servers": servers,
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "workloads": {}
+    }
+
+    mock = start_mock(args)
+    try:
+        if not wait_until_ready(f"http://127.0.0.1:{args.mock_port}/api/tags"):
+            sys.exit("❌ Mock Ollama không khởi động được")
+        for server_name in servers:
+            # Giữ tên workload cũ cho Flask để so được với baseline đã có
+            prefix = "" if server_name == "flask" else f"{server_name}:"
+            server = start_api_server(args, server_name)
+            try:
+                if not wait_until_ready(f"{base_url}/api/scenarios"):
+                    sys.exit(f"❌ Server {server_name} không khởi động được")
+
+                for name in workloads:
+                    if args.warmup:
+                        run_workload(name, base_url, args.warmup, args.concurrency)
+                    print(f"▶️  {prefix}{name}: {args.requests} request, concurrency {args.concurrency}")
+                    summary = run_workload(name, base_url, args.requests, args.concurrency)
+                    summary["server_rss_mb"] = process_rss_mb(server.pid)
+                    results["workloads"][f"{prefix}{name}"] = summary
+                    print(f"   p50={summary['p50']}s p95={summary['p95']}s p99={summary['p99']}s "
+                          f"rps={summary['rps']} lỗi={summary['errors']} "
+                          f"rss={summary['server_rss_mb']}MB")
+            finally:
+                stop(server)
+    finally:
+        stop(mock)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ Đã lưu kết quả: {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"✅ Đã cập nhật baseline: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"ℹ️  Chưa có baseline ({args.baseline}), chạy lại với --update-baseline để tạo")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print("\n❌ Hiệu năng kém hơn baseline:")
+        for line in regressions:
+            print(f"   - {line}")
+        sys.exit(1)
+    print("\n✅ Không có chỉ số nào kém hơn baseline quá ngưỡng")
+
+
+if __name__ == "__main__":
+    main()
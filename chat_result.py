@@ -0,0 +1,124 @@
+# chat_result.py
+# Kết quả có cấu trúc của một lượt chat: nội dung, nguồn, số token, thời gian từng pha
+
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from errors import DeepSeekError
+
+_NS = 1e9
+
+
+def _seconds(data: Dict, key: str) -> Optional[float]:
+    """Đổi trường thời gian của Ollama (nano giây) sang giây"""
+    value = data.get(key)
+    return value / _NS if value is not None else None
+
+
+@dataclass
+class ChatResult:
+    """
+    Kết quả chi tiết của DeepSeekClient.chat_detailed()
+
+    - content: câu trả lời ("" khi lỗi)
+    - source: "template" (câu mẫu), "cache" hoặc "model"
+    - model: model đã trả lời (theo bộ định tuyến), None với câu mẫu / cache
+    - error: lỗi có kiểu (xem errors.py), None nếu thành công
+    - prompt_tokens / completion_tokens: prompt_eval_count / eval_count của Ollama
+    - load/prompt_eval/eval/total_duration: thời gian từng pha (giây) do Ollama
+      đo - nạp model, xử lý prompt (prefill), sinh token (decode), tổng
+    - elapsed: thời gian phía client (giây), gồm cả chờ hàng đợi và mạng
+    """
+
+    content: str
+    source: str = "model"
+    error: Optional[DeepSeekError] = None
+    coalesced: bool = False
+    model: Optional[str] = None
+    template_score: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    load_duration: Optional[float] = None
+    prompt_eval_duration: Optional[float] = None
+    eval_duration: Optional[float] = None
+    total_duration: Optional[float] = None
+    elapsed: Optional[float] = None
+
+    @classmethod
+    def from_ollama(cls, content: str, data: Dict, **kwargs) -> "ChatResult":
+        """Tạo kết quả từ message cuối của Ollama (/api/chat hoặc /api/generate)"""
+        return cls(
+            content,
+            prompt_tokens=data.get("prompt_eval_count"),
+            completion_tokens=data.get("eval_count"),
+            load_duration=_seconds(data, "load_duration"),
+            prompt_eval_duration=_seconds(data, "prompt_eval_duration"),
+            eval_duration=_seconds(data, "eval_duration"),
+            total_duration=_seconds(data, "total_duration"),
+            **kwargs
+        )
+
+    @classmethod
+    def failure(cls, error: DeepSeekError, **kwargs) -> "ChatResult":
+        return cls("", error=error, **kwargs)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+    @property
+    def cached(self) -> bool:
+        """Trả lời không cần gọi model (câu mẫu hoặc cache)"""
+        return self.source in ("template", "cache")
+
+    @property
+    def response(self) -> str:
+        """Câu trả lời dạng chuỗi như chat(): nội dung hoặc "Lỗi: ..." """
+        if self.error is not None:
+            return f"Lỗi: {self.error}"
+        return self.content
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Tốc độ sinh token (eval_count / eval_duration)"""
+        if not self.completion_tokens or not self.eval_duration:
+            return None
+        return self.completion_tokens / self.eval_duration
+
+    def usage(self) -> Dict:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens
+        }
+
+    def timings(self) -> Dict:
+        """Thời gian từng pha (giây, làm tròn)"""
+        def rounded(value: Optional[float]) -> Optional[float]:
+            return round(value, 4) if value is not None else None
+
+        return {
+            "load": rounded(self.load_duration),
+            "prompt_eval": rounded(self.prompt_eval_duration),
+            "eval": rounded(self.eval_duration),
+            "total": rounded(self.total_duration),
+            "elapsed": rounded(self.elapsed),
+            "tokens_per_second": rounded(self.tokens_per_second)
+        }
+
+    def to_dict(self) -> Dict:
+        """Dạng JSON để trả về từ API"""
+        data = {
+            "response": self.response,
+            "source": self.source,
+            "model": self.model,
+            "cached": self.cached,
+            "template_hit": self.source == "template",
+            "coalesced": self.coalesced,
+            "usage": self.usage(),
+            "timings": self.timings(),
+            "error": str(self.error) if self.error is not None else None,
+            "error_type": type(self.error).__name__ if self.error is not None else None
+        }
+        if self.template_score is not None:
+            data["template_score"] = self.template_score
+        return data
@@ -1,9 +1,20 @@
 # cli.py
 # Giao diện dòng lệnh để chat với DeepSeek
 
+import argparse
+import json
+import os
 import sys
+import threading
+import time
+from typing import Dict, Iterator, Optional, Set, Tuple
+
 from deepseek_client import DeepSeekClient, ScenarioManager
-from config import SCENARIOS
+from batch_executor import BatchExecutor
+from errors import OverloadedError
+from scheduler import PRIORITY_BATCH
+from streaming import dumps
+from config import SCENARIOS, BATCH_ITEM_TIMEOUT
 
 class ChatCLI:
     """Giao diện CLI để chat"""
@@ -25,7 +36,8 @@ class ChatCLI:
         print("  history on  - Bật lịch sử hội thoại")
         print("  history off - Tắt lịch sử hội thoại")
         print("  clear       - Xóa lịch sử")
-        print("  export      - Xuất hội thoại ra file")
+        print("  export      - Ghi hội thoại ra file JSONL (các lượt sau tự ghi nối)")
+        print("  import      - Nạp lại hội thoại từ file đã xuất")
         print("  models      - Xem models đã cài")
         print("  quit        - Thoát")
         print("="*60)
@@ -94,6 +106,33 @@ class ChatCLI:
             self.use_history = False
             print("✅ Đã TẮT lịch sử hội thoại")
             
+    def export_conversation(self):
+        """Ghi hội thoại ra file (.jsonl / .jsonl.gz / .jsonl.zst ghi nối, .json ghi một lần)"""
+        print("\nTên file (Enter = conversation.jsonl): ", end="")
+        filename = input().strip() or "conversation.jsonl"
+        try:
+            self.client.export_conversation(filename)
+        except (OSError, ValueError) as e:
+            print(f"❌ Không xuất được: {e}")
+            return
+        print(f"✅ Đã xuất hội thoại ra file: {filename}")
+        if filename.endswith((".jsonl", ".jsonl.gz", ".jsonl.zst")):
+            print("📝 Các lượt chat tiếp theo sẽ tự được ghi nối vào file này")
+
+    def import_conversation(self):
+        """Nạp lại lịch sử hội thoại từ file đã xuất (phiên cuối cùng trong file)"""
+        print("\nTên file: ", end="")
+        filename = input().strip()
+        if not filename:
+            return
+        try:
+            count = self.client.import_conversation(filename, last_session=True)
+        except (OSError, ValueError) as e:
+            print(f"❌ Không nạp được: {e}")
+            return
+        self.use_history = True
+        print(f"✅ Đã nạp {count} tin nhắn, lịch sử hội thoại đã BẬT")
+
     def show_models(self):
         """Hiển thị models đã cài"""
         print("\n🔍 Đang kiểm tra models...")
@@ -143,14 +182,294 @@ class ChatCLI:
                 self.client.clear_history()
                 print("✅ Đã xóa lịch sử hội thoại")
             elif command == "export":
-                filename = self.client.export_conversation()
-                print(f"✅ Đã xuất hội thoại ra file: {filename}")
+                self.export_conversation()
+            elif command == "import":
+                self.import_conversation()
             elif command == "models":
                 self.show_models()
             else:
                 print("❌ Lệnh không hợp lệ!")
 
 
-if __name__ == "__main__":
+# ============================================================================
+# BULK MODE
+# ============================================================================
+
+class BulkCheckpoint:
+    """
+    Tiến độ của một lần chạy bulk, ghi ra file để chạy lại tiếp được
+
+    Lưu số dòng đầu vào đã xong liên tiếp (`watermark`), các dòng đã xong
+    lẻ phía sau nó và kích thước file kết quả tại thời điểm ghi. Khi chạy
+    tiếp, file kết quả được cắt về đúng kích thước đó nên các dòng ghi sau
+    checkpoint cuối được chạy lại một lần, không bị trùng.
+    """
+
+    def __init__(self, path: str, input_path: str):
+        self.path = path
+        self.input_path = os.path.abspath(input_path)
+        self.watermark = 0
+        self.completed: Set[int] = set()
+        self.output_offset = 0
+
+    def load(self) -> bool:
+        """Đọc checkpoint đã có, False nếu chưa có"""
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data["input"] != self.input_path:
+            raise ValueError(f"Checkpoint {self.path} thuộc file khác: {data['input']}")
+        self.watermark = data["watermark"]
+        self.completed = set(data["completed"])
+        self.output_offset = data["output_offset"]
+        return True
+
+    def is_done(self, line_number: int) -> bool:
+        return line_number <= self.watermark or line_number in self.completed
+
+    def mark(self, line_number: int):
+        self.completed.add(line_number)
+        while self.watermark + 1 in self.completed:
+            self.watermark += 1
+            self.completed.remove(self.watermark)
+
+    def save(self, output_offset: int):
+        """Ghi checkpoint (ghi file tạm rồi đổi tên để không bao giờ hỏng nửa chừng)"""
+        self.output_offset = output_offset
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "input": self.input_path,
+                "watermark": self.watermark,
+                "completed": sorted(self.completed),
+                "output_offset": output_offset,
+                "updated_at": time.time()
+            }, f)
+        os.replace(tmp_path, self.path)
+
+
+def read_prompts(path: str, default_scenario: str) -> Iterator[Tuple[int, Optional[Dict]]]:
+    """
+    Đọc dần file JSONL (không nạp cả file), trả về (số dòng, prompt)
+
+    Mỗi dòng là {"message": "...", "scenario": "...", "temperature": 0.7, "id": ...},
+    {"body": "..."} / {"title": "..."} (như requests.jsonl) hoặc một chuỗi JSON.
+    Dòng trống / không hợp lệ trả về prompt None.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                yield line_number, None
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"\n⚠️  Bỏ qua dòng {line_number}: không phải JSON", file=sys.stderr)
+                yield line_number, None
+                continue
+
+            if isinstance(record, str):
+                record = {"message": record}
+            message = record.get("message") or record.get("body") or record.get("title")
+            if not isinstance(message, str) or not message.strip():
+                print(f"\n⚠️  Bỏ qua dòng {line_number}: không có message", file=sys.stderr)
+                yield line_number, None
+                continue
+            yield line_number, {
+                "id": record.get("id", record.get("request_id")),
+                "message": message,
+                "scenario": record.get("scenario", default_scenario),
+                "temperature": record.get("temperature")
+            }
+
+
+def count_lines(path: str) -> int:
+    """Số dòng của file (đọc theo khối, dùng để tính ETA)"""
+    count = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            count += block.count(b"\n")
+    return count
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "--:--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def run_bulk(args) -> int:
+    """
+    Chạy cả file prompt qua worker pool, ghi nối kết quả ra file JSONL
+    ngay khi từng prompt xong; chạy lại cùng lệnh sẽ tiếp tục từ checkpoint
+    """
+    checkpoint_path = args.checkpoint or f"{args.output}.ckpt"
+    if args.restart:
+        for path in (args.output, checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    checkpoint = BulkCheckpoint(checkpoint_path, args.input)
+    resumed = checkpoint.load()
+    if resumed:
+        size = os.path.getsize(args.output) if os.path.exists(args.output) else 0
+        if size < checkpoint.output_offset:
+            print(f"❌ {args.output} ngắn hơn checkpoint ({checkpoint_path}); "
+                  f"dùng --restart để chạy lại từ đầu", file=sys.stderr)
+            return 1
+        with open(args.output, "ab") as f:
+            f.truncate(checkpoint.output_offset)
+        print(f"↩️  Tiếp tục từ checkpoint: đã xong {checkpoint.watermark + len(checkpoint.completed)} dòng")
+    elif os.path.exists(args.output) and os.path.getsize(args.output) > 0:
+        print(f"❌ {args.output} đã có dữ liệu nhưng không có checkpoint "
+              f"({checkpoint_path}); dùng --restart để chạy lại từ đầu", file=sys.stderr)
+        return 1
+
+    total_lines = count_lines(args.input)
+    client = DeepSeekClient()
+    executor = BatchExecutor(
+        max_in_flight=args.workers,
+        item_timeout=args.item_timeout,
+        deadline=None
+    )
+
+    def pending_prompts():
+        # Chạy ở thread chính (executor lấy item dần), nên cập nhật checkpoint không cần lock
+        for line_number, prompt in read_prompts(args.input, args.scenario):
+            if checkpoint.is_done(line_number):
+                continue
+            if prompt is None:
+                checkpoint.mark(line_number)
+                continue
+            prompt["line"] = line_number
+            yield prompt
+
+    # Đặt khi vòng lặp chính dừng (xong, lỗi, Ctrl+C): thread đang chờ thử lại thoát ngay
+    stopped = threading.Event()
+
+    def process(prompt: Dict):
+        # Cùng hạn với executor: quá item_timeout thì prompt đã bị ghi là timeout
+        deadline = time.monotonic() + args.item_timeout
+        while not stopped.is_set():
+            remaining = deadline - time.monotonic()
+            try:
+                result = client.chat_detailed(
+                    user_message=prompt["message"],
+                    scenario=prompt["scenario"],
+                    temperature=prompt["temperature"],
+                    timeout=max(remaining, 1),
+                    priority=PRIORITY_BATCH
+                )
+            except OverloadedError as e:
+                error = e
+            else:
+                if result.ok or not isinstance(result.error, OverloadedError):
+                    return result
+                error = result.error
+            # Chạy offline: chờ hàng đợi rảnh thay vì bỏ prompt (trong hạn item_timeout)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise error
+            stopped.wait(min(error.retry_after, remaining))
+        raise RuntimeError("Bulk run stopped")
+
+    start = time.monotonic()
+    last_checkpoint = last_progress = start
+    done = failed = since_checkpoint = 0
+    initial_done = checkpoint.watermark + len(checkpoint.completed)
+    interactive = sys.stderr.isatty()
+
+    output = open(args.output, "ab")
+    results = executor.iter_completed(pending_prompts(), process)
+    try:
+        for item in results:
+            prompt = item["item"]
+            record = {
+                "line": prompt["line"],
+                "id": prompt["id"],
+                "message": prompt["message"],
+                "scenario": prompt["scenario"],
+                "success": item["status"] == "ok",
+                "elapsed_time": round(item["elapsed"], 3)
+            }
+            if item["status"] == "ok":
+                chat_result = item["value"]
+                record.update({
+                    "response": chat_result.content,
+                    "model": chat_result.model,
+                    "source": chat_result.source,
+                    "usage": chat_result.usage()
+                })
+            else:
+                record["error"] = item["error"]
+                failed += 1
+            output.write((dumps(record) + "\n").encode("utf-8"))
+            output.flush()
+            checkpoint.mark(prompt["line"])
+            done += 1
+            since_checkpoint += 1
+
+            now = time.monotonic()
+            if since_checkpoint >= args.checkpoint_every or now - last_checkpoint >= 10:
+                os.fsync(output.fileno())
+                checkpoint.save(output.tell())
+                last_checkpoint, since_checkpoint = now, 0
+
+            if now - last_progress >= (1 if interactive else 30):
+                last_progress = now
+                rate = done / (now - start)
+                remaining = max(total_lines - initial_done - done, 0)
+                eta = remaining / rate if rate > 0 else None
+                status = (f"📊 {initial_done + done}/{total_lines} dòng | "
+                          f"{rate:.2f} prompt/s | lỗi {failed} | "
+                          f"đã chạy {format_duration(now - start)} | ETA {format_duration(eta)}")
+                print(f"\r{status}" if interactive else status, end="" if interactive else "\n",
+                      file=sys.stderr, flush=True)
+    except KeyboardInterrupt:
+        print("\n⏸️  Đã dừng, chạy lại cùng lệnh để tiếp tục", file=sys.stderr)
+    finally:
+        stopped.set()
+        results.close()
+        output.flush()
+        os.fsync(output.fileno())
+        checkpoint.save(output.tell())
+        output.close()
+
+    elapsed = time.monotonic() - start
+    print(f"\n✅ Xong {done} prompt trong {format_duration(elapsed)} "
+          f"({done / elapsed if elapsed > 0 else 0:.2f} prompt/s), lỗi {failed}")
+    print(f"📄 Kết quả: {args.output}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chat với DeepSeek qua dòng lệnh")
+    subparsers = parser.add_subparsers(dest="command")
+
+    bulk = subparsers.add_parser("bulk", help="Chạy cả file prompt JSONL (chạy tiếp được khi bị dừng)")
+    bulk.add_argument("input", help="File JSONL, mỗi dòng một prompt")
+    bulk.add_argument("-o", "--output", default="bulk_results.jsonl", help="File JSONL kết quả (ghi nối)")
+    bulk.add_argument("--scenario", default="default", choices=sorted(SCENARIOS),
+                      help="Kịch bản cho các dòng không ghi rõ scenario")
+    bulk.add_argument("--workers", type=int, default=4, help="Số prompt chạy cùng lúc")
+    bulk.add_argument("--item-timeout", type=float, default=BATCH_ITEM_TIMEOUT,
+                      help="Giây tối đa cho mỗi prompt")
+    bulk.add_argument("--checkpoint", help="File checkpoint (mặc định: <output>.ckpt)")
+    bulk.add_argument("--checkpoint-every", type=int, default=100,
+                      help="Ghi checkpoint sau mỗi N kết quả (và ít nhất 10 giây một lần)")
+    bulk.add_argument("--restart", action="store_true",
+                      help="Xóa kết quả + checkpoint cũ, chạy lại từ đầu")
+    args = parser.parse_args()
+
+    if args.command == "bulk":
+        sys.exit(run_bulk(args))
+
     cli = ChatCLI()
     cli.run()
+
+
+if __name__ == "__main__":
+    main()
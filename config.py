@@ -1,10 +1,111 @@
 # config.py
 # File cấu hình các kịch bản tùy chỉnh
 
-# URL của Ollama API (chạy local)
-OLLAMA_URL = "http://localhost:11434/api/chat"
+import os
+
+# URL của Ollama API (chạy local). Ghi đè bằng biến môi trường OLLAMA_BASE_URL,
+# ví dụ để trỏ tới mock_ollama.py khi chạy benchmark
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")
 MODEL_NAME = "deepseek-r1:1.5b"  # Hoặc deepseek-r1:7b nếu máy mạnh
 
+# Nhiều Ollama instance phía sau cùng một API: danh sách URL cách nhau bởi dấu phẩy
+# trong biến môi trường OLLAMA_BACKENDS, mặc định chỉ dùng OLLAMA_BASE_URL
+OLLAMA_BACKENDS = [
+    url.strip() for url in os.environ.get("OLLAMA_BACKENDS", "").split(",") if url.strip()
+] or [OLLAMA_BASE_URL]
+# Endpoint chat của backend đầu tiên (giữ cho code cũ; client gửi request qua BackendPool)
+OLLAMA_URL = f"{OLLAMA_BACKENDS[0]}/api/chat"
+BACKEND_FAILURE_THRESHOLD = 3   # Số lỗi liên tiếp trước khi tạm loại backend
+BACKEND_EJECT_SECONDS = 30      # Giây - thời gian loại trước khi cho thử lại
+BACKEND_HEALTH_INTERVAL = 10    # Giây - chu kỳ health check (/api/tags)
+
+# Connection pool dùng chung cho mọi DeepSeekClient trong process
+OLLAMA_POOL_CONNECTIONS = max(4, len(OLLAMA_BACKENDS))  # Số host được giữ pool riêng
+OLLAMA_POOL_MAXSIZE = 32        # Số kết nối keep-alive tối đa mỗi host
+OLLAMA_POOL_BLOCK = True        # Chờ kết nối rảnh thay vì mở thêm khi pool đầy
+OLLAMA_CONNECT_TIMEOUT = 5      # Giây - timeout khi mở kết nối TCP
+OLLAMA_READ_TIMEOUT = 60        # Giây - timeout chờ dữ liệu từ Ollama
+
+# Thời gian Ollama giữ model trong RAM, chỉ gửi kèm request nạp model lúc
+# warm-up (request chat thường dùng mặc định của Ollama): -1 = luôn giữ,
+# "30m" = 30 phút, None = mặc định của Ollama (5 phút rồi giải phóng)
+OLLAMA_KEEP_ALIVE = -1
+
+# Khởi động API server / web app: nạp sẵn model và prefill system prompt của
+# các kịch bản để request đầu tiên không phải chờ load_duration (tắt mặc định)
+WARMUP_ENABLED = False
+WARMUP_MODELS = None              # None = chỉ MODEL_NAME; thêm model riêng của kịch bản nếu cần
+WARMUP_SCENARIOS = True           # Prefill system prompt của mọi kịch bản
+WARMUP_TIMEOUT = 300              # Giây - timeout cho mỗi request warm-up (nạp model trên CPU rất chậm)
+
+# Xử lý batch song song (POST /api/batch)
+BATCH_MAX_IN_FLIGHT = 4         # Số câu hỏi gửi tới Ollama cùng lúc tối đa
+BATCH_ITEM_TIMEOUT = 120        # Giây - timeout cho mỗi câu hỏi
+BATCH_DEADLINE = 600            # Giây - hạn chót cho cả batch
+
+# Cache câu trả lời (chỉ áp dụng cho request có tính xác định)
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+RESPONSE_CACHE_MAX_BYTES = 32 * 1024 * 1024   # 32MB
+RESPONSE_CACHE_TTL = 3600                     # Giây
+RESPONSE_CACHE_MAX_TEMPERATURE = 0.3          # Chỉ cache khi temperature <= giá trị này,
+                                              # hoặc kịch bản khai báo "cacheable": True
+
+# Gộp các request xác định giống hệt nhau đang chạy đồng thời (cùng quy tắc với cache)
+SINGLEFLIGHT_ENABLED = True
+SINGLEFLIGHT_WAIT_TIMEOUT = 150   # Giây - request đi sau chờ request đầu tối đa bao lâu
+
+# Kiểm soát tải trước Ollama: giới hạn đồng thời + hàng đợi ưu tiên
+# (chat tương tác được ưu tiên hơn batch)
+ADMISSION_ENABLED = True
+ADMISSION_MAX_CONCURRENCY = 4     # Số request tối đa gửi tới mỗi Ollama backend cùng lúc
+ADMISSION_MAX_QUEUE = 64          # Số request chờ tối đa, vượt quá trả 429
+ADMISSION_QUEUE_TIMEOUT = 30      # Giây - chờ quá lâu trả 503
+
+# Trả lời nhanh từ QA_TEMPLATES khi câu hỏi khớp câu mẫu
+TEMPLATE_FASTPATH_ENABLED = True
+TEMPLATE_MATCH_THRESHOLD = 0.9    # Độ tương đồng tối thiểu của từng từ nội dung (0.0-1.0)
+
+# Session của API server / web app
+SESSION_IDLE_TTL = 1800           # Giây - session không hoạt động quá lâu sẽ bị xóa
+SESSION_MAX_SESSIONS = 10000      # Vượt quá thì loại session ít dùng gần đây nhất
+SESSION_SWEEP_INTERVAL = 60       # Giây - chu kỳ dọn session hết hạn
+SESSION_BACKEND = "memory"        # "memory" hoặc "sqlite" (chạy nhiều worker process)
+SESSION_DB_PATH = "sessions.db"   # File SQLite khi SESSION_BACKEND = "sqlite"
+
+# Cửa sổ lịch sử khi use_history=True (kịch bản có thể ghi đè bằng
+# "history_max_turns" / "history_token_budget")
+HISTORY_MAX_TURNS = None          # Số lượt hỏi - đáp tối đa, None = không giới hạn
+HISTORY_TOKEN_BUDGET = 3000       # Token ước lượng tối đa của cả prompt, luôn giữ system prompt
+
+# Chế độ hội thoại khi use_history=True:
+#   "chat"    - gửi lại lịch sử qua /api/chat mỗi lượt
+#   "context" - dùng /api/generate và giữ context token của Ollama, mỗi lượt
+#               chỉ gửi câu hỏi mới (giảm thời gian prefill trên CPU)
+CONVERSATION_MODE = "chat"
+
+# Streaming: thư viện JSON giải mã NDJSON của Ollama ("auto" = orjson nếu đã cài,
+# "orjson", "json") và gộp token trước khi gửi SSE cho client
+STREAM_JSON_BACKEND = "auto"
+STREAM_COALESCE_MAX_DELAY = 0.03  # Giây - giữ token tối đa bấy nhiêu lâu, 0 = không gộp
+STREAM_COALESCE_MAX_BYTES = 1024  # Gửi ngay khi phần đang giữ đủ số byte này
+
+# Chọn model theo kịch bản: kịch bản khai báo "model", "fallback_model" và
+# "latency_slo" (giây); khi model ưu tiên không kịp SLO thì dùng model dự phòng
+MODEL_ROUTING_ENABLED = True
+LARGE_MODEL_NAME = "deepseek-r1:7b"
+ROUTER_LATENCY_WINDOW = 60        # Giây - chỉ xét độ trễ các request gần đây
+ROUTER_MIN_SAMPLES = 5            # Số request tối thiểu trước khi so với SLO
+
+# Job batch chạy nền (POST /api/jobs): trạng thái và kết quả lưu trong SQLite,
+# server khởi động lại vẫn chạy tiếp các job đang dở
+JOBS_ENABLED = True
+JOBS_DB_PATH = "jobs.db"
+JOBS_MAX_RUNNING = 1              # Số job chạy cùng lúc trong mỗi process
+JOBS_MAX_ITEMS = 100000           # Số câu hỏi tối đa của một job
+JOBS_STALE_AFTER = 30             # Giây - job "running" mất heartbeat quá lâu thì được chạy lại
+JOBS_POLL_INTERVAL = 1.0          # Giây - chu kỳ tìm job mới / đọc kết quả mới khi stream
+
 # Định nghĩa các kịch bản khác nhau
 SCENARIOS = {
     "default": {
@@ -28,7 +129,11 @@ Format trả lời:
 2. Hiểu vấn đề
 3. Đưa ra giải pháp chi tiết
 4. Xác nhận khách hàng đã hiểu""",
-        "temperature": 0.5
+        "temperature": 0.5,
+        "cacheable": True,  # Câu hỏi FAQ lặp lại nhiều, cho phép cache
+        "history_max_turns": 6,  # Hội thoại hỗ trợ dài, chỉ giữ các lượt gần nhất
+        "model": MODEL_NAME,  # Câu hỏi đơn giản, luôn dùng model nhỏ cho nhanh
+        "latency_slo": 10
     },
     
     "teacher": {
@@ -99,7 +204,11 @@ Khi tạo nội dung:
 2. Phát triển ý tưởng logic
 3. Sử dụng hình ảnh minh họa sinh động
 4. Kết thúc ấn tượng""",
-        "temperature": 0.9
+        "temperature": 0.9,
+        # Dùng model lớn khi còn kịp, quá tải thì chuyển về model nhỏ
+        "model": LARGE_MODEL_NAME,
+        "fallback_model": MODEL_NAME,
+        "latency_slo": 30
     }
 }
 
@@ -0,0 +1,329 @@
+# conversation_log.py
+# Lưu hội thoại dạng JSONL ghi nối từng lượt (tùy chọn nén gzip / zstd), đọc lại theo kiểu streaming
+
+import gzip
+import os
+import time
+import zlib
+from typing import IO, Dict, Iterable, Iterator, Optional, Tuple
+
+from streaming import dumps, loads
+
+try:
+    import zstandard
+except ImportError:  # zstandard là tùy chọn, chỉ cần khi dùng file .zst
+    zstandard = None
+
+# Đuôi file -> kiểu nén
+COMPRESSION_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+
+# Đuôi file dùng định dạng JSONL (export_conversation với đuôi khác vẫn ghi JSON như cũ)
+LOG_SUFFIXES = (".jsonl", ".jsonl.gz", ".jsonl.zst")
+
+# Số byte đọc mỗi lần khi giải nén
+_READ_SIZE = 64 * 1024
+
+
+def is_log_path(path: str) -> bool:
+    """File có dùng định dạng JSONL ghi nối không (theo đuôi file)"""
+    return path.endswith(LOG_SUFFIXES)
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """Kiểu nén theo đuôi file: "gzip", "zstd" hoặc None"""
+    for suffix, compression in COMPRESSION_SUFFIXES.items():
+        if path.endswith(suffix):
+            return compression
+    return None
+
+
+def _require_zstd():
+    if zstandard is None:
+        raise ValueError("Cần cài zstandard để dùng file .zst: pip install zstandard")
+
+
+def _decompressor(compression: str):
+    if compression == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    return zstandard.ZstdDecompressor().decompressobj()
+
+
+def _iter_members(f: IO[bytes], compression: str) -> Iterator[Tuple[bytes, Optional[int]]]:
+    """
+    Giải nén dần file gồm nhiều gzip member / zstd frame nối nhau
+
+    Trả về từng cặp (dữ liệu đã giải nén, offset), offset là vị trí byte
+    ngay sau một member hoàn chỉnh vừa kết thúc, None nếu member chưa kết
+    thúc. Dừng (không raise) khi gặp dữ liệu hỏng hoặc hết file giữa chừng
+    một member, ví dụ process bị dừng khi đang ghi.
+    """
+    errors = _errors(compression)
+    decompressor = _decompressor(compression)
+    offset = 0          # Vị trí trong file của đầu `chunk`
+    member_start = 0
+    emitted = 0         # Số byte đã trả về của member hiện tại
+    while True:
+        chunk = f.read(_READ_SIZE)
+        if not chunk:
+            return
+        while chunk:
+            try:
+                data = decompressor.decompress(chunk)
+            except errors:
+                # Phần dữ liệu tốt ngay trước chỗ hỏng nằm cùng lần giải nén bị lỗi
+                data = _salvage(f, compression, member_start, offset + len(chunk))
+                if len(data) > emitted:
+                    yield data[emitted:], None
+                return
+            if not decompressor.eof:
+                offset += len(chunk)
+                emitted += len(data)
+                yield data, None
+                break
+            rest = decompressor.unused_data
+            offset += len(chunk) - len(rest)
+            yield data, offset
+            decompressor = _decompressor(compression)
+            member_start, emitted = offset, 0
+            chunk = rest
+
+
+def _errors(compression: str) -> tuple:
+    return (zlib.error,) if compression == "gzip" else (zstandard.ZstdError,)
+
+
+def _salvage(f: IO[bytes], compression: str, start: int, end: int) -> bytes:
+    """Giải nén lại từng byte của member hỏng [start, end), lấy phần trước chỗ lỗi"""
+    f.seek(start)
+    raw = f.read(end - start)
+    decompressor = _decompressor(compression)
+    parts = []
+    for i in range(len(raw)):
+        try:
+            parts.append(decompressor.decompress(raw[i:i + 1]))
+        except _errors(compression):
+            break
+    return b"".join(parts)
+
+
+def _repair(path: str, compression: Optional[str]):
+    """
+    Sửa đuôi file do writer trước bị dừng giữa chừng, để ghi nối tiếp được
+
+    - Không nén: cắt dòng cuối bị ghi dở
+    - gzip / zstd: cắt member cuối chưa kết thúc (hoặc hỏng) rồi ghi lại các
+      dòng đầy đủ của nó thành một member hoàn chỉnh. Nếu không sửa, member
+      mới nối sau member dở sẽ làm hỏng mọi dữ liệu phía sau khi đọc.
+
+    Phải đọc lướt cả file nén (mỗi lần mở writer một lần), không nạp cả file vào bộ nhớ.
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, "r+b") as f:
+        if compression is None:
+            # Đọc ngược từ cuối file tới dấu xuống dòng gần nhất
+            size = pos = f.seek(0, os.SEEK_END)
+            while pos > 0:
+                start = max(pos - _READ_SIZE, 0)
+                f.seek(start)
+                chunk = f.read(pos - start)
+                if pos == size and chunk.endswith(b"\n"):
+                    return
+                newline = chunk.rfind(b"\n")
+                if newline >= 0:
+                    f.truncate(start + newline + 1)
+                    return
+                pos = start
+            f.truncate(0)
+            return
+
+        if compression == "zstd":
+            _require_zstd()
+        size = f.seek(0, os.SEEK_END)
+        f.seek(0)
+        good_end = 0
+        pending = bytearray()
+        for data, end in _iter_members(f, compression):
+            pending += data
+            if end is not None:
+                good_end = end
+                pending = bytearray()
+        if good_end == size:
+            return
+
+        # Chỉ giữ các dòng đầy đủ của member dở
+        pending = bytes(pending[:pending.rfind(b"\n") + 1])
+        f.truncate(good_end)
+        if pending:
+            f.seek(good_end)
+            f.write(gzip.compress(pending) if compression == "gzip"
+                    else zstandard.ZstdCompressor().compress(pending))
+
+
+class ConversationLogWriter:
+    """
+    Ghi nối hội thoại vào file JSONL, mỗi message một dòng
+
+    Mỗi lần mở ghi thêm một dòng {"type": "session"} đánh dấu phiên mới,
+    sau đó mỗi append() chỉ ghi phần mới (O(1) mỗi lượt, không ghi lại cả
+    lịch sử). Với gzip / zstd, mỗi lượt được flush thành một khối nén hoàn
+    chỉnh nên file đọc được ngay cả khi process bị dừng giữa chừng; mỗi
+    lần mở là một gzip member / zstd frame mới nối vào cuối file, sau khi
+    đã sửa member dở do lần ghi trước bị dừng (xem _repair).
+    """
+
+    def __init__(self, path: str, compression: Optional[str] = "auto", **session_meta):
+        self.path = path
+        self.compression = detect_compression(path) if compression == "auto" else compression
+        if self.compression not in (None, "gzip", "zstd"):
+            raise ValueError(f"Kiểu nén không hỗ trợ: {self.compression}")
+        if self.compression == "zstd":
+            _require_zstd()
+
+        _repair(path, self.compression)
+        self._file = open(path, "ab")
+        if self.compression == "gzip":
+            self._stream: IO[bytes] = gzip.GzipFile(fileobj=self._file, mode="ab")
+        elif self.compression == "zstd":
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._file, closefd=False)
+        else:
+            self._stream = self._file
+        self.messages = 0
+        self._write({"type": "session", "started_at": time.time(), **session_meta})
+        self.flush()
+
+    def _write(self, record: Dict):
+        self._stream.write((dumps(record) + "\n").encode("utf-8"))
+
+    def append(self, message: Dict):
+        """Ghi một message ({"role", "content", ...}) và flush ngay"""
+        self._write(message)
+        self.messages += 1
+        self.flush()
+
+    def extend(self, messages: Iterable[Dict]):
+        """Ghi nhiều message, flush một lần"""
+        for message in messages:
+            self._write(message)
+            self.messages += 1
+        self.flush()
+
+    def flush(self):
+        if self.compression == "gzip":
+            self._stream.flush()  # Z_SYNC_FLUSH: dữ liệu đã ghi giải nén được ngay
+        elif self.compression == "zstd":
+            self._stream.flush(zstandard.FLUSH_BLOCK)
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self.compression == "zstd":
+            self._stream.flush(zstandard.FLUSH_FRAME)
+        elif self.compression == "gzip":
+            self._stream.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def _open_lines(path: str, compression: Optional[str]) -> Iterator[bytes]:
+    """
+    Các dòng (bytes) của file, giải nén theo từng khối
+
+    Dừng ở member hỏng / chưa kết thúc thay vì raise; dòng dở ở cuối một
+    member bị bỏ để không dính vào dòng đầu của member sau.
+    """
+    with open(path, "rb") as f:
+        if compression is None:
+            yield from f
+            return
+        if compression == "zstd":
+            _require_zstd()
+        buffer = b""
+        for data, end in _iter_members(f, compression):
+            lines = (buffer + data).split(b"\n")
+            buffer = lines.pop()
+            for line in lines:
+                yield line + b"\n"
+            if end is not None:
+                buffer = b""
+        if buffer:
+            yield buffer
+
+
+def iter_records(path: str, compression: Optional[str] = "auto") -> Iterator[Dict]:
+    """Mọi dòng của file log (kể cả dòng {"type": "session"}), đọc dần không nạp cả file"""
+    if compression == "auto":
+        compression = detect_compression(path)
+    for line in _open_lines(path, compression):
+        if not line.endswith(b"\n"):
+            # Dòng cuối bị cắt ngang
+            return
+        if line.strip():
+            yield loads(line)
+
+
+def iter_messages(path: str, compression: Optional[str] = "auto",
+                  last_session: bool = False) -> Iterator[Dict]:
+    """
+    Các message {"role", "content"} trong file log
+
+    Args:
+        last_session: Chỉ lấy phiên cuối cùng (phải đọc hết file một lượt trước)
+    """
+    if last_session:
+        start = 0
+        for number, record in enumerate(iter_records(path, compression)):
+            if record.get("type") == "session":
+                start = number
+        records = iter_records(path, compression)
+        for _ in range(start):
+            next(records)
+    else:
+        records = iter_records(path, compression)
+
+    for record in records:
+        if "role" in record and "content" in record:
+            yield {"role": record["role"], "content": record["content"]}
+
+
+def load_conversation(client, path: str, compression: Optional[str] = "auto",
+                      last_session: bool = False) -> int:
+    """Nạp hội thoại từ file log vào lịch sử của client (thay lịch sử cũ), trả về số message"""
+    client.clear_history()
+    client.conversation_history.extend(iter_messages(path, compression, last_session))
+    return len(client.conversation_history)
+
+
+def replay_conversation(client, path: str, scenario: str = "default",
+                        compression: Optional[str] = "auto",
+                        last_session: bool = False) -> Iterator[Dict]:
+    """
+    Gửi lại lần lượt các câu hỏi trong file log cho client (dùng lịch sử),
+    trả về từng lượt {"user", "original", "response"} để so sánh câu trả lời
+    """
+    pending_user: Optional[str] = None
+    for message in iter_messages(path, compression, last_session):
+        if message["role"] == "user":
+            if pending_user is not None:
+                yield _replay_turn(client, pending_user, None, scenario)
+            pending_user = message["content"]
+        elif message["role"] == "assistant" and pending_user is not None:
+            yield _replay_turn(client, pending_user, message["content"], scenario)
+            pending_user = None
+    if pending_user is not None:
+        yield _replay_turn(client, pending_user, None, scenario)
+
+
+def _replay_turn(client, user_message: str, original: Optional[str], scenario: str) -> Dict:
+    return {
+        "user": user_message,
+        "original": original,
+        "response": client.chat(user_message, scenario=scenario, use_history=True)
+    }
+
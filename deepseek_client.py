@@ -3,43 +3,736 @@
 
 import requests
 import json
-from typing import List, Dict, Optional
-from config import OLLAMA_URL, MODEL_NAME, SCENARIOS
+import time
+from contextlib import nullcontext
+from typing import Iterator, List, Dict, Optional, Tuple
+from config import (
+    MODEL_NAME,
+    SCENARIOS,
+    RESPONSE_CACHE_MAX_TEMPERATURE,
+    TEMPLATE_FASTPATH_ENABLED,
+    HISTORY_MAX_TURNS,
+    HISTORY_TOKEN_BUDGET,
+    CONVERSATION_MODE,
+)
+from history_window import estimate_tokens, message_tokens, window_start
+from http_transport import OllamaTransport, abort_response, get_transport
+from backend_pool import FAILOVER_STATUS, Backend, BackendPool, get_backend_pool
+from response_cache import ResponseCache, get_response_cache, make_cache_key
+from template_index import TemplateIndex, get_template_index
+from singleflight import SingleFlight, get_singleflight
+from scheduler import PRIORITY_INTERACTIVE, AdmissionController, get_scheduler
+from model_router import ModelRouter, get_model_router
+from errors import (
+    DeepSeekError,
+    IncompleteResponseError,
+    OverloadedError,
+    UpstreamConnectionError,
+    UpstreamError,
+    UpstreamTimeoutError,
+)
+from metrics import UpstreamTimer
+from chat_result import ChatResult
+from conversation_log import ConversationLogWriter, is_log_path, load_conversation
+from streaming import AbortHandle, iter_ndjson
 
-class DeepSeekClient:
-    """Client để tương tác với DeepSeek AI qua Ollama"""
+# Các trường thống kê Ollama trả về ở message cuối (thời gian tính bằng nano giây)
+OLLAMA_STAT_FIELDS = (
+    "total_duration",
+    "load_duration",
+    "prompt_eval_count",
+    "prompt_eval_duration",
+    "eval_count",
+    "eval_duration",
+)
+
+# Endpoint của Ollama (ghép với URL của backend được chọn)
+CHAT_PATH = "/api/chat"
+GENERATE_PATH = "/api/generate"
+
+
+class BaseDeepSeekClient:
+    """Phần dùng chung giữa client sync và async: kịch bản, messages, lịch sử"""
     
-    def __init__(self, model_name: str = MODEL_NAME):
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        cache: Optional[ResponseCache] = None,
+        templates: Optional[TemplateIndex] = None,
+        conversation_mode: str = CONVERSATION_MODE,
+        backends: Optional[BackendPool] = None,
+        router: Optional[ModelRouter] = None,
+        route_models: Optional[bool] = None
+    ):
+        if conversation_mode not in ("chat", "context"):
+            raise ValueError(f"conversation_mode không hợp lệ: {conversation_mode}")
         self.model_name = model_name
-        self.ollama_url = OLLAMA_URL
+        # Các Ollama backend dùng chung của process (OLLAMA_BACKENDS)
+        self.backends = backends or get_backend_pool()
+        # Chọn model theo kịch bản (model / fallback_model / latency_slo)
+        self.router = router if router is not None else get_model_router()
+        # None: chỉ định tuyến khi client dùng MODEL_NAME mặc định, model chọn
+        # riêng (model_name=...) luôn được giữ nguyên; True / False: luôn bật / tắt
+        self.route_models = route_models
+        # "chat": gửi lại cả lịch sử qua /api/chat mỗi lượt
+        # "context": dùng /api/generate và giữ mảng context token của Ollama
+        self.conversation_mode = conversation_mode
+        # Dùng cache chung của process nếu không truyền cache riêng
+        self.cache = cache if cache is not None else get_response_cache()
+        if templates is None and TEMPLATE_FASTPATH_ENABLED:
+            templates = get_template_index()
+        self.templates = templates
         self.conversation_history = []
+        # Số token ước lượng của từng message trong lịch sử, cập nhật dần
+        self._history_tokens: List[int] = []
+        # List lịch sử và message cuối đã được đếm: phát hiện lịch sử bị thay
+        # bằng list khác / message khác dù độ dài không giảm
+        self._history_counted: Optional[List[Dict]] = None
+        self._history_last: Optional[Dict] = None
+        # Trạng thái chế độ "context": token context, (kịch bản, model) và
+        # số message trong lịch sử mà context đang bao phủ
+        self._context: Optional[List[int]] = None
+        self._context_key: Optional[Tuple[str, str]] = None
+        self._context_len = 0
+        # File JSONL nhận từng lượt mới ngay khi có (log_conversation)
+        self._conversation_log: Optional[ConversationLogWriter] = None
+    
+    @property
+    def base_url(self) -> str:
+        """URL của backend đầu tiên (giữ tương thích, request thật đi qua BackendPool)"""
+        return self.backends.backends[0].url
+    
+    @property
+    def ollama_url(self) -> str:
+        """Endpoint /api/chat của backend đầu tiên (giữ tương thích với code cũ)"""
+        return f"{self.base_url}{CHAT_PATH}"
+    
+    @property
+    def generate_url(self) -> str:
+        """Endpoint /api/generate của backend đầu tiên (giữ tương thích với code cũ)"""
+        return f"{self.base_url}{GENERATE_PATH}"
+    
+    def _resolve_scenario(
+        self,
+        scenario: str,
+        temperature: Optional[float]
+    ) -> Tuple[str, float]:
+        """Lấy system prompt và temperature của kịch bản"""
+        if scenario not in SCENARIOS:
+            scenario = "default"
         
-    def check_connection(self) -> bool:
-        """Kiểm tra kết nối với Ollama"""
-        try:
-            response = requests.get("http://localhost:11434/api/tags")
-            return response.status_code == 200
-        except requests.exceptions.ConnectionError:
+        scenario_config = SCENARIOS[scenario]
+        system_prompt = scenario_config["system_prompt"]
+        temp = temperature if temperature is not None else scenario_config.get("temperature", 0.7)
+        return system_prompt, temp
+    
+    def _routing_enabled(self) -> bool:
+        routing = self.route_models
+        if routing is None:
+            routing = self.model_name == MODEL_NAME
+        return self.router is not None and routing
+    
+    def _requested_model(self, scenario: str) -> str:
+        """Model request dùng nếu không bị chuyển sang model dự phòng (chưa định tuyến)"""
+        if not self._routing_enabled():
+            return self.model_name
+        return self.router.preferred_model(scenario, self.model_name)
+    
+    def _select_model(self, scenario: str) -> str:
+        """Model cho request này: theo bộ định tuyến, hoặc model của client"""
+        if not self._routing_enabled():
+            return self.model_name
+        return self.router.route(scenario, self.model_name)
+    
+    def _route_payload(
+        self,
+        scenario: str,
+        payload: Dict,
+        cache_key: Optional[str]
+    ) -> Tuple[Optional[ChatResult], Optional[str]]:
+        """
+        Định tuyến sau khi không có câu trả lời local (câu mẫu / cache hit không
+        tính vào số liệu định tuyến và không kích hoạt health check)
+        
+        Model dự phòng có key cache riêng nên tra cache lại với key đó.
+        
+        Returns:
+            (kết quả nếu cache có câu trả lời của model dự phòng, key cache)
+        """
+        model = self._select_model(scenario)
+        if model == payload["model"]:
+            return None, cache_key
+        payload["model"] = model
+        return self._lookup_cache(scenario, payload)
+    
+    def _observe_latency(self, timer: UpstreamTimer):
+        """Báo độ trễ của request vừa xong cho bộ định tuyến model"""
+        if self.router is not None and timer.duration is not None:
+            self.router.observe(timer.model, timer.duration)
+    
+    def _history_token_counts(self) -> List[int]:
+        """Số token của từng message trong lịch sử (chỉ tính cho message mới)"""
+        history = self.conversation_history
+        counted = len(self._history_tokens)
+        if (history is not self._history_counted or counted > len(history)
+                or (counted and history[counted - 1] is not self._history_last)):
+            # Lịch sử bị thay thế / sửa từ bên ngoài: tính lại từ đầu
+            self._history_counted = history
+            self._history_tokens = []
+        for message in history[len(self._history_tokens):]:
+            self._history_tokens.append(message_tokens(message))
+        if history:
+            self._history_last = history[-1]
+        return self._history_tokens
+    
+    def _history_window(
+        self,
+        scenario: str,
+        system_prompt: str,
+        user_message: str
+    ) -> List[Dict]:
+        """
+        Phần lịch sử gửi kèm prompt theo chính sách của kịch bản
+        
+        Kịch bản có thể khai báo "history_max_turns" / "history_token_budget",
+        nếu không dùng HISTORY_MAX_TURNS / HISTORY_TOKEN_BUDGET trong config.
+        """
+        scenario_config = SCENARIOS.get(scenario, SCENARIOS["default"])
+        max_turns = scenario_config.get("history_max_turns", HISTORY_MAX_TURNS)
+        token_budget = scenario_config.get("history_token_budget", HISTORY_TOKEN_BUDGET)
+        
+        start = window_start(
+            self._history_token_counts(),
+            max_turns=max_turns,
+            token_budget=token_budget,
+            reserved_tokens=estimate_tokens(system_prompt) + estimate_tokens(user_message)
+        )
+        return self.conversation_history[start:]
+    
+    def _build_messages(
+        self,
+        user_message: str,
+        system_prompt: str,
+        use_history: bool,
+        scenario: str = "default"
+    ) -> List[Dict]:
+        """Tạo danh sách messages gửi lên Ollama"""
+        # Thêm system prompt
+        messages = [{
+            "role": "system",
+            "content": system_prompt
+        }]
+        
+        # Thêm các lượt gần nhất của lịch sử hội thoại nếu cần
+        if use_history:
+            messages.extend(self._history_window(scenario, system_prompt, user_message))
+        
+        # Thêm tin nhắn người dùng
+        messages.append({
+            "role": "user",
+            "content": user_message
+        })
+        return messages
+    
+    def _build_payload(
+        self,
+        messages: List[Dict],
+        temp: float,
+        stream: bool,
+        model: Optional[str] = None
+    ) -> Dict:
+        """Tạo body request cho /api/chat"""
+        payload = {
+            "model": model or self.model_name,
+            "messages": messages,
+            "stream": stream,
+            "options": {
+                "temperature": temp
+            }
+        }
+        return payload
+    
+    def _cache_key(self, scenario: str, payload: Dict) -> Optional[str]:
+        """
+        Key cache của request, None nếu request không được phép cache
+
+        Chỉ cache khi temperature thấp hoặc kịch bản khai báo "cacheable".
+        """
+        if self.cache is None:
+            return None
+        
+        scenario_config = SCENARIOS.get(scenario, SCENARIOS["default"])
+        options = payload["options"]
+        if not (scenario_config.get("cacheable")
+                or options["temperature"] <= RESPONSE_CACHE_MAX_TEMPERATURE):
+            return None
+        
+        messages = payload["messages"]
+        return make_cache_key(
+            payload["model"],
+            messages[0]["content"],
+            messages[1:],
+            options
+        )
+    
+    @staticmethod
+    def _typed_error(error: Exception) -> DeepSeekError:
+        """Chuyển exception bất kỳ thành lỗi có kiểu trong errors.py"""
+        if isinstance(error, DeepSeekError):
+            return error
+        return DeepSeekError(str(error))
+    
+    def _error_event(self, error: Exception) -> Dict:
+        """Sự kiện streaming báo lỗi"""
+        error = self._typed_error(error)
+        return {"type": "error", "error": f"Lỗi: {error}", "error_type": type(error).__name__}
+    
+    def _context_usable(self, scenario: str, model: Optional[str] = None) -> bool:
+        """
+        Có thể gửi lượt này qua /api/generate với context đã lưu không
+
+        Chỉ dùng khi context bao phủ đúng toàn bộ lịch sử hiện tại, cùng kịch
+        bản và model, và chưa vượt ngân sách token. Các trường hợp khác (lịch
+        sử nạp từ ngoài, câu trả lời từ câu mẫu/cache, đổi kịch bản...) quay
+        về chế độ "chat" với cửa sổ lịch sử thông thường.
+        """
+        if self.conversation_mode != "context":
             return False
+        if self._context is None:
+            return not self.conversation_history
+        
+        scenario_config = SCENARIOS.get(scenario, SCENARIOS["default"])
+        token_budget = scenario_config.get("history_token_budget", HISTORY_TOKEN_BUDGET)
+        return (
+            self._context_key == (scenario, model or self.model_name)
+            and self._context_len == len(self.conversation_history)
+            and (token_budget is None or len(self._context) <= token_budget)
+        )
+    
+    def _build_generate_payload(
+        self,
+        user_message: str,
+        system_prompt: str,
+        temp: float,
+        stream: bool,
+        model: Optional[str] = None
+    ) -> Dict:
+        """Tạo body request cho /api/generate (chế độ "context")"""
+        payload = {
+            "model": model or self.model_name,
+            "prompt": user_message,
+            "stream": stream,
+            "options": {
+                "temperature": temp
+            }
+        }
+        if self._context is not None:
+            # System prompt và các lượt trước đã nằm trong context
+            payload["context"] = self._context
+        else:
+            payload["system"] = system_prompt
+        return payload
+    
+    def _save_context(
+        self,
+        scenario: str,
+        context: Optional[List[int]],
+        model: Optional[str] = None
+    ):
+        """Lưu context trả về từ /api/generate sau khi đã ghi lượt chat vào lịch sử"""
+        self._context = context
+        self._context_key = (scenario, model or self.model_name) if context else None
+        self._context_len = len(self.conversation_history) if context else 0
+    
+    @staticmethod
+    def _ollama_stats(data: Dict) -> Dict:
+        """Lấy các số liệu thời gian / token Ollama trả về ở message cuối"""
+        return {key: data[key] for key in OLLAMA_STAT_FIELDS if key in data}
+    
+    @staticmethod
+    def _stream_chunk_content(data: Dict) -> str:
+        """Nội dung của một dòng NDJSON (từ /api/chat hoặc /api/generate)"""
+        if 'error' in data:
+            raise UpstreamError(data['error'])
+        if 'message' in data:
+            return data['message'].get('content', '')
+        return data.get('response', '')
+    
+    def _local_stream_events(
+        self,
+        user_message: str,
+        local: ChatResult,
+        use_history: bool
+    ) -> List[Dict]:
+        """Sự kiện streaming cho câu trả lời từ câu mẫu / cache"""
+        if use_history:
+            self._record_turn(user_message, local.content)
+        return [
+            {"type": "token", "content": local.content},
+            {
+                "type": "done",
+                "source": local.source,
+                "stats": {},
+                "usage": local.usage(),
+                "timings": local.timings()
+            }
+        ]
+    
+    def _finish_stream(
+        self,
+        user_message: str,
+        scenario: str,
+        model: str,
+        parts: List[str],
+        final: Optional[Dict],
+        cache_key: Optional[str],
+        use_history: bool,
+        use_context: bool
+    ) -> Dict:
+        """Kết thúc một lượt streaming: lưu cache, lịch sử và trả sự kiện cuối"""
+        if final is None:
+            return self._error_event(
+                IncompleteResponseError("Stream kết thúc trước khi hoàn tất")
+            )
+        
+        ai_response = "".join(parts)
+        # Chỉ cache / lưu lịch sử khi đã nhận đủ câu trả lời
+        if cache_key is not None:
+            self.cache.set(cache_key, ai_response)
+        if use_history:
+            self._record_turn(user_message, ai_response)
+            if use_context:
+                self._save_context(scenario, final.get('context'), model)
+        
+        result = ChatResult.from_ollama(ai_response, final, model=model)
+        return {
+            "type": "done",
+            "source": "model",
+            "model": model,
+            "stats": self._ollama_stats(final),
+            "usage": result.usage(),
+            "timings": result.timings()
+        }
+    
+    def _lookup_local(
+        self,
+        scenario: str,
+        user_message: str,
+        payload: Dict
+    ) -> Tuple[Optional[ChatResult], Optional[str]]:
+        """
+        Tìm câu trả lời không cần gọi model: câu mẫu trước, sau đó tới cache
+        
+        Returns:
+            (kết quả nếu tìm thấy, key cache của request)
+        """
+        if self.templates is not None:
+            match = self.templates.match(scenario, user_message)
+            if match is not None:
+                return ChatResult(
+                    match.answer, "template", template_score=round(match.score, 3)
+                ), None
+        
+        return self._lookup_cache(scenario, payload)
+    
+    def _lookup_cache(
+        self,
+        scenario: str,
+        payload: Dict
+    ) -> Tuple[Optional[ChatResult], Optional[str]]:
+        """Tìm câu trả lời đã cache của request (theo model trong payload)"""
+        cache_key = self._cache_key(scenario, payload)
+        if cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return ChatResult(cached, "cache"), cache_key
+        return None, cache_key
+    
+    def _record_turn(self, user_message: str, ai_response: str):
+        """Lưu một lượt hỏi - đáp vào lịch sử"""
+        turn = [
+            {"role": "user", "content": user_message},
+            {"role": "assistant", "content": ai_response}
+        ]
+        self.conversation_history.extend(turn)
+        if self._conversation_log is not None:
+            self._conversation_log.extend(turn)
+    
+    def clear_history(self):
+        """Xóa lịch sử hội thoại"""
+        self.conversation_history = []
+        self._history_tokens = []
+        self._save_context("", None)
+    
+    def get_history(self) -> List[Dict]:
+        """Lấy lịch sử hội thoại"""
+        return self.conversation_history
+    
+    def export_conversation(self, filename: str = "conversation.json"):
+        """
+        Xuất hội thoại ra file
+
+        - .json: ghi lại cả lịch sử thành một mảng JSON (như trước)
+        - .jsonl / .jsonl.gz / .jsonl.zst: ghi lịch sử hiện có một lần, các
+          lượt sau tự ghi nối vào file (gọi lại với cùng file không ghi lại gì)
+        """
+        if is_log_path(filename):
+            if self._conversation_log is None or self._conversation_log.path != filename:
+                self.log_conversation(filename)
+            return filename
+        with open(filename, 'w', encoding='utf-8') as f:
+            json.dump(self.conversation_history, f, ensure_ascii=False, indent=2)
+        return filename
+
+    def log_conversation(self, filename: str, compression: Optional[str] = "auto") -> ConversationLogWriter:
+        """
+        Ghi nối hội thoại vào file JSONL (nén theo đuôi .gz / .zst): lịch sử
+        hiện có được ghi ngay, mỗi lượt sau được ghi khi vừa xong
+        """
+        self.close_conversation_log()
+        writer = ConversationLogWriter(filename, compression, model=self.model_name)
+        writer.extend(self.conversation_history)
+        self._conversation_log = writer
+        return writer
+
+    def close_conversation_log(self):
+        """Dừng ghi nối hội thoại và đóng file"""
+        if self._conversation_log is not None:
+            self._conversation_log.close()
+            self._conversation_log = None
+
+    def import_conversation(self, filename: str, last_session: bool = False) -> int:
+        """
+        Nạp lịch sử từ file .json (export cũ) hoặc file JSONL (đọc dần từng
+        dòng), trả về số message
+        """
+        if is_log_path(filename):
+            return load_conversation(self, filename, last_session=last_session)
+        with open(filename, encoding='utf-8') as f:
+            messages = json.load(f)
+        self.clear_history()
+        self.conversation_history.extend(messages)
+        return len(self.conversation_history)
+
+
+class DeepSeekClient(BaseDeepSeekClient):
+    """Client để tương tác với DeepSeek AI qua Ollama"""
+    
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        transport: Optional[OllamaTransport] = None,
+        cache: Optional[ResponseCache] = None,
+        templates: Optional[TemplateIndex] = None,
+        conversation_mode: str = CONVERSATION_MODE,
+        singleflight: Optional[SingleFlight] = None,
+        scheduler: Optional[AdmissionController] = None,
+        backends: Optional[BackendPool] = None,
+        router: Optional[ModelRouter] = None,
+        route_models: Optional[bool] = None
+    ):
+        super().__init__(
+            model_name, cache, templates, conversation_mode, backends, router, route_models
+        )
+        # Dùng chung connection pool của process nếu không truyền transport riêng
+        self.transport = transport or get_transport()
+        # Gộp các request xác định giống hệt nhau đang chạy đồng thời
+        self.singleflight = singleflight if singleflight is not None else get_singleflight()
+        # Giới hạn số request đồng thời tới Ollama (dùng chung trong process)
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
+        
+    def check_connection(self) -> bool:
+        """Kiểm tra kết nối với Ollama (ít nhất một backend trả lời)"""
+        return self.backends.check_health() > 0
     
     def list_models(self) -> List[str]:
-        """Lấy danh sách models đã cài"""
-        try:
-            response = requests.get("http://localhost:11434/api/tags")
-            if response.status_code == 200:
-                models = response.json().get('models', [])
-                return [model['name'] for model in models]
-            return []
-        except Exception as e:
-            print(f"Lỗi khi lấy danh sách models: {e}")
-            return []
+        """Lấy danh sách models đã cài trên các backend"""
+        self.backends.check_health()
+        return self.backends.models()
+    
+    @staticmethod
+    def _typed_error(error: Exception) -> DeepSeekError:
+        """Chuyển exception của requests thành lỗi có kiểu trong errors.py"""
+        if isinstance(error, DeepSeekError):
+            return error
+        if isinstance(error, (requests.exceptions.Timeout, TimeoutError)):
+            return UpstreamTimeoutError("Timeout - AI mất quá nhiều thời gian để phản hồi")
+        if isinstance(error, requests.exceptions.ConnectionError):
+            return UpstreamConnectionError(
+                "Không thể kết nối với Ollama. Bạn đã chạy 'ollama serve' chưa?"
+            )
+        if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+            return UpstreamError(str(error), status_code=error.response.status_code)
+        return DeepSeekError(str(error))
+    
+    def _slot(self, priority: int):
+        """Chờ tới lượt gọi Ollama (raise OverloadedError khi quá tải)"""
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(priority)
+    
+    def _open(
+        self,
+        path: str,
+        body: Dict,
+        timeout: Optional[float] = None,
+        stream: bool = False
+    ) -> Tuple[Optional[Backend], requests.Response]:
+        """
+        Gửi request tới backend ít việc nhất có model, chuyển sang backend khác
+        nếu lỗi trước khi nhận được phản hồi (chưa có byte nào được stream)
+        
+        Returns:
+            (backend, response) - gọi self.backends.release(backend) khi xong;
+            backend là None nếu đã thử hết backend (response là lỗi cuối cùng)
+        """
+        model = body['model']
+        tried: List[Backend] = []
+        while True:
+            backend = self.backends.acquire(model, exclude=tried)
+            tried.append(backend)
+            try:
+                response = self.transport.post(
+                    f"{backend.url}{path}", json=body, timeout=timeout, stream=stream
+                )
+            except requests.exceptions.ConnectionError as e:
+                self.backends.release(backend, error=e)
+                if not self.backends.has_alternative(model, tried):
+                    raise
+                self.backends.record_failover()
+                continue
+            except BaseException as e:
+                self.backends.release(backend, error=e)
+                raise
+            
+            retry = False
+            if response.status_code in FAILOVER_STATUS:
+                retry = True
+                self.backends.release(backend, error=UpstreamError(
+                    f"HTTP {response.status_code}", status_code=response.status_code
+                ))
+            elif response.status_code == 404 and 'not found' in response.text:
+                # Backend chưa có model này
+                retry = True
+                self.backends.mark_missing_model(backend, model)
+                self.backends.release(backend)
+            
+            if retry:
+                if self.backends.has_alternative(model, tried):
+                    response.close()
+                    self.backends.record_failover()
+                    continue
+                # Không còn backend nào khác: trả về lỗi này, backend đã được release
+                return None, response
+            return backend, response
+    
+    def _call_model(
+        self,
+        path: str,
+        body: Dict,
+        timeout: Optional[float],
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> Dict:
+        """Gửi request không streaming tới Ollama, trả về JSON kết quả"""
+        with self._slot(priority):
+            timer = UpstreamTimer(body['model'])
+            backend = None
+            error = None
+            try:
+                backend, response = self._open(path, body, timeout)
+                if response.status_code != 200:
+                    raise UpstreamError(
+                        f"{response.status_code} - {response.text}",
+                        status_code=response.status_code
+                    )
+                result = response.json()
+            except BaseException as e:
+                error = e
+                timer.fail()
+                raise
+            finally:
+                if backend is not None:
+                    self.backends.release(backend, error=self._backend_error(error))
+            timer.finish(result)
+            self._observe_latency(timer)
+            return result
+    
+    @staticmethod
+    def _backend_error(error: Optional[BaseException]) -> Optional[BaseException]:
+        """Lỗi do backend (tính vào việc loại backend), bỏ qua lỗi của request"""
+        if isinstance(error, UpstreamError) and error.status_code is not None \
+                and error.status_code < 500:
+            return None
+        return error
+    
+    def _iter_model_stream(
+        self,
+        path: str,
+        body: Dict,
+        priority: int = PRIORITY_INTERACTIVE,
+        abort: Optional[AbortHandle] = None
+    ) -> Iterator[Dict]:
+        """
+        Đọc stream NDJSON từ Ollama (đóng generator sẽ đóng luôn kết nối)
+
+        abort: thread khác gọi abort.abort() để cắt kết nối ngay cả khi
+        generator đang chờ chunk tiếp theo
+        """
+        # Giữ lượt chạy cho tới khi stream kết thúc hoặc bị đóng
+        with self._slot(priority):
+            timer = UpstreamTimer(body['model'])
+            backend = None
+            error = None
+            cancel = None
+            try:
+                if abort is not None and abort.aborted:
+                    return
+                backend, response = self._open(path, body, stream=True)
+                if abort is not None:
+                    cancel = lambda: abort_response(response)
+                    abort.add(cancel)
+                with response:
+                    if response.status_code != 200:
+                        raise UpstreamError(
+                            f"{response.status_code} - {response.text}",
+                            status_code=response.status_code
+                        )
+                    # chunk_size=None: nhận từng chunk ngay khi Ollama gửi
+                    for data in iter_ndjson(response.iter_content(chunk_size=None)):
+                        if data.get('done'):
+                            timer.finish(data)
+                            self._observe_latency(timer)
+                            yield data
+                            return
+                        timer.first_token()
+                        yield data
+            except GeneratorExit:
+                timer.fail("cancelled")
+                raise
+            except BaseException as e:
+                if abort is not None and abort.aborted:
+                    # Lỗi đọc do chính mình cắt kết nối, không phải lỗi của backend
+                    timer.fail("cancelled")
+                else:
+                    error = e
+                    timer.fail()
+                raise
+            finally:
+                if cancel is not None:
+                    abort.remove(cancel)
+                # Stream kết thúc mà không có message cuối
+                timer.fail()
+                if backend is not None:
+                    self.backends.release(backend, error=self._backend_error(error))
     
     def chat(
         self, 
         user_message: str, 
         scenario: str = "default",
         use_history: bool = False,
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
+        priority: int = PRIORITY_INTERACTIVE
     ) -> str:
         """
         Gửi tin nhắn và nhận phản hồi
@@ -49,135 +742,211 @@ class DeepSeekClient:
             scenario: Kịch bản sử dụng (từ SCENARIOS)
             use_history: Có sử dụng lịch sử chat không
             temperature: Độ sáng tạo (0.0-1.0), None = dùng mặc định
+            timeout: Timeout (giây) cho request, None = dùng mặc định của transport
+            priority: Mức ưu tiên khi phải xếp hàng (PRIORITY_INTERACTIVE / PRIORITY_BATCH)
             
         Returns:
             Câu trả lời từ AI
+            
+        Raises:
+            OverloadedError: Hàng đợi đầy hoặc chờ quá lâu
         """
-        if scenario not in SCENARIOS:
-            scenario = "default"
-        
-        scenario_config = SCENARIOS[scenario]
-        system_prompt = scenario_config["system_prompt"]
-        temp = temperature if temperature is not None else scenario_config.get("temperature", 0.7)
-        
-        # Tạo messages
-        messages = []
+        return self.chat_detailed(
+            user_message,
+            scenario=scenario,
+            use_history=use_history,
+            temperature=temperature,
+            timeout=timeout,
+            priority=priority
+        ).response
+    
+    def chat_detailed(
+        self,
+        user_message: str,
+        scenario: str = "default",
+        use_history: bool = False,
+        temperature: Optional[float] = None,
+        timeout: Optional[float] = None,
+        priority: int = PRIORITY_INTERACTIVE
+    ) -> ChatResult:
+        """
+        Giống chat() nhưng trả về ChatResult: nội dung, nguồn (câu mẫu / cache /
+        model), số token, thời gian từng pha và lỗi có kiểu thay vì chuỗi "Lỗi: ..."
         
-        # Thêm system prompt
-        messages.append({
-            "role": "system",
-            "content": system_prompt
-        })
+        Raises:
+            OverloadedError: Hàng đợi đầy hoặc chờ quá lâu
+        """
+        start = time.perf_counter()
+        system_prompt, temp = self._resolve_scenario(scenario, temperature)
+        messages = self._build_messages(user_message, system_prompt, use_history, scenario)
+        payload = self._build_payload(
+            messages, temp, stream=False, model=self._requested_model(scenario)
+        )
         
-        # Thêm lịch sử hội thoại nếu cần
-        if use_history:
-            messages.extend(self.conversation_history)
+        # Trả lời từ câu mẫu hoặc cache nếu có, chỉ định tuyến model khi phải gọi model
+        local, cache_key = self._lookup_local(scenario, user_message, payload)
+        if local is None:
+            local, cache_key = self._route_payload(scenario, payload, cache_key)
+        model = payload["model"]
+        if local is not None:
+            if use_history:
+                self._record_turn(user_message, local.content)
+            local.elapsed = time.perf_counter() - start
+            return local
         
-        # Thêm tin nhắn người dùng
-        messages.append({
-            "role": "user",
-            "content": user_message
-        })
+        use_context = use_history and self._context_usable(scenario, model)
         
         try:
             # Gửi request
-            payload = {
-                "model": self.model_name,
-                "messages": messages,
-                "stream": False,
-                "options": {
-                    "temperature": temp
-                }
-            }
+            coalesced = False
+            if use_context:
+                result = self._call_model(
+                    GENERATE_PATH,
+                    self._build_generate_payload(
+                        user_message, system_prompt, temp, stream=False, model=model
+                    ),
+                    timeout,
+                    priority
+                )
+                ai_response = result['response']
+            else:
+                if cache_key is not None and self.singleflight is not None:
+                    # Request xác định: dùng chung kết quả với request giống hệt đang chạy
+                    result, coalesced = self.singleflight.do(
+                        cache_key,
+                        lambda: self._call_model(CHAT_PATH, payload, timeout, priority),
+                        timeout
+                    )
+                else:
+                    result = self._call_model(CHAT_PATH, payload, timeout, priority)
+                ai_response = result['message']['content']
             
-            response = requests.post(self.ollama_url, json=payload, timeout=60)
+            if cache_key is not None:
+                self.cache.set(cache_key, ai_response)
             
-            if response.status_code == 200:
-                result = response.json()
-                ai_response = result['message']['content']
-                
-                # Lưu vào lịch sử
-                if use_history:
-                    self.conversation_history.append({
-                        "role": "user",
-                        "content": user_message
-                    })
-                    self.conversation_history.append({
-                        "role": "assistant",
-                        "content": ai_response
-                    })
-                
-                return ai_response
-            else:
-                return f"Lỗi: {response.status_code} - {response.text}"
+            # Lưu vào lịch sử
+            if use_history:
+                self._record_turn(user_message, ai_response)
+                if use_context:
+                    self._save_context(scenario, result.get('context'), model)
+            
+            return ChatResult.from_ollama(
+                ai_response,
+                result,
+                model=model,
+                coalesced=coalesced,
+                elapsed=time.perf_counter() - start
+            )
                 
-        except requests.exceptions.Timeout:
-            return "Lỗi: Timeout - AI mất quá nhiều thời gian để phản hồi"
-        except requests.exceptions.ConnectionError:
-            return "Lỗi: Không thể kết nối với Ollama. Bạn đã chạy 'ollama serve' chưa?"
+        except OverloadedError:
+            # Để API server trả 429/503 kèm Retry-After
+            raise
         except Exception as e:
-            return f"Lỗi: {str(e)}"
+            return ChatResult.failure(
+                self._typed_error(e),
+                model=model,
+                elapsed=time.perf_counter() - start
+            )
     
     def chat_stream(
         self,
         user_message: str,
         scenario: str = "default",
-        temperature: Optional[float] = None
+        temperature: Optional[float] = None,
+        use_history: bool = False,
+        priority: int = PRIORITY_INTERACTIVE
     ):
         """
         Chat với streaming response (trả về từng phần)
         """
-        if scenario not in SCENARIOS:
-            scenario = "default"
+        for event in self.chat_stream_events(
+            user_message, scenario, temperature, use_history, priority
+        ):
+            if event["type"] == "token":
+                yield event["content"]
+            elif event["type"] == "error":
+                yield event["error"]
+    
+    def chat_stream_events(
+        self,
+        user_message: str,
+        scenario: str = "default",
+        temperature: Optional[float] = None,
+        use_history: bool = False,
+        priority: int = PRIORITY_INTERACTIVE,
+        abort: Optional[AbortHandle] = None
+    ):
+        """
+        Chat streaming dạng sự kiện
         
-        scenario_config = SCENARIOS[scenario]
-        system_prompt = scenario_config["system_prompt"]
-        temp = temperature if temperature is not None else scenario_config.get("temperature", 0.7)
+        Yields:
+            {"type": "token", "content": str}
+            {"type": "done", "source": str, "stats": {...}} - sự kiện cuối khi thành công
+            {"type": "error", "error": str}
         
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_message}
-        ]
+        Đóng generator giữa chừng (ví dụ client ngắt kết nối) sẽ đóng luôn
+        request tới Ollama để model dừng sinh token; nếu generator đang được
+        thread khác đọc (coalesce_events), gọi abort.abort() để cắt request
+        ngay. Khi quá tải, OverloadedError được raise trước sự kiện đầu tiên.
+        """
+        system_prompt, temp = self._resolve_scenario(scenario, temperature)
+        messages = self._build_messages(user_message, system_prompt, use_history, scenario)
+        payload = self._build_payload(
+            messages, temp, stream=True, model=self._requested_model(scenario)
+        )
         
-        try:
-            payload = {
-                "model": self.model_name,
-                "messages": messages,
-                "stream": True,
-                "options": {
-                    "temperature": temp
-                }
-            }
-            
-            response = requests.post(
-                self.ollama_url, 
-                json=payload, 
-                stream=True,
-                timeout=60
+        # Phát lại câu mẫu / câu trả lời đã cache như một chunk duy nhất
+        local, cache_key = self._lookup_local(scenario, user_message, payload)
+        if local is None:
+            local, cache_key = self._route_payload(scenario, payload, cache_key)
+        model = payload["model"]
+        if local is not None:
+            for event in self._local_stream_events(user_message, local, use_history):
+                yield event
+            return
+        
+        use_context = use_history and self._context_usable(scenario, model)
+        if use_context:
+            path = GENERATE_PATH
+            body = self._build_generate_payload(
+                user_message, system_prompt, temp, stream=True, model=model
             )
-            
-            for line in response.iter_lines():
-                if line:
-                    data = json.loads(line)
-                    if 'message' in data:
-                        yield data['message']['content']
-                        
+        else:
+            path = CHAT_PATH
+            body = payload
+        
+        if not use_context and cache_key is not None and self.singleflight is not None:
+            # Request xác định: nghe chung stream với request giống hệt đang chạy
+            upstream = self.singleflight.stream(
+                cache_key,
+                lambda source_abort: self._iter_model_stream(path, body, priority, source_abort),
+                abort
+            )
+        else:
+            upstream = self._iter_model_stream(path, body, priority, abort)
+        
+        parts = []
+        final = None
+        try:
+            for data in upstream:
+                content = self._stream_chunk_content(data)
+                if content:
+                    parts.append(content)
+                    yield {"type": "token", "content": content}
+                if data.get('done'):
+                    final = data
+                    break
+        except OverloadedError:
+            raise
         except Exception as e:
-            yield f"Lỗi: {str(e)}"
-    
-    def clear_history(self):
-        """Xóa lịch sử hội thoại"""
-        self.conversation_history = []
-    
-    def get_history(self) -> List[Dict]:
-        """Lấy lịch sử hội thoại"""
-        return self.conversation_history
-    
-    def export_conversation(self, filename: str = "conversation.json"):
-        """Xuất hội thoại ra file JSON"""
-        with open(filename, 'w', encoding='utf-8') as f:
-            json.dump(self.conversation_history, f, ensure_ascii=False, indent=2)
-        return filename
+            yield self._error_event(e)
+            return
+        finally:
+            upstream.close()
+        
+        yield self._finish_stream(
+            user_message, scenario, model, parts, final, cache_key, use_history, use_context
+        )
 
 
 class ScenarioManager:
@@ -204,13 +973,15 @@ class ScenarioManager:
         key: str,
         name: str,
         system_prompt: str,
-        temperature: float = 0.7
+        temperature: float = 0.7,
+        cacheable: bool = False
     ):
         """Thêm kịch bản mới"""
         SCENARIOS[key] = {
             "name": name,
             "system_prompt": system_prompt,
-            "temperature": temperature
+            "temperature": temperature,
+            "cacheable": cacheable
         }
 
 
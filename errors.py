@@ -0,0 +1,60 @@
+# errors.py
+# Các exception của DeepSeek client / API server
+
+
+class DeepSeekError(Exception):
+    """Lỗi chung khi làm việc với DeepSeek qua Ollama"""
+
+    # Mã HTTP API server trả về cho loại lỗi này
+    http_status = 500
+
+
+class UpstreamError(DeepSeekError):
+    """Ollama trả lỗi (HTTP khác 200 hoặc message lỗi trong stream)"""
+
+    http_status = 502
+
+    def __init__(self, message: str, status_code: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class UpstreamTimeoutError(UpstreamError):
+    """Ollama không trả lời kịp trong thời gian timeout"""
+
+    http_status = 504
+
+
+class UpstreamConnectionError(UpstreamError):
+    """Không kết nối được tới Ollama"""
+
+    http_status = 503
+
+
+class NoBackendAvailableError(UpstreamConnectionError):
+    """Đã thử hết các Ollama backend mà không backend nào nhận request"""
+
+
+class IncompleteResponseError(UpstreamError):
+    """Stream kết thúc trước khi Ollama gửi message cuối"""
+
+
+class OverloadedError(DeepSeekError):
+    """Backend đang quá tải, request không được nhận xử lý"""
+
+    http_status = 503
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        # Số giây client nên chờ trước khi thử lại (header Retry-After)
+        self.retry_after = retry_after
+
+
+class QueueFullError(OverloadedError):
+    """Hàng đợi đã đầy, request bị từ chối ngay (HTTP 429)"""
+
+    http_status = 429
+
+
+class QueueTimeoutError(OverloadedError):
+    """Chờ trong hàng đợi quá lâu (HTTP 503)"""
@@ -3,6 +3,7 @@
 
 from deepseek_client import DeepSeekClient, ScenarioManager
 from config import SCENARIOS
+from conversation_log import iter_messages
 import json
 
 def example_basic_chat():
@@ -227,16 +228,23 @@ def example_conversation_export():
         response = client.chat(msg, use_history=True)
         print(f"🤖 {response}\n")
     
-    # Export
-    filename = "conversation_export.json"
+    # Export: file JSONL, các lượt chat sau tự ghi nối (đuôi .jsonl.gz / .jsonl.zst để nén)
+    filename = "conversation_export.jsonl"
     client.export_conversation(filename)
     print(f"✅ Đã lưu cuộc hội thoại vào: {filename}")
     
-    # Đọc và hiển thị
-    with open(filename, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-        print(f"\n📄 Nội dung file ({len(data)} tin nhắn):")
-        print(json.dumps(data, ensure_ascii=False, indent=2)[:500] + "...")
+    response = client.chat("Cảm ơn bạn!", use_history=True)
+    print(f"👤 Cảm ơn bạn!\n🤖 {response}\n")
+    client.close_conversation_log()
+    
+    # Đọc dần từng dòng (không nạp cả file) và nạp lại vào client mới
+    print("\n📄 Nội dung file:")
+    for message in iter_messages(filename, last_session=True):
+        print(f"   [{message['role']}] {message['content'][:80]}")
+    
+    new_client = DeepSeekClient()
+    count = new_client.import_conversation(filename, last_session=True)
+    print(f"\n✅ Client mới đã nạp {count} tin nhắn, có thể chat tiếp với use_history=True")
 
 
 def example_batch_processing():
@@ -273,6 +281,8 @@ def example_batch_processing():
         json.dump(results, f, ensure_ascii=False, indent=2)
     
     print("✅ Đã lưu kết quả vào: faq_answers.json")
+    print("💡 Danh sách lớn: python cli.py bulk faq.jsonl -o faq_answers.jsonl "
+          "--scenario customer_support (song song, chạy tiếp được khi bị dừng)")
 
 
 def run_all_examples():
@@ -0,0 +1,58 @@
+# history_window.py
+# Chọn cửa sổ lịch sử hội thoại gửi lên model (giới hạn số lượt / số token)
+
+from typing import Dict, List, Optional
+
+# Ước lượng thô: tokenizer của DeepSeek tách tiếng Việt khoảng 3 ký tự / token,
+# cộng thêm vài token định dạng cho mỗi message (role, phân cách...)
+_CHARS_PER_TOKEN = 3
+_MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token của một đoạn text (không cần tokenizer)"""
+    return len(text) // _CHARS_PER_TOKEN + 1
+
+
+def message_tokens(message: Dict) -> int:
+    """Ước lượng số token của một message trong prompt"""
+    return estimate_tokens(message["content"]) + _MESSAGE_OVERHEAD
+
+
+def window_start(
+    token_counts: List[int],
+    max_turns: Optional[int] = None,
+    token_budget: Optional[int] = None,
+    reserved_tokens: int = 0
+) -> int:
+    """
+    Vị trí bắt đầu của cửa sổ lịch sử được giữ lại
+
+    Lịch sử gồm các cặp (user, assistant). Giữ các cặp mới nhất cho tới khi
+    đạt max_turns hoặc tổng token (kể cả reserved_tokens cho system prompt
+    và câu hỏi hiện tại) vượt token_budget.
+
+    Args:
+        token_counts: Số token của từng message trong lịch sử
+        max_turns: Số lượt hỏi - đáp tối đa, None = không giới hạn
+        token_budget: Tổng token tối đa của prompt, None = không giới hạn
+        reserved_tokens: Số token luôn được giữ (system prompt + câu hỏi mới)
+
+    Returns:
+        Chỉ số message đầu tiên được giữ (len(token_counts) = bỏ hết lịch sử)
+    """
+    start = len(token_counts)
+    used = reserved_tokens
+    turns = 0
+
+    while start >= 2:
+        if max_turns is not None and turns >= max_turns:
+            break
+        cost = token_counts[start - 2] + token_counts[start - 1]
+        if token_budget is not None and used + cost > token_budget:
+            break
+        used += cost
+        turns += 1
+        start -= 2
+
+    return start
@@ -0,0 +1,143 @@
+# http_transport.py
+# Transport HTTP dùng chung: connection pool keep-alive cho mọi client trong process
+
+import threading
+from typing import Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import (
+    OLLAMA_POOL_CONNECTIONS,
+    OLLAMA_POOL_MAXSIZE,
+    OLLAMA_POOL_BLOCK,
+    OLLAMA_CONNECT_TIMEOUT,
+    OLLAMA_READ_TIMEOUT,
+)
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class OllamaTransport:
+    """
+    Transport HTTP an toàn đa luồng với connection pool có giới hạn
+
+    Mỗi thread dùng một requests.Session riêng (cookie/header không bị
+    tranh chấp), nhưng tất cả cùng mount chung một HTTPAdapter nên kết nối
+    TCP tới Ollama được giữ keep-alive và tái sử dụng giữa các request.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = OLLAMA_POOL_CONNECTIONS,
+        pool_maxsize: int = OLLAMA_POOL_MAXSIZE,
+        pool_block: bool = OLLAMA_POOL_BLOCK,
+        connect_timeout: float = OLLAMA_CONNECT_TIMEOUT,
+        read_timeout: float = OLLAMA_READ_TIMEOUT
+    ):
+        self.pool_maxsize = pool_maxsize
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self._adapter = HTTPAdapter(
+            pool_connections=pool_connections,
+            pool_maxsize=pool_maxsize,
+            pool_block=pool_block,
+            max_retries=0
+        )
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._request_count = 0
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        """Timeout mặc định (connect, read)"""
+        return (self.connect_timeout, self.read_timeout)
+
+    def _session(self) -> requests.Session:
+        """Lấy Session của thread hiện tại (tạo mới nếu chưa có)"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            session.mount('http://', self._adapter)
+            session.mount('https://', self._adapter)
+            self._local.session = session
+        return session
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        timeout: Optional[Timeout] = None,
+        **kwargs
+    ) -> requests.Response:
+        """Gửi request qua pool dùng chung"""
+        with self._lock:
+            self._request_count += 1
+        return self._session().request(
+            method,
+            url,
+            timeout=timeout if timeout is not None else self.timeout,
+            **kwargs
+        )
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def stats(self) -> Dict:
+        """Thống kê pool: số request, số kết nối mới, số lần tái sử dụng"""
+        connections = 0
+        pool_requests = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            connections += pool.num_connections
+            pool_requests += pool.num_requests
+
+        return {
+            'requests': self._request_count,
+            'connections_opened': connections,
+            'connections_reused': max(pool_requests - connections, 0),
+            'hosts': len(pools),
+            'pool_maxsize': self.pool_maxsize
+        }
+
+    def close(self):
+        """Đóng toàn bộ kết nối trong pool"""
+        self._adapter.close()
+
+
+def abort_response(response: requests.Response):
+    """
+    Cắt ngang response streaming đang được thread khác đọc
+
+    shutdown() socket (urllib3 >= 2.3) làm lần đọc đang chờ trả lỗi ngay;
+    bản urllib3 cũ hơn chỉ đóng được response. Kết nối bị bỏ, không trả về pool.
+    """
+    shutdown = getattr(response.raw, 'shutdown', None)
+    try:
+        if shutdown is not None:
+            shutdown()
+        else:
+            response.close()
+    except (OSError, RuntimeError, ValueError):
+        # Response đã đọc xong / kết nối đã trả về pool
+        pass
+
+
+_transport: Optional[OllamaTransport] = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> OllamaTransport:
+    """Lấy transport dùng chung của process (khởi tạo lần đầu)"""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = OllamaTransport()
+    return _transport
@@ -0,0 +1,524 @@
+# jobs.py
+# Job batch chạy nền: nhận batch ngay, worker xử lý dần, trạng thái + kết quả lưu trong SQLite
+
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import (
+    BATCH_MAX_IN_FLIGHT,
+    BATCH_ITEM_TIMEOUT,
+    JOBS_ENABLED,
+    JOBS_DB_PATH,
+    JOBS_MAX_RUNNING,
+    JOBS_MAX_ITEMS,
+    JOBS_STALE_AFTER,
+    JOBS_POLL_INTERVAL,
+)
+from batch_executor import BatchExecutor
+from deepseek_client import DeepSeekClient
+from errors import OverloadedError
+from scheduler import PRIORITY_BATCH
+from streaming import dumps, loads
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id          TEXT PRIMARY KEY,
+    status          TEXT NOT NULL,
+    scenario        TEXT NOT NULL,
+    temperature     REAL,
+    max_concurrency INTEGER NOT NULL,
+    item_timeout    REAL NOT NULL,
+    total           INTEGER NOT NULL,
+    completed       INTEGER NOT NULL DEFAULT 0,
+    succeeded       INTEGER NOT NULL DEFAULT 0,
+    failed          INTEGER NOT NULL DEFAULT 0,
+    timed_out       INTEGER NOT NULL DEFAULT 0,
+    created_at      REAL NOT NULL,
+    started_at      REAL,
+    finished_at     REAL,
+    heartbeat       REAL,
+    owner           TEXT,
+    error           TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_items (
+    job_id  TEXT NOT NULL,
+    idx     INTEGER NOT NULL,
+    message TEXT NOT NULL,
+    status  TEXT NOT NULL DEFAULT 'pending',
+    result  TEXT,
+    seq     INTEGER,
+    PRIMARY KEY (job_id, idx)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_job_items_seq ON job_items (job_id, seq);
+"""
+
+_JOB_COLUMNS = (
+    "job_id, status, scenario, temperature, max_concurrency, item_timeout, total, "
+    "completed, succeeded, failed, timed_out, created_at, started_at, finished_at, error"
+)
+_INSERT_JOB = (
+    "INSERT INTO jobs (job_id, status, scenario, temperature, max_concurrency, item_timeout, "
+    "total, created_at) VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)"
+)
+_INSERT_ITEM = "INSERT INTO job_items (job_id, idx, message) VALUES (?, ?, ?)"
+_SELECT_JOB = f"SELECT {_JOB_COLUMNS} FROM jobs WHERE job_id = ?"
+_SELECT_JOBS = f"SELECT {_JOB_COLUMNS} FROM jobs ORDER BY created_at DESC LIMIT ?"
+_SELECT_CLAIMABLE = (
+    "SELECT job_id FROM jobs WHERE status = 'queued' "
+    "OR (status = 'running' AND heartbeat < ?) ORDER BY created_at LIMIT 1"
+)
+_CLAIM_JOB = (
+    "UPDATE jobs SET status = 'running', owner = ?, heartbeat = ?, "
+    "started_at = COALESCE(started_at, ?) WHERE job_id = ?"
+)
+_HEARTBEAT = "UPDATE jobs SET heartbeat = ? WHERE job_id = ? AND owner = ? AND status = 'running'"
+_SELECT_STATUS = "SELECT status FROM jobs WHERE job_id = ?"
+_SELECT_PENDING = (
+    "SELECT idx, message FROM job_items WHERE job_id = ? AND status = 'pending' AND idx > ? "
+    "ORDER BY idx LIMIT ?"
+)
+_COUNT_RESULT = (
+    "UPDATE jobs SET completed = completed + 1, succeeded = succeeded + ?, "
+    "failed = failed + ?, timed_out = timed_out + ? WHERE job_id = ?"
+)
+_SAVE_RESULT = (
+    "UPDATE job_items SET status = ?, result = ?, "
+    "seq = (SELECT completed + 1 FROM jobs WHERE job_id = ?) "
+    "WHERE job_id = ? AND idx = ? AND status = 'pending'"
+)
+_FINISH_JOB = (
+    "UPDATE jobs SET status = ?, finished_at = ?, error = ? "
+    "WHERE job_id = ? AND status = 'running' AND owner = ?"
+)
+_CANCEL_JOB = (
+    "UPDATE jobs SET status = 'cancelled', finished_at = ? "
+    "WHERE job_id = ? AND status IN ('queued', 'running')"
+)
+_SELECT_RESULTS = (
+    "SELECT idx, message, status, result FROM job_items WHERE job_id = ? AND idx >= ? "
+    "ORDER BY idx LIMIT ?"
+)
+_SELECT_RESULTS_SINCE = (
+    "SELECT idx, message, status, result, seq FROM job_items WHERE job_id = ? AND seq > ? "
+    "ORDER BY seq LIMIT ?"
+)
+_COUNT_BY_STATUS = "SELECT status, COUNT(*) FROM jobs GROUP BY status"
+
+# Trạng thái job đã kết thúc (không chạy tiếp)
+FINISHED_STATUSES = ("completed", "cancelled", "failed")
+
+
+class JobStore:
+    """
+    Lưu job và kết quả từng câu trong SQLite (WAL)
+
+    Mỗi kết quả được ghi ngay khi câu đó xong, cùng transaction với bộ
+    đếm tiến độ của job, nên sau khi khởi động lại chỉ các câu chưa có
+    kết quả phải chạy lại. `seq` là thứ tự hoàn thành (dùng để stream).
+    """
+
+    def __init__(self, db_path: str = JOBS_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Kết nối SQLite riêng cho từng thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _job_dict(row) -> Dict:
+        keys = [column.strip() for column in _JOB_COLUMNS.split(",")]
+        return dict(zip(keys, row))
+
+    @staticmethod
+    def _item_dict(row) -> Dict:
+        item = {'index': row[0], 'message': row[1], 'status': row[2]}
+        if row[3] is not None:
+            item.update(loads(row[3]))
+        return item
+
+    def create(self, messages: List[str], scenario: str, temperature: Optional[float],
+               max_concurrency: int, item_timeout: float) -> Dict:
+        job_id = secrets.token_hex(8)
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(_INSERT_JOB, (job_id, scenario, temperature, max_concurrency,
+                                       item_timeout, len(messages), time.time()))
+            conn.executemany(_INSERT_ITEM, (
+                (job_id, index, message) for index, message in enumerate(messages)
+            ))
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        row = self._connection().execute(_SELECT_JOB, (job_id,)).fetchone()
+        return self._job_dict(row) if row is not None else None
+
+    def list(self, limit: int = 50) -> List[Dict]:
+        return [self._job_dict(row) for row in self._connection().execute(_SELECT_JOBS, (limit,))]
+
+    def status(self, job_id: str) -> Optional[str]:
+        row = self._connection().execute(_SELECT_STATUS, (job_id,)).fetchone()
+        return row[0] if row is not None else None
+
+    def claim(self, owner: str, stale_after: float = JOBS_STALE_AFTER) -> Optional[Dict]:
+        """Nhận job chờ lâu nhất (hoặc job "running" đã mất heartbeat), None nếu không có"""
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(_SELECT_CLAIMABLE, (now - stale_after,)).fetchone()
+            if row is None:
+                return None
+            conn.execute(_CLAIM_JOB, (owner, now, now, row[0]))
+        return self.get(row[0])
+
+    def heartbeat(self, job_ids: List[str], owner: str) -> List[str]:
+        """
+        Gia hạn heartbeat các job `owner` đang chạy, trả về các job không còn
+        thuộc `owner` (đã bị worker khác nhận lại, bị hủy hoặc đã kết thúc)
+        """
+        conn = self._connection()
+        now = time.time()
+        lost = []
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for job_id in job_ids:
+                if conn.execute(_HEARTBEAT, (now, job_id, owner)).rowcount == 0:
+                    lost.append(job_id)
+        return lost
+
+    def pending_items(self, job_id: str, page_size: int = 256) -> Iterator[Dict]:
+        """Các câu chưa có kết quả theo thứ tự, đọc từng trang (không nạp cả job)"""
+        last = -1
+        conn = self._connection()
+        while True:
+            rows = conn.execute(_SELECT_PENDING, (job_id, last, page_size)).fetchall()
+            if not rows:
+                return
+            for index, message in rows:
+                yield {'index': index, 'message': message}
+            last = rows[-1][0]
+
+    def save_result(self, job_id: str, index: int, status: str, result: Dict):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            saved = conn.execute(_SAVE_RESULT, (status, dumps(result), job_id, job_id, index)).rowcount
+            # Câu đã có kết quả (job bị process khác nhận lại): không đếm lần hai
+            if saved:
+                conn.execute(_COUNT_RESULT, (
+                    int(status == 'ok'), int(status != 'ok'), int(status == 'timeout'), job_id
+                ))
+
+    def finish(self, job_id: str, owner: str, status: str, error: Optional[str] = None):
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(_FINISH_JOB, (status, time.time(), error, job_id, owner))
+
+    def cancel(self, job_id: str) -> bool:
+        """Hủy job đang chờ / đang chạy, False nếu job không tồn tại hoặc đã kết thúc"""
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return conn.execute(_CANCEL_JOB, (time.time(), job_id)).rowcount > 0
+
+    def results(self, job_id: str, offset: int = 0, limit: int = 100) -> List[Dict]:
+        """Kết quả theo thứ tự câu hỏi (câu chưa xong có status "pending")"""
+        rows = self._connection().execute(_SELECT_RESULTS, (job_id, offset, limit))
+        return [self._item_dict(row) for row in rows]
+
+    def results_since(self, job_id: str, after_seq: int, limit: int = 256) -> List[Dict]:
+        """Kết quả theo thứ tự hoàn thành, sau vị trí `after_seq`"""
+        rows = self._connection().execute(_SELECT_RESULTS_SINCE, (job_id, after_seq, limit))
+        items = []
+        for row in rows:
+            item = self._item_dict(row[:4])
+            item['seq'] = row[4]
+            items.append(item)
+        return items
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._connection().execute(_COUNT_BY_STATUS).fetchall())
+
+
+class JobManager:
+    """
+    Chạy job nền bằng `max_running` worker thread
+
+    Mỗi job dùng BatchExecutor (tối đa max_concurrency câu cùng lúc, ưu
+    tiên PRIORITY_BATCH nên không tranh chỗ với chat tương tác). Job đang
+    chạy được gia hạn heartbeat định kỳ; job mất heartbeat quá
+    `stale_after` giây (process chết) được worker khác nhận lại và chạy
+    tiếp các câu chưa có kết quả.
+    """
+
+    def __init__(
+        self,
+        store: Optional[JobStore] = None,
+        client: Optional[DeepSeekClient] = None,
+        max_running: int = JOBS_MAX_RUNNING,
+        stale_after: float = JOBS_STALE_AFTER,
+        poll_interval: float = JOBS_POLL_INTERVAL
+    ):
+        self.store = store or JobStore()
+        self.client = client or DeepSeekClient()
+        self.max_running = max(1, max_running)
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.owner = f"{os.getpid()}-{secrets.token_hex(4)}"
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._running: Dict[str, threading.Event] = {}
+        self._threads: List[threading.Thread] = []
+
+    def start(self):
+        """Chạy worker và heartbeat trong thread nền (daemon), gọi nhiều lần chỉ chạy một lần"""
+        with self._lock:
+            if self._threads:
+                return
+            for number in range(self.max_running):
+                self._threads.append(threading.Thread(
+                    target=self._worker_loop, name=f'job-worker-{number}', daemon=True
+                ))
+            self._threads.append(threading.Thread(
+                target=self._heartbeat_loop, name='job-heartbeat', daemon=True
+            ))
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        with self._lock:
+            for cancelled in self._running.values():
+                cancelled.set()
+
+    def submit(self, messages: List[str], scenario: str = "default",
+               temperature: Optional[float] = None,
+               max_concurrency: int = BATCH_MAX_IN_FLIGHT,
+               item_timeout: float = BATCH_ITEM_TIMEOUT) -> Dict:
+        """
+        Tạo job mới (trả về ngay, worker xử lý sau)
+
+        Raises:
+            ValueError: Quá JOBS_MAX_ITEMS câu
+        """
+        if len(messages) > JOBS_MAX_ITEMS:
+            raise ValueError(f"Job có tối đa {JOBS_MAX_ITEMS} câu hỏi")
+        job = self.store.create(
+            [str(message) for message in messages], scenario, temperature,
+            max(1, min(int(max_concurrency), BATCH_MAX_IN_FLIGHT)),
+            min(float(item_timeout), BATCH_ITEM_TIMEOUT)
+        )
+        self._wakeup.set()
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Hủy job: các câu chưa chạy bị bỏ, câu đang chạy được bỏ qua kết quả"""
+        if not self.store.cancel(job_id):
+            return False
+        with self._lock:
+            cancelled = self._running.get(job_id)
+        if cancelled is not None:
+            cancelled.set()
+        return True
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Trạng thái job kèm tiến độ (%) và thời gian còn lại ước lượng"""
+        job = self.store.get(job_id)
+        if job is None:
+            return None
+        total, completed = job['total'], job['completed']
+        job['progress'] = round(completed / total * 100, 1) if total else 100.0
+        job['eta'] = None
+        if job['status'] == 'running' and job['started_at'] and completed:
+            rate = completed / max(time.time() - job['started_at'], 1e-6)
+            job['eta'] = round((total - completed) / rate, 1)
+        return job
+
+    def poll_results(self, job_id: str, after_seq: int = 0) -> Tuple[List[Dict], Optional[Dict]]:
+        """
+        Dùng cho stream kết quả: (kết quả mới sau `after_seq`, job). Job chỉ
+        được trả về (thay vì None) khi đã kết thúc và không còn kết quả nào
+        chưa đọc - lúc đó stream gửi dòng tổng kết và dừng.
+        """
+        # Đọc trạng thái trước: mọi kết quả được lưu trước khi job kết thúc
+        job = self.get(job_id)
+        items = self.store.results_since(job_id, after_seq)
+        if items or job is None or job['status'] not in FINISHED_STATUSES:
+            return items, None
+        return items, job
+
+    def stats(self) -> Dict:
+        with self._lock:
+            running_here = list(self._running)
+        return {
+            'owner': self.owner,
+            'running_here': running_here,
+            'jobs': self.store.counts()
+        }
+
+    def _worker_loop(self):
+        while not self._stop.is_set():
+            job = self.store.claim(self.owner, self.stale_after)
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+            self._run(job)
+
+    def _heartbeat_loop(self):
+        while not self._stop.wait(max(self.stale_after / 3, 0.1)):
+            with self._lock:
+                job_ids = list(self._running)
+            if not job_ids:
+                continue
+            lost = self.store.heartbeat(job_ids, self.owner)
+            if lost:
+                # Job đã thuộc worker khác (heartbeat trễ quá stale_after): dừng
+                # ngay để hai worker không cùng chạy và kết thúc một job
+                with self._lock:
+                    for job_id in lost:
+                        cancelled = self._running.get(job_id)
+                        if cancelled is not None:
+                            cancelled.set()
+
+    def _run(self, job: Dict):
+        job_id = job['job_id']
+        cancelled = threading.Event()
+        with self._lock:
+            self._running[job_id] = cancelled
+
+        executor = BatchExecutor(
+            max_in_flight=job['max_concurrency'],
+            item_timeout=job['item_timeout'],
+            deadline=None
+        )
+
+        def items():
+            for item in self.store.pending_items(job_id):
+                if cancelled.is_set():
+                    return
+                yield item
+
+        def process(item):
+            # Cùng hạn với executor: quá item_timeout thì executor đã bỏ item
+            # này, thread không được thử lại mãi
+            deadline = time.monotonic() + job['item_timeout']
+            while not cancelled.is_set():
+                remaining = deadline - time.monotonic()
+                try:
+                    result = self.client.chat_detailed(
+                        user_message=item['message'],
+                        scenario=job['scenario'],
+                        temperature=job['temperature'],
+                        timeout=max(remaining, 1),
+                        priority=PRIORITY_BATCH
+                    )
+                except OverloadedError as e:
+                    # Job nền: chờ hàng đợi rảnh thay vì đánh dấu lỗi
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise
+                    cancelled.wait(min(e.retry_after, remaining))
+                    continue
+                if not result.ok:
+                    raise result.error
+                return result
+            raise RuntimeError("Job cancelled")
+
+        last_check = time.monotonic()
+        results = executor.iter_completed(items(), process)
+        try:
+            for outcome in results:
+                now = time.monotonic()
+                if now - last_check >= self.poll_interval:
+                    # Job có thể bị hủy từ process khác
+                    last_check = now
+                    if self.store.status(job_id) != 'running':
+                        cancelled.set()
+                if cancelled.is_set():
+                    break
+                self.store.save_result(job_id, outcome['item']['index'], outcome['status'],
+                                       format_job_result(outcome))
+            if not cancelled.is_set():
+                self.store.finish(job_id, self.owner, 'completed')
+        except Exception as e:
+            self.store.finish(job_id, self.owner, 'failed', f"{type(e).__name__}: {e}")
+        finally:
+            # Dừng các thread còn đang chờ thử lại (item đã quá hạn hoặc job dừng)
+            cancelled.set()
+            results.close()
+            with self._lock:
+                self._running.pop(job_id, None)
+
+
+def format_job_result(outcome: Dict) -> Dict:
+    """Phần kết quả của một câu được lưu lại (cùng trường với /api/batch)"""
+    result = {'elapsed_time': round(outcome['elapsed'], 2)}
+    if outcome['status'] == 'ok':
+        chat_result = outcome['value']
+        result.update({
+            'success': True,
+            'response': chat_result.content,
+            'source': chat_result.source,
+            'model': chat_result.model,
+            'usage': chat_result.usage(),
+            'timings': chat_result.timings()
+        })
+    else:
+        result.update({
+            'success': False,
+            'error': outcome['error'],
+            'timed_out': outcome['status'] == 'timeout'
+        })
+    return result
+
+
+_manager: Optional[JobManager] = None
+_manager_lock = threading.Lock()
+
+
+def get_job_manager(create: bool = True) -> Optional[JobManager]:
+    """
+    Lấy JobManager dùng chung của process (None nếu bị tắt)
+
+    JobStore tạo file JOBS_DB_PATH, nên manager chỉ được tạo khi thực sự
+    dùng tới job. create=False: trả None nếu chưa có manager (để báo trạng
+    thái mà không tạo DB).
+    """
+    global _manager
+    if not JOBS_ENABLED:
+        return None
+    if _manager is None and create:
+        with _manager_lock:
+            if _manager is None:
+                _manager = JobManager()
+    return _manager
+
+
+def resume_jobs() -> Optional[JobManager]:
+    """
+    Lúc server khởi động: chạy worker nếu đã có DB job từ lần chạy trước (có
+    thể còn job chưa xong). Chưa có DB thì chờ request /api/jobs đầu tiên.
+    """
+    if not JOBS_ENABLED or not os.path.exists(JOBS_DB_PATH):
+        return None
+    manager = get_job_manager()
+    manager.start()
+    return manager
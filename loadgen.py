@@ -0,0 +1,278 @@
+# loadgen.py
+# Tạo tải open-loop cho api_server: phát lại request từ file JSONL theo tốc độ đến cố định / Poisson
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+import requests
+
+from benchmark import percentile
+
+STREAM_PATH = "/api/chat/stream"
+
+
+def load_requests(path: Optional[str]) -> List[Dict]:
+    """
+    Đọc danh sách request từ file JSONL, mỗi dòng một trong các dạng:
+
+        {"path": "/api/chat", "body": {...}}           - request đầy đủ
+        {"message": "...", "scenario": "...", "stream": true}
+        {"body": "..."} hoặc {"title": "..."}           - dùng text làm câu hỏi
+
+    Không có file: dùng một câu hỏi mẫu (mỗi lần gửi thêm số thứ tự)
+    """
+    if not path:
+        return [{"path": "/api/chat", "body": {"message": "Xin chào, bạn là ai?"}, "unique": True}]
+
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"⚠️  Bỏ qua dòng {line_number}: không phải JSON", file=sys.stderr)
+                continue
+
+            if isinstance(record.get("path"), str) and isinstance(record.get("body"), dict):
+                items.append({"path": record["path"], "body": record["body"]})
+            elif "message" in record:
+                body = {k: v for k, v in record.items() if k != "stream"}
+                path = STREAM_PATH if record.get("stream") else "/api/chat"
+                items.append({"path": path, "body": body})
+            elif isinstance(record.get("body") or record.get("title"), str):
+                items.append({"path": "/api/chat", "body": {
+                    "message": record.get("body") or record["title"]
+                }})
+    if not items:
+        raise ValueError(f"Không có request hợp lệ trong {path}")
+    return items
+
+
+def arrival_times(rate: float, count: int, distribution: str, seed: Optional[int]) -> Iterator[float]:
+    """Thời điểm (giây, tính từ lúc bắt đầu) của từng request theo tốc độ `rate` req/s"""
+    rng = random.Random(seed)
+    t = 0.0
+    for i in range(count):
+        if distribution == "poisson":
+            t += rng.expovariate(rate)
+            yield t
+        else:
+            yield i / rate
+
+
+class LoadGenerator:
+    """
+    Gửi request theo lịch định trước (open-loop), không chờ request trước xong
+
+    Request được lên lịch ở thời điểm cố định; nếu cả `concurrency` luồng đều
+    bận, request phải chờ và thời gian chờ đó vẫn được tính vào độ trễ đã hiệu
+    chỉnh (coordinated omission): latency = thời điểm xong - thời điểm lên lịch.
+    """
+
+    def __init__(self, base_url: str, concurrency: int = 64, timeout: float = 300):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _send(self, item: Dict, index: int, start: float, scheduled: float) -> Dict:
+        sent = time.perf_counter() - start
+        record = {
+            "path": item["path"],
+            "scheduled": scheduled,
+            "sent": sent,
+            "first_token": None,
+            "status": None,
+            "ok": False,
+        }
+        try:
+            body = dict(item["body"])
+            if item.get("unique"):
+                body["message"] = f"{body['message']} #{index}"
+
+            if item["path"] == STREAM_PATH:
+                self._send_stream(body, record, start)
+            else:
+                response = self._session().post(
+                    f"{self.base_url}{item['path']}", json=body, timeout=self.timeout
+                )
+                record["status"] = response.status_code
+                record["ok"] = response.status_code == 200
+        except Exception as e:
+            # Mọi lỗi (kết nối, JSON hỏng trong stream, body sai...) đều tính là request lỗi,
+            # không để exception nằm lại trong future khiến báo cáo thiếu bản ghi
+            record["error"] = type(e).__name__
+        record["end"] = time.perf_counter() - start
+        return record
+
+    def _send_stream(self, body: Dict, record: Dict, start: float):
+        with self._session().post(
+            f"{self.base_url}{STREAM_PATH}", json=body, stream=True, timeout=self.timeout
+        ) as response:
+            record["status"] = response.status_code
+            if response.status_code != 200:
+                return
+            for line in response.iter_lines():
+                if not line.startswith(b"data: "):
+                    continue
+                event = json.loads(line[6:])
+                if event["type"] == "token" and record["first_token"] is None:
+                    record["first_token"] = time.perf_counter() - start
+                elif event["type"] == "done":
+                    record["ok"] = True
+                elif event["type"] == "error":
+                    record["error"] = event.get("error_type") or "stream_error"
+
+    def run(
+        self,
+        items: List[Dict],
+        rate: float,
+        count: int,
+        distribution: str = "constant",
+        seed: Optional[int] = None
+    ) -> Dict:
+        """Chạy `count` request với tốc độ `rate` req/s, trả về báo cáo"""
+        records: List[Dict] = []
+        lock = threading.Lock()
+
+        def task(index: int, scheduled: float, start: float):
+            record = self._send(items[index % len(items)], index, start, scheduled)
+            with lock:
+                records.append(record)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for index, scheduled in enumerate(arrival_times(rate, count, distribution, seed)):
+                delay = scheduled - (time.perf_counter() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(task, index, scheduled, start)
+        duration = time.perf_counter() - start
+
+        return build_report(records, rate, duration)
+
+
+def _stats(values: List[float]) -> Dict:
+    def rounded(value: Optional[float]) -> Optional[float]:
+        return round(value, 4) if value is not None else None
+
+    return {
+        "p50": rounded(percentile(values, 50)),
+        "p90": rounded(percentile(values, 90)),
+        "p95": rounded(percentile(values, 95)),
+        "p99": rounded(percentile(values, 99)),
+        "max": rounded(max(values)) if values else None,
+    }
+
+
+def build_report(records: List[Dict], rate: float, duration: float) -> Dict:
+    """Tóm tắt theo endpoint: tỉ lệ lỗi, độ trễ (thô và đã hiệu chỉnh), TTFT"""
+    by_path: Dict[str, List[Dict]] = {}
+    for record in records:
+        by_path.setdefault(record["path"], []).append(record)
+
+    endpoints = {}
+    for path, group in sorted(by_path.items()):
+        ok = [r for r in group if r["ok"]]
+        statuses: Dict[str, int] = {}
+        for r in group:
+            # Lỗi trong stream (HTTP 200) hoặc lỗi kết nối: dùng tên lỗi thay cho mã HTTP
+            key = r.get("error") or str(r["status"] if r["status"] is not None else "error")
+            statuses[key] = statuses.get(key, 0) + 1
+
+        summary = {
+            "requests": len(group),
+            "errors": len(group) - len(ok),
+            "error_rate": round((len(group) - len(ok)) / len(group), 4),
+            "statuses": statuses,
+            # Thời gian phục vụ: từ lúc thực sự gửi
+            "latency": _stats([r["end"] - r["sent"] for r in ok]),
+            # Hiệu chỉnh coordinated omission: tính từ thời điểm lẽ ra phải gửi
+            "latency_corrected": _stats([r["end"] - r["scheduled"] for r in ok]),
+        }
+        ttft = [r for r in ok if r["first_token"] is not None]
+        if ttft:
+            summary["ttft"] = _stats([r["first_token"] - r["sent"] for r in ttft])
+            summary["ttft_corrected"] = _stats([r["first_token"] - r["scheduled"] for r in ttft])
+        endpoints[path] = summary
+
+    completed = [r for r in records if r["ok"]]
+    return {
+        "offered_rate": rate,
+        "achieved_rate": round(len(completed) / duration, 2) if duration > 0 else None,
+        "duration": round(duration, 2),
+        "requests": len(records),
+        "max_send_lag": round(max((r["sent"] - r["scheduled"] for r in records), default=0.0), 4),
+        "endpoints": endpoints,
+    }
+
+
+def print_report(report: Dict):
+    print(f"\n📈 Tốc độ yêu cầu {report['offered_rate']} req/s, đạt {report['achieved_rate']} req/s "
+          f"({report['requests']} request, {report['duration']}s, "
+          f"trễ gửi tối đa {report['max_send_lag']}s)")
+    for path, summary in report["endpoints"].items():
+        latency, corrected = summary["latency"], summary["latency_corrected"]
+        print(f"   {path}: lỗi {summary['error_rate']:.1%} {summary['statuses']}")
+        print(f"      latency    p50={latency['p50']} p95={latency['p95']} p99={latency['p99']}")
+        print(f"      hiệu chỉnh p50={corrected['p50']} p95={corrected['p95']} p99={corrected['p99']}")
+        if "ttft" in summary:
+            ttft, ttft_corrected = summary["ttft"], summary["ttft_corrected"]
+            print(f"      TTFT       p50={ttft['p50']} p95={ttft['p95']} "
+                  f"(hiệu chỉnh p95={ttft_corrected['p95']})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tạo tải open-loop cho api_server")
+    parser.add_argument("input", nargs="?", help="File JSONL chứa request để phát lại")
+    parser.add_argument("--url", default="http://localhost:8000", help="Địa chỉ api_server")
+    parser.add_argument("--rate", type=float, action="append",
+                        help="Số request/giây (lặp lại để tăng dần và tìm điểm bão hòa)")
+    parser.add_argument("--duration", type=float, default=30, help="Giây cho mỗi mức tải")
+    parser.add_argument("--distribution", choices=("constant", "poisson"), default="poisson")
+    parser.add_argument("--concurrency", type=int, default=64, help="Số request đồng thời tối đa")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--stream", action="store_true",
+                        help="Gửi mọi request chat qua /api/chat/stream")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="Ghi báo cáo JSON ra file")
+    args = parser.parse_args()
+
+    items = load_requests(args.input)
+    if args.stream:
+        for item in items:
+            if item["path"] == "/api/chat":
+                item["path"] = STREAM_PATH
+
+    generator = LoadGenerator(args.url, concurrency=args.concurrency, timeout=args.timeout)
+    reports = []
+    for rate in args.rate or [1.0]:
+        count = max(1, int(rate * args.duration))
+        print(f"▶️  {rate} req/s ({args.distribution}) trong {args.duration}s - {count} request")
+        report = generator.run(items, rate, count, args.distribution, args.seed)
+        print_report(report)
+        reports.append(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"\n✅ Đã lưu báo cáo: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,383 @@
+# metrics.py
+# Số liệu hiệu năng dạng Prometheus (counter / gauge / histogram) và endpoint /metrics
+
+import bisect
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import SCENARIOS
+
+# Bucket mặc định (giây) - từ vài ms (cache / câu mẫu) tới vài phút (model trên CPU)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+TOKENS_PER_SECOND_BUCKETS = (1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 250, 500)
+
+_NS = 1e9
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [
+        '%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n'))
+        for name, value in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Phần chung: tên, mô tả, nhãn và khóa (chỉ giữ trong lúc cộng số)"""
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _header(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Bộ đếm chỉ tăng"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Gauge(_Metric):
+    """Giá trị tăng / giảm, hoặc đọc từ hàm callback lúc scrape"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def inc(self, *labels, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels):
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Lấy giá trị bằng hàm khi scrape (không tốn gì trên hot path)"""
+        self._function = function
+
+    def render(self) -> List[str]:
+        if self._function is not None:
+            try:
+                values = [((), self._function())]
+            except Exception:
+                values = []
+        else:
+            with self._lock:
+                values = list(self._values.items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+            for labels, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """Phân bố giá trị theo bucket (tích lũy khi xuất ra, như Prometheus)"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [đếm theo từng bucket (không tích lũy) + bucket +Inf, tổng, số lần]
+        self._values: Dict[Tuple, List] = {}
+
+    def observe(self, value: float, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, *labels) -> int:
+        state = self._values.get(labels)
+        return state[2] if state else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items()]
+
+        lines = self._header()
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = 'le="%s"' % _format_value(float(bound))
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+                )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(total)}")
+            lines.append(f"{self.name}_count{label_text} {count}")
+        return lines
+
+
+class Registry:
+    """Tập hợp các metric của process, xuất ra text format của Prometheus"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Request tới API server / web app
+HTTP_REQUESTS = REGISTRY.counter(
+    "deepseek_http_requests_total",
+    "Số request HTTP theo endpoint, kịch bản và mã trạng thái",
+    ("endpoint", "scenario", "status")
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "deepseek_http_request_duration_seconds",
+    "Thời gian xử lý request HTTP (streaming tính tới khi đóng stream)",
+    ("endpoint", "scenario")
+)
+ACTIVE_SESSIONS = REGISTRY.gauge(
+    "deepseek_active_sessions",
+    "Số session đang hoạt động"
+)
+ADMISSION_QUEUED = REGISTRY.gauge(
+    "deepseek_admission_queued",
+    "Số request đang chờ trong hàng đợi trước Ollama"
+)
+
+# Request tới Ollama
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    "deepseek_upstream_requests_total",
+    "Số request gửi tới Ollama theo model và kết quả",
+    ("model", "outcome")
+)
+UPSTREAM_IN_FLIGHT = REGISTRY.gauge(
+    "deepseek_upstream_in_flight",
+    "Số request tới Ollama đang chạy"
+)
+UPSTREAM_DURATION = REGISTRY.histogram(
+    "deepseek_upstream_duration_seconds",
+    "Thời gian một request tới Ollama (tới khi nhận đủ câu trả lời)",
+    ("model",)
+)
+UPSTREAM_TTFT = REGISTRY.histogram(
+    "deepseek_upstream_time_to_first_token_seconds",
+    "Thời gian từ lúc gửi request streaming tới khi nhận token đầu tiên",
+    ("model",)
+)
+UPSTREAM_PROMPT_EVAL = REGISTRY.histogram(
+    "deepseek_upstream_prompt_eval_seconds",
+    "Thời gian xử lý prompt (prefill) theo prompt_eval_duration của Ollama",
+    ("model",)
+)
+UPSTREAM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "deepseek_upstream_tokens_per_second",
+    "Tốc độ sinh token theo eval_count / eval_duration của Ollama",
+    ("model",),
+    TOKENS_PER_SECOND_BUCKETS
+)
+UPSTREAM_GENERATED_TOKENS = REGISTRY.counter(
+    "deepseek_upstream_generated_tokens_total",
+    "Tổng số token model đã sinh",
+    ("model",)
+)
+MODEL_ROUTING = REGISTRY.counter(
+    "deepseek_model_routing_total",
+    "Số request theo kịch bản, model được chọn và lý do (preferred, slo, unavailable, unchecked)",
+    ("scenario", "model", "reason")
+)
+
+
+def scenario_label(scenario: Optional[str]) -> str:
+    """Nhãn kịch bản có số giá trị giới hạn (kịch bản lạ gộp vào 'other')"""
+    if not scenario:
+        return ""
+    return scenario if scenario in SCENARIOS else "other"
+
+
+def observe_ollama_stats(model: str, data: Dict):
+    """Ghi các số liệu Ollama trả về ở message cuối (thời gian tính bằng nano giây)"""
+    prompt_eval_duration = data.get("prompt_eval_duration")
+    if prompt_eval_duration:
+        UPSTREAM_PROMPT_EVAL.observe(prompt_eval_duration / _NS, model)
+
+    eval_count = data.get("eval_count")
+    eval_duration = data.get("eval_duration")
+    if eval_count:
+        UPSTREAM_GENERATED_TOKENS.inc(model, amount=eval_count)
+        if eval_duration:
+            UPSTREAM_TOKENS_PER_SECOND.observe(eval_count / (eval_duration / _NS), model)
+
+
+class UpstreamTimer:
+    """
+    Đo một request tới Ollama: số request đang chạy, thời gian, TTFT
+
+        timer = UpstreamTimer(model)
+        ... timer.first_token() khi nhận token đầu tiên (streaming)
+        timer.finish(final_data) hoặc timer.fail()
+    """
+
+    __slots__ = ('model', 'start', 'duration', '_ttft_recorded', '_finished')
+
+    def __init__(self, model: str):
+        self.model = model
+        self.start = time.perf_counter()
+        # Thời gian tới khi nhận đủ câu trả lời (chỉ có khi finish())
+        self.duration: Optional[float] = None
+        self._ttft_recorded = False
+        self._finished = False
+        UPSTREAM_IN_FLIGHT.inc()
+
+    def first_token(self):
+        if not self._ttft_recorded:
+            self._ttft_recorded = True
+            UPSTREAM_TTFT.observe(time.perf_counter() - self.start, self.model)
+
+    def finish(self, data: Optional[Dict] = None):
+        if self._finished:
+            return
+        self._finished = True
+        self.duration = time.perf_counter() - self.start
+        UPSTREAM_IN_FLIGHT.dec()
+        UPSTREAM_DURATION.observe(self.duration, self.model)
+        UPSTREAM_REQUESTS.inc(self.model, "ok")
+        if data:
+            observe_ollama_stats(self.model, data)
+
+    def fail(self, outcome: str = "error"):
+        """Request lỗi hoặc bị hủy giữa chừng ("cancelled")"""
+        if self._finished:
+            return
+        self._finished = True
+        UPSTREAM_IN_FLIGHT.dec()
+        UPSTREAM_REQUESTS.inc(self.model, outcome)
+
+
+def install_flask_metrics(app, sessions=None, scheduler=None, registry: Registry = REGISTRY):
+    """
+    Gắn đo lường request cho một Flask app và thêm route GET /metrics
+
+    Args:
+        app: Flask app
+        sessions: Kho session (để báo số session đang hoạt động)
+        scheduler: AdmissionController (để báo độ sâu hàng đợi)
+        registry: Registry để xuất ra
+    """
+    from flask import Response, g, request
+
+    if sessions is not None:
+        ACTIVE_SESSIONS.set_function(lambda: len(sessions))
+    if scheduler is not None:
+        ADMISSION_QUEUED.set_function(lambda: scheduler.stats()['queued'])
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.get('metrics_start')
+        if start is None or request.path == '/metrics':
+            return response
+
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        scenario = ""
+        if request.method == 'POST' and request.is_json:
+            body = request.get_json(silent=True)
+            if isinstance(body, dict):
+                scenario = scenario_label(body.get('scenario', 'default'))
+        status = str(response.status_code)
+
+        def record():
+            HTTP_REQUESTS.inc(endpoint, scenario, status)
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - start, endpoint, scenario)
+
+        # Response streaming: chỉ ghi khi stream đã được gửi hết / bị đóng
+        response.call_on_close(record)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Số liệu hiệu năng dạng Prometheus"""
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,261 @@
+# mock_ollama.py
+# Server giả lập Ollama để test hiệu năng khi không có model thật (CI, laptop)
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+# Câu trả lời giả lập được ghép từ các từ này, lặp lại tới đủ số token
+_WORDS = (
+    "Đây", " là", " câu", " trả", " lời", " giả", " lập", " từ", " mock",
+    " Ollama", " để", " đo", " hiệu", " năng", " của", " hệ", " thống", "."
+)
+
+
+class MockOllamaServer(ThreadingHTTPServer):
+    """
+    Server HTTP giả lập các endpoint của Ollama
+
+    - latency: thời gian (giây) trước token đầu tiên (giả lập prefill)
+    - tokens_per_second: tốc độ sinh token khi streaming / không streaming
+    - response_tokens: số token mỗi câu trả lời (num_predict nhỏ hơn sẽ được dùng)
+    - error_rate: xác suất (0.0-1.0) trả HTTP 500 để test xử lý lỗi
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 11434,
+        models: Optional[List[str]] = None,
+        latency: float = 0.05,
+        tokens_per_second: float = 200.0,
+        response_tokens: int = 32,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        super().__init__((host, port), _MockHandler)
+        self.models = models or ["deepseek-r1:1.5b"]
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # Model đã được "nạp" (cho /api/ps), lần gọi đầu mỗi model có load_duration
+        self.loaded: Dict[str, float] = {}
+
+    def should_fail(self) -> bool:
+        if self.error_rate <= 0:
+            return False
+        with self._random_lock:
+            return self._random.random() < self.error_rate
+
+    def start(self) -> "MockOllamaServer":
+        """Chạy server trong thread nền (dùng khi test trong cùng process)"""
+        self._thread = threading.Thread(target=self.serve_forever, name="mock-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: MockOllamaServer
+
+    def log_message(self, format, *args):
+        pass
+
+    # ------------------------------------------------------------------
+    # Gửi response
+    # ------------------------------------------------------------------
+
+    def _send_json(self, data: Dict, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _send_chunk(self, data: Dict):
+        line = (json.dumps(data, ensure_ascii=False) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    # ------------------------------------------------------------------
+    # Endpoint
+    # ------------------------------------------------------------------
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [
+                {"name": name, "model": name, "size": 0} for name in self.server.models
+            ]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [
+                {"name": name, "model": name, "expires_at": None}
+                for name in self.server.loaded
+            ]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send_json({"error": "invalid JSON"}, 400)
+
+        if self.path not in ("/api/chat", "/api/generate"):
+            return self._send_json({"error": "not found"}, 404)
+
+        model = body.get("model") or self.server.models[0]
+        if model not in self.server.models:
+            return self._send_json({"error": f"model '{model}' not found"}, 404)
+        if self.server.should_fail():
+            return self._send_json({"error": "mock: lỗi giả lập"}, 500)
+
+        if self.path == "/api/chat":
+            prompt = "".join(m.get("content", "") for m in body.get("messages", []))
+        else:
+            prompt = (body.get("system") or "") + (body.get("prompt") or "")
+            if not prompt:
+                return self._load(model)
+        self._generate(body, model, prompt)
+
+    def _load(self, model: str):
+        """/api/generate không có prompt: chỉ nạp model (Ollama trả done_reason "load")"""
+        load_duration = 0.0
+        if model not in self.server.loaded:
+            load_duration = self.server.latency
+            time.sleep(load_duration)
+            self.server.loaded[model] = time.time()
+        self._send_json({
+            "model": model,
+            "response": "",
+            "done": True,
+            "done_reason": "load",
+            "load_duration": int(load_duration * 1e9),
+        })
+
+    def _generate(self, body: Dict, model: str, prompt: str):
+        """Sinh câu trả lời giả lập, stream từng token hoặc trả một lần"""
+        server = self.server
+        is_chat = self.path == "/api/chat"
+        stream = body.get("stream", True)
+        options = body.get("options") or {}
+        num_predict = options.get("num_predict")
+        n_tokens = server.response_tokens if num_predict is None or num_predict < 0 \
+            else min(server.response_tokens, num_predict)
+
+        start = time.perf_counter()
+        load_duration = 0.0
+        if model not in server.loaded:
+            load_duration = server.latency
+            server.loaded[model] = time.time()
+
+        # Prefill
+        prompt_tokens = max(1, len(prompt) // 3)
+        time.sleep(server.latency)
+        prompt_done = time.perf_counter()
+
+        token_delay = 1.0 / server.tokens_per_second if server.tokens_per_second > 0 else 0
+        tokens = [_WORDS[i % len(_WORDS)] for i in range(n_tokens)]
+
+        def chunk(content: str, done: bool) -> Dict:
+            if is_chat:
+                return {"model": model, "message": {"role": "assistant", "content": content}, "done": done}
+            return {"model": model, "response": content, "done": done}
+
+        if stream:
+            self._start_stream()
+            for token in tokens:
+                if token_delay:
+                    time.sleep(token_delay)
+                self._send_chunk(chunk(token, False))
+        elif token_delay:
+            time.sleep(token_delay * n_tokens)
+
+        end = time.perf_counter()
+        final = chunk("" if stream else "".join(tokens), True)
+        final.update({
+            "done_reason": "stop",
+            "total_duration": int((end - start + load_duration) * 1e9),
+            "load_duration": int(load_duration * 1e9),
+            "prompt_eval_count": prompt_tokens,
+            "prompt_eval_duration": int((prompt_done - start) * 1e9),
+            "eval_count": n_tokens,
+            "eval_duration": int((end - prompt_done) * 1e9),
+        })
+        if not is_chat:
+            # Context giả: nối thêm token của lượt này
+            final["context"] = list(body.get("context") or []) + list(range(prompt_tokens + n_tokens))
+
+        if stream:
+            self._send_chunk(final)
+            self._end_stream()
+        else:
+            self._send_json(final)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Server giả lập Ollama để đo hiệu năng")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--model", action="append", dest="models",
+                        help="Tên model (lặp lại để thêm nhiều model)")
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Giây trước token đầu tiên (prefill)")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--response-tokens", type=int, default=32)
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Xác suất trả lỗi 500 (0.0-1.0)")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockOllamaServer(
+        host=args.host,
+        port=args.port,
+        models=args.models,
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        response_tokens=args.response_tokens,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    print(f"🧪 Mock Ollama đang chạy tại {server.base_url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
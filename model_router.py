@@ -0,0 +1,183 @@
+# model_router.py
+# Chọn model cho từng kịch bản: model ưu tiên, chuyển sang model nhỏ hơn khi vượt latency SLO
+
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from config import (
+    MODEL_NAME,
+    SCENARIOS,
+    MODEL_ROUTING_ENABLED,
+    ROUTER_LATENCY_WINDOW,
+    ROUTER_MIN_SAMPLES,
+)
+from backend_pool import BackendPool, get_backend_pool
+from metrics import MODEL_ROUTING
+from scheduler import AdmissionController, get_scheduler
+
+
+def _p95(values: List[float]) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+class _LatencyWindow:
+    """Độ trễ các request gần đây của một model (chỉ giữ `window` giây gần nhất)"""
+
+    __slots__ = ('window', 'samples', 'total', 'routed', 'fallbacks')
+
+    def __init__(self, window: float):
+        self.window = window
+        self.samples: Deque[Tuple[float, float]] = deque()
+        self.total = 0
+        self.routed = 0
+        self.fallbacks = 0
+
+    def add(self, latency: float, now: float):
+        self.samples.append((now, latency))
+        self.total += 1
+        self._trim(now)
+
+    def recent(self, now: float) -> List[float]:
+        self._trim(now)
+        return [latency for _, latency in self.samples]
+
+    def _trim(self, now: float):
+        while self.samples and now - self.samples[0][0] > self.window:
+            self.samples.popleft()
+
+
+class ModelRouter:
+    """
+    Chọn model cho request theo cấu hình kịch bản trong SCENARIOS:
+
+        "model": model ưu tiên (mặc định: model của client)
+        "fallback_model": model nhỏ hơn dùng khi model ưu tiên quá tải
+        "latency_slo": giây - độ trễ mục tiêu của kịch bản
+
+    Dùng fallback khi model ưu tiên không có trên backend nào, hoặc khi
+    thời gian chờ hàng đợi ước lượng + p95 độ trễ gần đây của model ưu tiên
+    vượt latency_slo. Số liệu cũ hơn `latency_window` giây bị bỏ, nên khi tải
+    giảm request lại được gửi về model ưu tiên. Khi chưa có health check nào
+    (chưa biết backend có model gì), request dùng fallback trong lúc kiểm tra
+    chạy nền.
+
+    Client tạo với model_name riêng không đi qua bộ định tuyến (xem
+    BaseDeepSeekClient.route_models).
+    """
+
+    def __init__(
+        self,
+        backends: Optional[BackendPool] = None,
+        scheduler: Optional[AdmissionController] = None,
+        latency_window: float = ROUTER_LATENCY_WINDOW,
+        min_samples: int = ROUTER_MIN_SAMPLES
+    ):
+        self.backends = backends or get_backend_pool()
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
+        self.latency_window = latency_window
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._models: Dict[str, _LatencyWindow] = {}
+
+    def _window(self, model: str) -> _LatencyWindow:
+        window = self._models.get(model)
+        if window is None:
+            window = self._models[model] = _LatencyWindow(self.latency_window)
+        return window
+
+    def observe(self, model: str, latency: float):
+        """Ghi độ trễ (giây) của một request tới Ollama đã hoàn tất"""
+        with self._lock:
+            self._window(model).add(latency, time.monotonic())
+
+    def predicted_latency(self, model: str) -> Optional[float]:
+        """Thời gian chờ hàng đợi ước lượng + p95 độ trễ gần đây, None nếu chưa đủ số liệu"""
+        with self._lock:
+            recent = self._window(model).recent(time.monotonic())
+        if len(recent) < self.min_samples:
+            return None
+        queue_wait = self.scheduler.expected_wait() if self.scheduler is not None else 0.0
+        return queue_wait + _p95(recent)
+
+    @staticmethod
+    def preferred_model(scenario: str, default_model: str = MODEL_NAME) -> str:
+        """Model ưu tiên của kịch bản (không kiểm tra backend, không ghi số liệu)"""
+        return SCENARIOS.get(scenario, SCENARIOS["default"]).get("model", default_model)
+
+    def route(self, scenario: str, default_model: str = MODEL_NAME) -> str:
+        """Model dùng cho một request của kịch bản"""
+        config = SCENARIOS.get(scenario, SCENARIOS["default"])
+        preferred = self.preferred_model(scenario, default_model)
+        fallback = config.get("fallback_model")
+        slo = config.get("latency_slo")
+
+        reason = "preferred"
+        model = preferred
+        if fallback and fallback != preferred:
+            if self.backends.last_check is None:
+                # Chưa biết backend có model nào: không chặn request để chờ
+                # health check, kiểm tra trong nền và tạm dùng model dự phòng
+                self.backends.check_health_background()
+                reason = "unchecked"
+            elif not self.backends.model_available(preferred):
+                reason = "unavailable"
+            elif slo is not None:
+                predicted = self.predicted_latency(preferred)
+                if predicted is not None and predicted > slo:
+                    reason = "slo"
+            if reason != "preferred" and self.backends.model_available(fallback):
+                model = fallback
+            else:
+                reason = "preferred"
+
+        with self._lock:
+            window = self._window(model)
+            window.routed += 1
+            if model != preferred:
+                window.fallbacks += 1
+        MODEL_ROUTING.inc(scenario if scenario in SCENARIOS else "other", model, reason)
+        return model
+
+    def stats(self) -> Dict:
+        """Độ trễ gần đây và số request được định tuyến theo từng model"""
+        now = time.monotonic()
+        with self._lock:
+            snapshot = {
+                model: (window.recent(now), window.total, window.routed, window.fallbacks)
+                for model, window in self._models.items()
+            }
+        queue_wait = self.scheduler.expected_wait() if self.scheduler is not None else 0.0
+
+        models = {}
+        for model, (recent, total, routed, fallbacks) in snapshot.items():
+            models[model] = {
+                'requests': total,
+                'routed': routed,
+                'fallbacks': fallbacks,
+                'recent_samples': len(recent),
+                'recent_avg': round(sum(recent) / len(recent), 3) if recent else None,
+                'recent_p95': round(_p95(recent), 3) if recent else None
+            }
+        return {
+            'expected_queue_wait': round(queue_wait, 3),
+            'models': models
+        }
+
+
+_router: Optional[ModelRouter] = None
+_router_lock = threading.Lock()
+
+
+def get_model_router() -> Optional[ModelRouter]:
+    """Lấy bộ định tuyến model dùng chung của process (None nếu bị tắt)"""
+    global _router
+    if not MODEL_ROUTING_ENABLED:
+        return None
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
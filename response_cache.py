@@ -0,0 +1,140 @@
+# response_cache.py
+# Cache câu trả lời cho các request chat có tính xác định (LRU + TTL)
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from config import (
+    RESPONSE_CACHE_ENABLED,
+    RESPONSE_CACHE_MAX_ENTRIES,
+    RESPONSE_CACHE_MAX_BYTES,
+    RESPONSE_CACHE_TTL,
+)
+
+
+def _normalize_text(text: str) -> str:
+    """Bỏ khoảng trắng thừa để các câu hỏi chỉ khác nhau về dấu cách dùng chung cache"""
+    return " ".join(text.split())
+
+
+def make_cache_key(
+    model: str,
+    system_prompt: str,
+    messages: List[Dict],
+    options: Dict
+) -> str:
+    """Tạo key cache từ model, system prompt, messages và options"""
+    normalized = [
+        {"role": m["role"], "content": _normalize_text(m["content"])}
+        for m in messages
+    ]
+    raw = json.dumps(
+        [model, _normalize_text(system_prompt), normalized, options],
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(',', ':')
+    )
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache LRU có TTL và giới hạn bộ nhớ, an toàn đa luồng
+
+    Dung lượng được ước lượng theo số byte UTF-8 của câu trả lời và key.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+        ttl: float = RESPONSE_CACHE_TTL
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, expires_at, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """Lấy câu trả lời đã cache (None nếu không có hoặc đã hết hạn)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires_at, size = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: str, value: str):
+        """Lưu câu trả lời, loại bỏ entry cũ nhất khi vượt giới hạn"""
+        size = len(value.encode('utf-8')) + len(key)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl, size)
+            self._bytes += size
+
+            while (len(self._entries) > self.max_entries
+                   or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        """Xóa toàn bộ cache"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        """Thống kê hit/miss và dung lượng"""
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions
+        }
+
+
+_cache: Optional[ResponseCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Lấy cache dùng chung của process (None nếu cache bị tắt)"""
+    global _cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache()
+    return _cache
@@ -0,0 +1,278 @@
+# scheduler.py
+# Kiểm soát tải trước khi gọi Ollama: giới hạn đồng thời + hàng đợi ưu tiên
+
+import asyncio
+import heapq
+import itertools
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+from config import (
+    OLLAMA_BACKENDS,
+    ADMISSION_ENABLED,
+    ADMISSION_MAX_CONCURRENCY,
+    ADMISSION_MAX_QUEUE,
+    ADMISSION_QUEUE_TIMEOUT,
+)
+from errors import QueueFullError, QueueTimeoutError
+
+# Số nhỏ hơn = ưu tiên cao hơn
+PRIORITY_INTERACTIVE = 0    # /api/chat, /api/chat/stream
+PRIORITY_BATCH = 10         # /api/batch, job nền
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: 'interactive',
+    PRIORITY_BATCH: 'batch',
+}
+
+# Hệ số làm mượt khi ước lượng thời gian xử lý / thời gian chờ trung bình
+_EWMA_ALPHA = 0.2
+
+
+class _Waiter:
+    """Một request đang chờ trong hàng đợi"""
+
+    __slots__ = ('priority', 'event', 'granted', 'rejected')
+
+    def __init__(self, priority: int, event=None):
+        self.priority = priority
+        self.event = event if event is not None else threading.Event()
+        self.granted = False
+        self.rejected = False
+
+
+class _LoopEvent:
+    """Giống threading.Event.set() nhưng đánh thức coroutine đang chờ trong event loop"""
+
+    __slots__ = ('_loop', 'future')
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self._loop = loop
+        self.future = loop.create_future()
+
+    def set(self):
+        # release() có thể được gọi từ thread khác
+        self._loop.call_soon_threadsafe(self._set)
+
+    def _set(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdmissionController:
+    """
+    Giới hạn số request chạy đồng thời tới Ollama
+
+    - Tối đa `max_concurrency` request được chạy cùng lúc
+    - Request vượt mức vào hàng đợi ưu tiên (tối đa `max_queue` chỗ);
+      cùng mức ưu tiên thì vào trước ra trước
+    - Hàng đợi đầy: request mới bị từ chối ngay (QueueFullError), trừ khi nó
+      ưu tiên cao hơn request tệ nhất đang chờ - khi đó request kia bị đẩy ra
+    - Chờ quá `queue_timeout` giây: QueueTimeoutError
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+        max_queue: int = ADMISSION_MAX_QUEUE,
+        queue_timeout: float = ADMISSION_QUEUE_TIMEOUT
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._queue = []  # heap (priority, seq, waiter)
+        self._seq = itertools.count()
+        self._queued = 0
+        self.active = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.avg_wait = 0.0
+        self.max_wait = 0.0
+        self.avg_service_time = 1.0
+
+    def expected_wait(self) -> float:
+        """Thời gian chờ ước lượng (giây) của request mới vào hàng đợi lúc này"""
+        if self.active < self.max_concurrency and self._queued == 0:
+            return 0.0
+        return (self._queued + 1) / max(self.max_concurrency, 1) * self.avg_service_time
+
+    def retry_after(self) -> int:
+        """Ước lượng số giây nên chờ trước khi thử lại"""
+        backlog = (self._queued + 1) / max(self.max_concurrency, 1)
+        return max(1, min(60, math.ceil(backlog * self.avg_service_time)))
+
+    def _enqueue(self, waiter: _Waiter) -> bool:
+        """Nhận ngay (True) hoặc đưa waiter vào hàng đợi (False), raise nếu hàng đợi đầy"""
+        with self._lock:
+            if self.active < self.max_concurrency and self._queued == 0:
+                self.active += 1
+                self.admitted += 1
+                self._record_wait(0.0)
+                return True
+
+            if self._queued >= self.max_queue and not self._displace(waiter.priority):
+                self.rejected += 1
+                raise QueueFullError("Hàng đợi đã đầy", self.retry_after())
+
+            heapq.heappush(self._queue, (waiter.priority, next(self._seq), waiter))
+            self._queued += 1
+            return False
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None):
+        """Chờ tới lượt chạy, raise QueueFullError / QueueTimeoutError nếu quá tải"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        waiter = _Waiter(priority)
+        if self._enqueue(waiter):
+            return
+        waiter.event.wait(timeout)
+        self._finish_wait(waiter, start)
+
+    async def acquire_async(
+        self,
+        priority: int = PRIORITY_INTERACTIVE,
+        timeout: Optional[float] = None
+    ):
+        """Giống acquire() nhưng chờ trong event loop, không chặn thread"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        event = _LoopEvent(asyncio.get_running_loop())
+        waiter = _Waiter(priority, event)
+        if self._enqueue(waiter):
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(event.future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            # Client bỏ đi khi đang chờ: rời hàng đợi, trả lượt nếu vừa được nhận
+            with self._lock:
+                granted = waiter.granted
+                if not granted and not waiter.rejected:
+                    waiter.rejected = True
+                    self._queued -= 1
+            if granted:
+                self.release()
+            raise
+        self._finish_wait(waiter, start)
+
+    def _finish_wait(self, waiter: _Waiter, start: float):
+        with self._lock:
+            if waiter.granted:
+                self._record_wait(time.monotonic() - start)
+                return
+            if waiter.rejected:
+                raise QueueFullError("Bị đẩy khỏi hàng đợi bởi request ưu tiên cao hơn",
+                                     self.retry_after())
+            # Hết thời gian chờ: bỏ khỏi hàng đợi (xóa lười khi pop)
+            waiter.rejected = True
+            self._queued -= 1
+            self.timed_out += 1
+            raise QueueTimeoutError("Chờ trong hàng đợi quá lâu", self.retry_after())
+
+    def release(self, service_time: Optional[float] = None):
+        """Trả lượt chạy, nhường cho request ưu tiên nhất đang chờ"""
+        with self._lock:
+            if service_time is not None:
+                self.avg_service_time += _EWMA_ALPHA * (service_time - self.avg_service_time)
+
+            while self._queue:
+                _, _, waiter = heapq.heappop(self._queue)
+                if waiter.rejected:
+                    continue
+                self._queued -= 1
+                self.admitted += 1
+                waiter.granted = True
+                waiter.event.set()
+                return
+            self.active -= 1
+
+    @contextmanager
+    def slot(self, priority: int = PRIORITY_INTERACTIVE) -> Iterator[None]:
+        """with scheduler.slot(priority): ... - giữ một lượt chạy trong khối lệnh"""
+        self.acquire(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    @asynccontextmanager
+    async def slot_async(self, priority: int = PRIORITY_INTERACTIVE) -> AsyncIterator[None]:
+        """async with scheduler.slot_async(priority): ... - bản async của slot()"""
+        await self.acquire_async(priority)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - start)
+
+    def _displace(self, priority: int) -> bool:
+        """Đẩy request chờ có ưu tiên thấp nhất ra nếu nó kém hơn `priority`"""
+        worst = None
+        for entry in self._queue:
+            waiter = entry[2]
+            if waiter.rejected:
+                continue
+            if worst is None or entry[:2] > worst[:2]:
+                worst = entry
+        if worst is None or worst[0] <= priority:
+            return False
+
+        waiter = worst[2]
+        waiter.rejected = True
+        self._queued -= 1
+        self.rejected += 1
+        waiter.event.set()
+        return True
+
+    def _record_wait(self, wait: float):
+        self.avg_wait += _EWMA_ALPHA * (wait - self.avg_wait)
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> Dict:
+        """Độ sâu hàng đợi, thời gian chờ và số request bị từ chối"""
+        with self._lock:
+            by_priority: Dict[str, int] = {}
+            for priority, _, waiter in self._queue:
+                if not waiter.rejected:
+                    name = PRIORITY_NAMES.get(priority, str(priority))
+                    by_priority[name] = by_priority.get(name, 0) + 1
+
+        return {
+            'active': self.active,
+            'max_concurrency': self.max_concurrency,
+            'queued': self._queued,
+            'queued_by_priority': by_priority,
+            'max_queue': self.max_queue,
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out,
+            'avg_wait': round(self.avg_wait, 3),
+            'max_wait': round(self.max_wait, 3),
+            'avg_service_time': round(self.avg_service_time, 3)
+        }
+
+
+_scheduler: Optional[AdmissionController] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Optional[AdmissionController]:
+    """Lấy bộ kiểm soát tải dùng chung của process (None nếu bị tắt)"""
+    global _scheduler
+    if not ADMISSION_ENABLED:
+        return None
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                # Giới hạn tăng theo số backend để thông lượng tăng khi thêm backend
+                _scheduler = AdmissionController(
+                    max_concurrency=ADMISSION_MAX_CONCURRENCY * len(OLLAMA_BACKENDS)
+                )
+    return _scheduler
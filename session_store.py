@@ -0,0 +1,216 @@
+# session_store.py
+# Lưu trữ session có giới hạn: hết hạn theo thời gian rảnh (TTL) và loại bỏ LRU
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+from config import (
+    SESSION_BACKEND,
+    SESSION_IDLE_TTL,
+    SESSION_MAX_SESSIONS,
+    SESSION_SWEEP_INTERVAL,
+)
+from deepseek_client import DeepSeekClient
+
+
+class BaseSessionStore:
+    """
+    Giao diện chung của các backend lưu session
+
+    Mỗi session là dict {'client', 'created_at', 'last_active'}. Sau mỗi lượt
+    chat có dùng lịch sử, gọi save(session_id) để backend lưu phần lịch sử mới.
+    """
+
+    sweep_interval: float = SESSION_SWEEP_INTERVAL
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def create(self) -> Tuple[str, Dict]:
+        raise NotImplementedError
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Tuple[str, Dict]:
+        raise NotImplementedError
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def delete(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def clear_history(self, session_id: str) -> bool:
+        raise NotImplementedError
+
+    def save(self, session_id: str):
+        """Lưu lịch sử mới của session (backend trong bộ nhớ không cần làm gì)"""
+
+    def sweep(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict:
+        raise NotImplementedError
+
+    def start_sweeper(self):
+        """Chạy thread nền dọn session hết hạn (gọi nhiều lần không sao)"""
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        self._stop.clear()
+        self._sweeper = threading.Thread(
+            target=self._sweep_loop,
+            name='session-sweeper',
+            daemon=True
+        )
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._stop.set()
+
+    def _sweep_loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            self.sweep()
+
+    def __contains__(self, session_id: str) -> bool:
+        return self.get(session_id) is not None
+
+
+class SessionStore(BaseSessionStore):
+    """
+    Kho session trong bộ nhớ, an toàn đa luồng
+
+    Mỗi session là dict {'client', 'created_at', 'last_active'}.
+    - Session không hoạt động quá `idle_ttl` giây bị xóa
+    - Khi vượt `max_sessions`, session ít dùng gần đây nhất bị loại
+    - Thread nền dọn session hết hạn mỗi `sweep_interval` giây
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable[[], DeepSeekClient] = DeepSeekClient,
+        idle_ttl: float = SESSION_IDLE_TTL,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        sweep_interval: float = SESSION_SWEEP_INTERVAL
+    ):
+        super().__init__()
+        self.client_factory = client_factory
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _new_session(self, session_id: str) -> Dict:
+        now = time.time()
+        session = {
+            'client': self.client_factory(),
+            'created_at': now,
+            'last_active': now
+        }
+        self._sessions[session_id] = session
+        self.created += 1
+
+        # Vượt giới hạn: loại session ít dùng gần đây nhất
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+        return session
+
+    def _is_expired(self, session: Dict, now: float) -> bool:
+        return now - session['last_active'] > self.idle_ttl
+
+    def create(self) -> Tuple[str, Dict]:
+        """Tạo session mới"""
+        session_id = secrets.token_hex(16)
+        with self._lock:
+            return session_id, self._new_session(session_id)
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Tuple[str, Dict]:
+        """Lấy session (cập nhật last_active) hoặc tạo mới nếu chưa có / đã hết hạn"""
+        if not session_id:
+            session_id = secrets.token_hex(16)
+
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and self._is_expired(session, now):
+                del self._sessions[session_id]
+                self.expired += 1
+                session = None
+
+            if session is None:
+                session = self._new_session(session_id)
+            else:
+                session['last_active'] = now
+                self._sessions.move_to_end(session_id)
+            return session_id, session
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """Lấy session đang còn hạn (không cập nhật last_active)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and self._is_expired(session, time.time()):
+                del self._sessions[session_id]
+                self.expired += 1
+                return None
+            return session
+
+    def delete(self, session_id: str) -> bool:
+        """Xóa session, trả về False nếu không tồn tại"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def clear_history(self, session_id: str) -> bool:
+        """Xóa lịch sử chat của session, trả về False nếu không tồn tại"""
+        session = self.get(session_id)
+        if session is None:
+            return False
+        session['client'].clear_history()
+        return True
+
+    def sweep(self) -> int:
+        """Xóa các session hết hạn, trả về số session đã xóa"""
+        cutoff = time.time() - self.idle_ttl
+        removed = 0
+        with self._lock:
+            # OrderedDict xếp theo thứ tự dùng gần nhất: dừng ở session còn hạn đầu tiên
+            for session_id, session in list(self._sessions.items()):
+                if session['last_active'] >= cutoff:
+                    break
+                del self._sessions[session_id]
+                removed += 1
+            self.expired += removed
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict:
+        """Thống kê số session và số lần xóa/loại bỏ"""
+        return {
+            'backend': 'memory',
+            'active': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'idle_ttl': self.idle_ttl,
+            'created': self.created,
+            'expired': self.expired,
+            'evicted': self.evicted
+        }
+
+
+def create_session_store(
+    backend: str = SESSION_BACKEND,
+    client_factory: Callable[[], DeepSeekClient] = DeepSeekClient
+) -> BaseSessionStore:
+    """Tạo kho session theo cấu hình: "memory" hoặc "sqlite" (dùng chung giữa nhiều worker)"""
+    if backend == "sqlite":
+        from sqlite_session_store import SQLiteSessionStore
+        return SQLiteSessionStore(client_factory=client_factory)
+    if backend == "memory":
+        return SessionStore(client_factory=client_factory)
+    raise ValueError(f"Session backend không hợp lệ: {backend}")
@@ -0,0 +1,214 @@
+# singleflight.py
+# Gộp các request giống hệt nhau đang chạy đồng thời thành một lần gọi model
+
+import threading
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from config import SINGLEFLIGHT_ENABLED, SINGLEFLIGHT_WAIT_TIMEOUT
+from streaming import AbortHandle
+
+
+class _Call:
+    """Một lần gọi đang chạy (không streaming)"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class _Broadcast:
+    """Một stream đang chạy, phát lại cho nhiều subscriber"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.events: List[Any] = []
+        self.error: Optional[BaseException] = None
+        self.finished = False
+        self.cancelled = False
+        self.subscribers = 0
+        # Cắt stream gốc khi subscriber cuối cùng rời đi
+        self.abort = AbortHandle()
+
+
+class SingleFlight:
+    """
+    Gộp các lời gọi cùng key đang chạy đồng thời
+
+    - do(key, fn): lời gọi đầu tiên (leader) chạy fn, các lời gọi cùng key
+      tới trong lúc đó chờ (có giới hạn) và nhận chung kết quả (hoặc exception)
+    - stream(key, factory): một thread nền đọc stream từ factory(abort), mọi
+      subscriber cùng key nhận đủ các phần tử từ đầu. Khi không còn
+      subscriber nào, abort.abort() được gọi để cắt stream gốc ngay.
+    """
+
+    def __init__(self, wait_timeout: Optional[float] = SINGLEFLIGHT_WAIT_TIMEOUT):
+        self.wait_timeout = wait_timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any],
+           timeout: Optional[float] = None) -> Tuple[Any, bool]:
+        """
+        Chạy fn một lần cho mỗi nhóm lời gọi cùng key
+
+        Args:
+            timeout: Số giây tối đa follower chờ leader (None = wait_timeout)
+
+        Returns:
+            (kết quả, True nếu dùng chung kết quả của lời gọi khác)
+
+        Raises:
+            TimeoutError: Follower chờ quá timeout mà leader chưa xong
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(self.wait_timeout if timeout is None else timeout):
+                raise TimeoutError("Hết thời gian chờ request giống hệt đang chạy")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stream(self, key: str, factory: Callable[[AbortHandle], Iterator[Any]],
+               abort: Optional[AbortHandle] = None) -> Iterator[Any]:
+        """
+        Đăng ký nhận stream cùng key, khởi động stream mới nếu chưa có
+
+        Args:
+            factory: Tạo stream gốc; nhận AbortHandle dùng để cắt stream đó
+            abort: Handle của subscriber này; abort() từ thread khác làm
+                subscriber thôi chờ và rời khỏi stream ngay
+        """
+        with self._lock:
+            broadcast = self._streams.get(key)
+            if broadcast is None:
+                broadcast = _Broadcast()
+                self._streams[key] = broadcast
+                self.leaders += 1
+                threading.Thread(
+                    target=self._pump,
+                    args=(key, broadcast, factory),
+                    name='singleflight-stream',
+                    daemon=True
+                ).start()
+            else:
+                self.coalesced += 1
+            broadcast.subscribers += 1
+        return self._subscribe(key, broadcast, abort)
+
+    def _pump(self, key: str, broadcast: _Broadcast,
+              factory: Callable[[AbortHandle], Iterator[Any]]):
+        """Đọc stream gốc và phát cho các subscriber"""
+        source = None
+        try:
+            source = factory(broadcast.abort)
+            for item in source:
+                if broadcast.cancelled:
+                    break
+                with broadcast.cond:
+                    broadcast.events.append(item)
+                    broadcast.cond.notify_all()
+        except Exception as e:
+            broadcast.error = e
+        finally:
+            if source is not None and hasattr(source, 'close'):
+                source.close()
+            with self._lock:
+                if self._streams.get(key) is broadcast:
+                    del self._streams[key]
+            with broadcast.cond:
+                broadcast.finished = True
+                broadcast.cond.notify_all()
+
+    def _subscribe(self, key: str, broadcast: _Broadcast,
+                   abort: Optional[AbortHandle] = None) -> Iterator[Any]:
+        position = 0
+        left = threading.Event()
+
+        def leave():
+            left.set()
+            with broadcast.cond:
+                broadcast.cond.notify_all()
+
+        if abort is not None:
+            abort.add(leave)
+        try:
+            while True:
+                with broadcast.cond:
+                    while (position >= len(broadcast.events) and not broadcast.finished
+                           and not left.is_set()):
+                        broadcast.cond.wait()
+                    if left.is_set():
+                        return
+                    pending = broadcast.events[position:]
+                    position = len(broadcast.events)
+                    finished = broadcast.finished
+
+                for item in pending:
+                    yield item
+
+                if finished and position >= len(broadcast.events):
+                    if broadcast.error is not None:
+                        raise broadcast.error
+                    return
+        finally:
+            if abort is not None:
+                abort.remove(leave)
+            with self._lock:
+                broadcast.subscribers -= 1
+                cancel = broadcast.subscribers == 0 and not broadcast.finished
+                if cancel:
+                    # Không còn ai nghe: dừng stream gốc, request sau sẽ tạo stream mới
+                    broadcast.cancelled = True
+                    if self._streams.get(key) is broadcast:
+                        del self._streams[key]
+            if cancel:
+                # Không chờ phần tử tiếp theo mới dừng: cắt luôn kết nối của stream gốc
+                broadcast.abort.abort()
+
+    def stats(self) -> Dict:
+        """Số lần gọi thật (leader) và số lần được gộp"""
+        return {
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._calls) + len(self._streams)
+        }
+
+
+_singleflight: Optional[SingleFlight] = None
+_singleflight_lock = threading.Lock()
+
+
+def get_singleflight() -> Optional[SingleFlight]:
+    """Lấy SingleFlight dùng chung của process (None nếu bị tắt)"""
+    global _singleflight
+    if not SINGLEFLIGHT_ENABLED:
+        return None
+    if _singleflight is None:
+        with _singleflight_lock:
+            if _singleflight is None:
+                _singleflight = SingleFlight()
+    return _singleflight
@@ -0,0 +1,296 @@
+# sqlite_session_store.py
+# Backend session dùng SQLite (WAL) để nhiều worker process dùng chung session
+
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from config import (
+    SESSION_DB_PATH,
+    SESSION_IDLE_TTL,
+    SESSION_MAX_SESSIONS,
+    SESSION_SWEEP_INTERVAL,
+)
+from deepseek_client import DeepSeekClient
+from session_store import BaseSessionStore
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id    TEXT PRIMARY KEY,
+    created_at    REAL NOT NULL,
+    last_active   REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_last_active ON sessions (last_active);
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq        INTEGER NOT NULL,
+    role       TEXT NOT NULL,
+    content    TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+"""
+
+# Câu lệnh cố định có tham số: sqlite3 cache statement đã biên dịch theo từng kết nối
+_SELECT_SESSION = "SELECT created_at, last_active, message_count FROM sessions WHERE session_id = ?"
+_INSERT_SESSION = "INSERT OR REPLACE INTO sessions (session_id, created_at, last_active, message_count) VALUES (?, ?, ?, 0)"
+_TOUCH_SESSION = "UPDATE sessions SET last_active = ? WHERE session_id = ?"
+_UPDATE_COUNT = "UPDATE sessions SET message_count = ?, last_active = ? WHERE session_id = ?"
+_DELETE_SESSION = "DELETE FROM sessions WHERE session_id = ?"
+_SELECT_MESSAGES_FROM = "SELECT role, content FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq"
+_INSERT_MESSAGE = "INSERT OR REPLACE INTO messages (session_id, seq, role, content) VALUES (?, ?, ?, ?)"
+_DELETE_MESSAGES = "DELETE FROM messages WHERE session_id = ?"
+_COUNT_SESSIONS = "SELECT COUNT(*) FROM sessions"
+_SELECT_EXPIRED = "SELECT session_id FROM sessions WHERE last_active < ?"
+_SELECT_OLDEST = "SELECT session_id FROM sessions ORDER BY last_active LIMIT ?"
+
+
+class SQLiteSessionStore(BaseSessionStore):
+    """
+    Kho session lưu trong SQLite, dùng chung giữa nhiều worker process
+
+    - Metadata và lịch sử hội thoại nằm trong DB (chế độ WAL)
+    - Mỗi worker giữ bản sao client trong bộ nhớ và chỉ đọc thêm các tin
+      nhắn mới (seq >= số tin đã có), không tải lại toàn bộ lịch sử
+    - save() chỉ ghi thêm các tin nhắn mới của lượt chat vừa xong
+    """
+
+    def __init__(
+        self,
+        db_path: str = SESSION_DB_PATH,
+        client_factory: Callable[[], DeepSeekClient] = DeepSeekClient,
+        idle_ttl: float = SESSION_IDLE_TTL,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        sweep_interval: float = SESSION_SWEEP_INTERVAL
+    ):
+        super().__init__()
+        self.db_path = db_path
+        self.client_factory = client_factory
+        self.idle_ttl = idle_ttl
+        self.max_sessions = max_sessions
+        self.sweep_interval = sweep_interval
+        self._local = threading.local()
+        # Bản sao trong bộ nhớ của worker này: session_id -> session dict
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Kết nối SQLite riêng cho từng thread"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _cache_put(self, session_id: str, session: Dict):
+        with self._lock:
+            self._cache[session_id] = session
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_sessions:
+                self._cache.popitem(last=False)
+
+    def _cache_drop(self, session_id: str):
+        with self._lock:
+            self._cache.pop(session_id, None)
+
+    def _new_session(self, conn: sqlite3.Connection, session_id: str, now: float) -> Dict:
+        conn.execute(_DELETE_MESSAGES, (session_id,))
+        conn.execute(_INSERT_SESSION, (session_id, now, now))
+        session = {
+            'client': self.client_factory(),
+            'created_at': now,
+            'last_active': now,
+            'synced': 0
+        }
+        self._cache_put(session_id, session)
+        self.created += 1
+        return session
+
+    def _load(self, conn: sqlite3.Connection, session_id: str, row: Tuple) -> Dict:
+        """Đồng bộ bản sao trong bộ nhớ với DB (chỉ đọc các tin nhắn mới)"""
+        created_at, last_active, message_count = row
+        with self._lock:
+            session = self._cache.get(session_id)
+
+        if session is None or session['synced'] > message_count:
+            session = {
+                'client': self.client_factory(),
+                'created_at': created_at,
+                'synced': 0
+            }
+
+        if session['synced'] < message_count:
+            rows = conn.execute(_SELECT_MESSAGES_FROM, (session_id, session['synced'])).fetchall()
+            session['client'].conversation_history.extend(
+                {"role": role, "content": content} for role, content in rows
+            )
+            session['synced'] += len(rows)
+
+        session['last_active'] = last_active
+        self._cache_put(session_id, session)
+        return session
+
+    def create(self) -> Tuple[str, Dict]:
+        """Tạo session mới"""
+        session_id = secrets.token_hex(16)
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            return session_id, self._new_session(conn, session_id, time.time())
+
+    def get_or_create(self, session_id: Optional[str] = None) -> Tuple[str, Dict]:
+        """Lấy session (cập nhật last_active) hoặc tạo mới nếu chưa có / đã hết hạn"""
+        if not session_id:
+            session_id = secrets.token_hex(16)
+
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(_SELECT_SESSION, (session_id,)).fetchone()
+            if row is not None and now - row[1] > self.idle_ttl:
+                self.expired += 1
+                row = None
+
+            if row is None:
+                session = self._new_session(conn, session_id, now)
+            else:
+                conn.execute(_TOUCH_SESSION, (now, session_id))
+                session = self._load(conn, session_id, row)
+                session['last_active'] = now
+        return session_id, session
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        """Lấy session đang còn hạn (không cập nhật last_active)"""
+        conn = self._connection()
+        row = conn.execute(_SELECT_SESSION, (session_id,)).fetchone()
+        if row is None or time.time() - row[1] > self.idle_ttl:
+            return None
+        return self._load(conn, session_id, row)
+
+    def delete(self, session_id: str) -> bool:
+        """Xóa session, trả về False nếu không tồn tại"""
+        self._cache_drop(session_id)
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(_DELETE_MESSAGES, (session_id,))
+            return conn.execute(_DELETE_SESSION, (session_id,)).rowcount > 0
+
+    def clear_history(self, session_id: str) -> bool:
+        """Xóa lịch sử chat của session, trả về False nếu không tồn tại"""
+        session = self.get(session_id)
+        if session is None:
+            return False
+
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(_DELETE_MESSAGES, (session_id,))
+            conn.execute(_UPDATE_COUNT, (0, time.time(), session_id))
+        session['client'].clear_history()
+        session['synced'] = 0
+        return True
+
+    def save(self, session_id: str):
+        """
+        Ghi thêm các tin nhắn mới của session vào DB
+
+        Đọc message_count, so sánh và ghi nối nằm trong cùng một transaction
+        BEGIN IMMEDIATE. Nếu worker khác đã ghi thêm kể từ lần đồng bộ trước
+        (message_count khác synced), tin nhắn mới được nối sau phần của
+        worker kia thay vì ghi đè, và bản sao trong bộ nhớ bị bỏ để lần sau
+        nạp lại từ DB.
+        """
+        with self._lock:
+            session = self._cache.get(session_id)
+        if session is None:
+            return
+
+        history: List[Dict] = session['client'].get_history()
+        synced = session['synced']
+        rewrite = len(history) < synced
+        if rewrite:
+            # Lịch sử bị xóa trực tiếp trên client: ghi lại từ đầu
+            synced = 0
+
+        new_messages = history[synced:]
+        now = time.time()
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(_SELECT_SESSION, (session_id,)).fetchone()
+            if row is None:
+                # Session đã bị xóa / hết hạn ở worker khác
+                stale = True
+            else:
+                stored = 0 if rewrite else row[2]
+                stale = stored != synced
+                if rewrite:
+                    conn.execute(_DELETE_MESSAGES, (session_id,))
+                conn.executemany(
+                    _INSERT_MESSAGE,
+                    [
+                        (session_id, stored + i, m["role"], m["content"])
+                        for i, m in enumerate(new_messages)
+                    ]
+                )
+                conn.execute(_UPDATE_COUNT, (stored + len(new_messages), now, session_id))
+
+        if stale:
+            self._cache_drop(session_id)
+            return
+        session['synced'] = len(history)
+        session['last_active'] = now
+
+    def _delete_many(self, conn: sqlite3.Connection, session_ids: List[str]):
+        for session_id in session_ids:
+            conn.execute(_DELETE_MESSAGES, (session_id,))
+            conn.execute(_DELETE_SESSION, (session_id,))
+            self._cache_drop(session_id)
+
+    def sweep(self) -> int:
+        """Xóa session hết hạn và session cũ nhất khi vượt giới hạn"""
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            expired = [row[0] for row in conn.execute(
+                _SELECT_EXPIRED, (time.time() - self.idle_ttl,)
+            )]
+            self._delete_many(conn, expired)
+
+            overflow = conn.execute(_COUNT_SESSIONS).fetchone()[0] - self.max_sessions
+            evicted = []
+            if overflow > 0:
+                evicted = [row[0] for row in conn.execute(_SELECT_OLDEST, (overflow,))]
+                self._delete_many(conn, evicted)
+
+        self.expired += len(expired)
+        self.evicted += len(evicted)
+        return len(expired) + len(evicted)
+
+    def __len__(self) -> int:
+        return self._connection().execute(_COUNT_SESSIONS).fetchone()[0]
+
+    def stats(self) -> Dict:
+        """Thống kê số session (toàn DB) và số lần xóa/loại bỏ (của worker này)"""
+        return {
+            'backend': 'sqlite',
+            'active': len(self),
+            'cached_in_worker': len(self._cache),
+            'max_sessions': self.max_sessions,
+            'idle_ttl': self.idle_ttl,
+            'created': self.created,
+            'expired': self.expired,
+            'evicted': self.evicted
+        }
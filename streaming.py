@@ -0,0 +1,356 @@
+# streaming.py
+# Pipeline streaming: giải mã NDJSON của Ollama theo từng khối byte và gộp token trước khi gửi cho client
+
+import asyncio
+import json
+import queue
+import threading
+import time
+from typing import AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional
+
+from config import (
+    STREAM_JSON_BACKEND,
+    STREAM_COALESCE_MAX_DELAY,
+    STREAM_COALESCE_MAX_BYTES,
+)
+
+try:
+    import orjson
+except ImportError:  # orjson là tùy chọn, không có thì dùng json chuẩn
+    orjson = None
+
+
+# ============================================================================
+# JSON BACKEND
+# ============================================================================
+
+def _json_dumps(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False)
+
+
+def _orjson_dumps(obj) -> str:
+    return orjson.dumps(obj).decode("utf-8")
+
+
+# Tên backend -> (loads, dumps); loads nhận bytes hoặc str, dumps trả về str
+JSON_BACKENDS: Dict[str, tuple] = {"json": (json.loads, _json_dumps)}
+if orjson is not None:
+    JSON_BACKENDS["orjson"] = (orjson.loads, _orjson_dumps)
+
+_loads: Callable = json.loads
+_dumps: Callable[[object], str] = _json_dumps
+json_backend = "json"
+
+
+def set_json_backend(name: str):
+    """
+    Chọn thư viện JSON cho streaming: "orjson", "json" hoặc "auto"
+    ("auto" = orjson nếu đã cài, không thì json chuẩn)
+    """
+    global _loads, _dumps, json_backend
+    if name == "auto":
+        name = "orjson" if "orjson" in JSON_BACKENDS else "json"
+    if name not in JSON_BACKENDS:
+        raise ValueError(f"JSON backend không khả dụng: {name}")
+    _loads, _dumps = JSON_BACKENDS[name]
+    json_backend = name
+
+
+def loads(data):
+    return _loads(data)
+
+
+def dumps(obj) -> str:
+    return _dumps(obj)
+
+
+set_json_backend(STREAM_JSON_BACKEND)
+
+
+# ============================================================================
+# NDJSON
+# ============================================================================
+
+class NDJSONDecoder:
+    """
+    Giải mã NDJSON tăng dần: nhận từng khối byte từ mạng (có thể cắt ngang
+    một dòng hoặc chứa nhiều dòng), trả về các object đã đủ dòng
+    """
+
+    def __init__(self):
+        self._buffer = b""
+
+    def feed(self, chunk: bytes) -> List[Dict]:
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            self._buffer += chunk
+            return []
+        data = self._buffer + chunk[:end] if self._buffer else chunk[:end]
+        self._buffer = chunk[end + 1:]
+        return [loads(line) for line in data.split(b"\n") if line.strip()]
+
+    def close(self) -> List[Dict]:
+        """Phần còn lại khi stream kết thúc (dòng cuối không có xuống dòng)"""
+        data, self._buffer = self._buffer, b""
+        return [loads(data)] if data.strip() else []
+
+
+def iter_ndjson(chunks: Iterable[bytes]) -> Iterator[Dict]:
+    """Các object NDJSON từ một dãy khối byte (ví dụ response.iter_content())"""
+    decoder = NDJSONDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.close()
+
+
+async def aiter_ndjson(chunks: AsyncIterable[bytes]) -> AsyncIterator[Dict]:
+    """Giống iter_ndjson cho aiohttp (response.content.iter_any())"""
+    decoder = NDJSONDecoder()
+    async for chunk in chunks:
+        for data in decoder.feed(chunk):
+            yield data
+    for data in decoder.close():
+        yield data
+
+
+# ============================================================================
+# GỘP TOKEN
+# ============================================================================
+
+class TokenCoalescer:
+    """
+    Gộp các token liên tiếp thành một lần gửi
+
+    Token đến khi đã lâu chưa gửi gì (quá `max_delay` giây) được gửi ngay -
+    nên token đầu tiên không bị chậm. Các token đến sau đó được giữ lại và
+    gửi cùng nhau khi đủ `max_bytes` byte hoặc tới hạn `deadline`.
+    """
+
+    def __init__(
+        self,
+        max_delay: float = STREAM_COALESCE_MAX_DELAY,
+        max_bytes: int = STREAM_COALESCE_MAX_BYTES
+    ):
+        self.max_delay = max_delay
+        self.max_bytes = max_bytes
+        self._parts: List[str] = []
+        self._size = 0
+        self._last_flush: Optional[float] = None
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """Thời điểm (time.monotonic) phải gửi phần đang giữ, None nếu không giữ gì"""
+        if not self._parts:
+            return None
+        return self._last_flush + self.max_delay
+
+    def add(self, content: str, now: float) -> Optional[str]:
+        """Thêm một token, trả về chuỗi cần gửi ngay (nếu có)"""
+        self._parts.append(content)
+        self._size += len(content.encode("utf-8"))
+        if (self._last_flush is None
+                or now - self._last_flush >= self.max_delay
+                or self._size >= self.max_bytes):
+            return self.flush(now)
+        return None
+
+    def flush(self, now: float) -> Optional[str]:
+        """Lấy toàn bộ phần đang giữ"""
+        self._last_flush = now
+        if not self._parts:
+            return None
+        text = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        return text
+
+
+class AbortHandle:
+    """
+    Hủy một stream đang đọc dở từ thread khác
+
+    Nơi đọc stream đăng ký callback (ví dụ cắt socket của response tới
+    Ollama) bằng add() và gỡ bằng remove() khi đọc xong; abort() gọi mọi
+    callback đang đăng ký. Callback đăng ký sau khi đã abort() được gọi ngay.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.aborted = False
+
+    def add(self, callback: Callable[[], None]):
+        with self._lock:
+            if not self.aborted:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def abort(self):
+        with self._lock:
+            self.aborted = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+_END = object()
+
+
+def coalesce_events(
+    events: Iterator[Dict],
+    max_delay: float = STREAM_COALESCE_MAX_DELAY,
+    max_bytes: int = STREAM_COALESCE_MAX_BYTES,
+    abort: Optional[AbortHandle] = None
+) -> Iterator[Dict]:
+    """
+    Gộp các sự kiện {"type": "token"} của chat_stream_events()
+
+    Một thread nền đọc `events` để phần đang giữ được gửi đúng hạn
+    `max_delay` kể cả khi model đang chậm. Các sự kiện khác (done, error)
+    được gửi ngay, sau phần token đang giữ. max_delay <= 0: không gộp.
+
+    Đóng generator trả về sẽ đóng `events`. Thread nền chỉ thấy yêu cầu
+    dừng sau sự kiện tiếp theo, nên truyền thêm `abort` (cùng handle đã
+    đưa cho chat_stream_events) để cắt ngay kết nối tới Ollama và trả lượt
+    chạy cho scheduler.
+    """
+    if max_delay <= 0:
+        return events
+    return _coalesce(events, TokenCoalescer(max_delay, max_bytes), abort)
+
+
+def _coalesce(
+    events: Iterator[Dict],
+    coalescer: TokenCoalescer,
+    abort: Optional[AbortHandle] = None
+) -> Iterator[Dict]:
+    items: "queue.Queue" = queue.Queue()
+    stop = threading.Event()
+
+    def pump():
+        try:
+            for event in events:
+                items.put((event, None))
+                if stop.is_set():
+                    break
+        except BaseException as e:
+            items.put((None, e))
+        finally:
+            close = getattr(events, "close", None)
+            if close is not None:
+                close()
+            items.put(_END)
+
+    threading.Thread(target=pump, name="stream-coalesce", daemon=True).start()
+    finished = False
+    try:
+        while True:
+            deadline = coalescer.deadline
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = items.get(timeout=timeout)
+            except queue.Empty:
+                yield {"type": "token", "content": coalescer.flush(time.monotonic())}
+                continue
+            if item is _END:
+                break
+
+            event, error = item
+            if error is not None:
+                raise error
+            now = time.monotonic()
+            if event.get("type") == "token":
+                text = coalescer.add(event["content"], now)
+                if text:
+                    yield {"type": "token", "content": text}
+                continue
+            text = coalescer.flush(now)
+            if text:
+                yield {"type": "token", "content": text}
+            yield event
+
+        text = coalescer.flush(time.monotonic())
+        if text:
+            yield {"type": "token", "content": text}
+        finished = True
+    finally:
+        stop.set()
+        if not finished and abort is not None:
+            # Consumer bỏ dở (client ngắt kết nối): không chờ sự kiện tiếp theo
+            abort.abort()
+
+
+def acoalesce_events(
+    events: AsyncIterator[Dict],
+    max_delay: float = STREAM_COALESCE_MAX_DELAY,
+    max_bytes: int = STREAM_COALESCE_MAX_BYTES
+) -> AsyncIterator[Dict]:
+    """
+    Bản async của coalesce_events() cho AsyncDeepSeekClient.chat_stream_events()
+
+    Đóng (aclose) generator trả về sẽ hủy luôn việc đọc `events`, nên kết
+    nối tới Ollama được đóng ngay cả khi model đang sinh token chậm.
+    """
+    if max_delay <= 0:
+        return events
+    return _acoalesce(events, TokenCoalescer(max_delay, max_bytes))
+
+
+async def _acoalesce(events: AsyncIterator[Dict], coalescer: TokenCoalescer) -> AsyncIterator[Dict]:
+    items: "asyncio.Queue" = asyncio.Queue()
+
+    async def pump():
+        try:
+            async for event in events:
+                items.put_nowait((event, None))
+        except asyncio.CancelledError:
+            raise
+        except BaseException as e:
+            items.put_nowait((None, e))
+        finally:
+            await events.aclose()
+            items.put_nowait(_END)
+
+    task = asyncio.ensure_future(pump())
+    try:
+        while True:
+            deadline = coalescer.deadline
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = await asyncio.wait_for(items.get(), timeout)
+            except asyncio.TimeoutError:
+                yield {"type": "token", "content": coalescer.flush(time.monotonic())}
+                continue
+            if item is _END:
+                break
+
+            event, error = item
+            if error is not None:
+                raise error
+            now = time.monotonic()
+            if event.get("type") == "token":
+                text = coalescer.add(event["content"], now)
+                if text:
+                    yield {"type": "token", "content": text}
+                continue
+            text = coalescer.flush(now)
+            if text:
+                yield {"type": "token", "content": text}
+            yield event
+
+        text = coalescer.flush(time.monotonic())
+        if text:
+            yield {"type": "token", "content": text}
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
@@ -0,0 +1,209 @@
+# template_index.py
+# Tra cứu nhanh câu trả lời mẫu (QA_TEMPLATES) bằng inverted index n-gram
+
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Optional, Set
+
+from config import QA_TEMPLATES, TEMPLATE_MATCH_THRESHOLD
+
+_NON_WORD = re.compile(r"[^\w]+", re.UNICODE)
+_NGRAM_SIZE = 3
+
+
+class TemplateMatch(NamedTuple):
+    """Kết quả khớp một câu hỏi mẫu"""
+    question: str
+    answer: str
+    score: float
+
+
+def normalize(text: str) -> str:
+    """Chữ thường, bỏ dấu câu và khoảng trắng thừa (giữ dấu tiếng Việt)"""
+    text = unicodedata.normalize('NFC', text.lower())
+    return " ".join(_NON_WORD.sub(" ", text).split())
+
+
+def strip_diacritics(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'mật khẩu' -> 'mat khau', 'đổi' -> 'doi'"""
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    decomposed = unicodedata.normalize('NFD', text)
+    return "".join(c for c in decomposed if unicodedata.category(c) != 'Mn')
+
+
+def has_diacritics(text: str) -> bool:
+    return strip_diacritics(text) != text
+
+
+def ngrams(text: str, n: int = _NGRAM_SIZE) -> Set[str]:
+    """Tập n-gram ký tự (theo từng từ, có đệm biên) cùng các từ nguyên vẹn"""
+    grams = set()
+    for word in text.split():
+        grams.add(word)
+        padded = f" {word} "
+        for i in range(max(len(padded) - n + 1, 1)):
+            grams.add(padded[i:i + n])
+    return grams
+
+
+# Hư từ / từ hỏi không mang nội dung, bỏ qua khi so khớp từng từ
+# (so theo dạng có dấu; từ gõ không dấu thì so theo dạng không dấu)
+_STOPWORDS = frozenset(
+    unicodedata.normalize('NFC', word) for word in (
+        "làm", "sao", "để", "thế", "nào", "như", "gì", "là", "tôi", "mình",
+        "bạn", "có", "được", "cho", "của", "và", "với", "thì", "ạ", "à",
+        "ơi", "nhé", "vậy", "rồi", "giúp", "cách", "trong", "một", "các", "những",
+    )
+)
+_PLAIN_STOPWORDS = frozenset(strip_diacritics(word) for word in _STOPWORDS)
+
+
+class _Token(NamedTuple):
+    """Một từ nội dung đã chuẩn hóa, kèm n-gram dạng có dấu và không dấu"""
+    accented: Set[str]
+    plain: Set[str]
+    has_diacritics: bool
+
+
+def content_tokens(text: str) -> List[_Token]:
+    """
+    Các từ nội dung của câu đã normalize(); nếu câu chỉ toàn hư từ thì
+    giữ nguyên mọi từ
+    """
+    words = text.split()
+    content = [
+        word for word in words
+        if word not in _STOPWORDS
+        and (has_diacritics(word) or word not in _PLAIN_STOPWORDS)
+    ]
+    tokens = []
+    for word in content or words:
+        plain = strip_diacritics(word)
+        tokens.append(_Token(ngrams(word), ngrams(plain), plain != word))
+    return tokens
+
+
+def _dice(a: Set[str], b: Set[str]) -> float:
+    return 2.0 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+def _token_similarity(query: _Token, template: _Token) -> float:
+    """
+    Độ giống giữa một từ của truy vấn và một từ của câu mẫu
+
+    Từ gõ không dấu chỉ so dạng không dấu; từ có dấu lấy trung bình với
+    dạng có dấu, để "mát" không bị coi là trùng "mật". Xét theo từng từ nên
+    câu gõ lẫn có dấu / không dấu ("Tôi quen mat khau") vẫn khớp.
+    """
+    score = _dice(query.plain, template.plain)
+    if query.has_diacritics:
+        score = (score + _dice(query.accented, template.accented)) / 2
+    return score
+
+
+def _coverage(query: List[_Token], template: List[_Token]) -> float:
+    """
+    Điểm khớp của cả câu: điểm của từ khớp kém nhất, xét cả hai chiều
+
+    Mọi từ nội dung của truy vấn phải có từ tương ứng trong câu mẫu và
+    ngược lại, nên "đổi mật khẩu ví" không khớp "đổi mật khẩu".
+    """
+    scores = [[_token_similarity(q, t) for t in template] for q in query]
+    query_side = min(max(row) for row in scores)
+    template_side = min(max(column) for column in zip(*scores))
+    return min(query_side, template_side)
+
+
+class _Field:
+    """Inverted index n-gram không dấu, dùng để lọc nhanh câu mẫu ứng viên"""
+
+    def __init__(self):
+        self.postings: Dict[str, List[int]] = defaultdict(list)
+
+    def add(self, doc_id: int, grams: Set[str]):
+        for gram in grams:
+            self.postings[gram].append(doc_id)
+
+    def candidates(self, grams: Set[str]) -> Set[int]:
+        """Các câu mẫu có chung ít nhất một n-gram với truy vấn"""
+        found: Set[int] = set()
+        for gram in grams:
+            found.update(self.postings.get(gram, ()))
+        return found
+
+
+class ScenarioTemplateIndex:
+    """Index các câu hỏi mẫu của một kịch bản"""
+
+    def __init__(self, templates: List[Dict]):
+        self.templates = templates
+        self._plain = _Field()
+        self._tokens: List[List[_Token]] = []
+        for doc_id, template in enumerate(templates):
+            tokens = content_tokens(normalize(template["question"]))
+            self._tokens.append(tokens)
+            self._plain.add(doc_id, set().union(*(token.plain for token in tokens)))
+
+    def match(self, text: str, threshold: float) -> Optional[TemplateMatch]:
+        """
+        Tìm câu mẫu gần nhất có điểm >= threshold
+
+        Câu mẫu và truy vấn được chuẩn hóa dấu giống nhau; điểm là độ giống
+        của từ nội dung khớp kém nhất (xem _coverage), nên mọi từ nội dung
+        đều phải khớp.
+        """
+        query = normalize(text)
+        if not query:
+            return None
+
+        tokens = content_tokens(query)
+        candidates = self._plain.candidates(set().union(*(token.plain for token in tokens)))
+        if not candidates:
+            return None
+
+        scores = {doc_id: _coverage(tokens, self._tokens[doc_id]) for doc_id in candidates}
+        best_id = max(scores, key=scores.get)
+        best_score = scores[best_id]
+        if best_score < threshold:
+            return None
+
+        template = self.templates[best_id]
+        return TemplateMatch(template["question"], template["answer"], best_score)
+
+
+class TemplateIndex:
+    """Index câu hỏi mẫu cho tất cả kịch bản"""
+
+    def __init__(
+        self,
+        templates: Dict[str, List[Dict]] = QA_TEMPLATES,
+        threshold: float = TEMPLATE_MATCH_THRESHOLD
+    ):
+        self.threshold = threshold
+        self._scenarios = {
+            scenario: ScenarioTemplateIndex(items)
+            for scenario, items in templates.items()
+        }
+
+    def match(self, scenario: str, text: str) -> Optional[TemplateMatch]:
+        """Tìm câu trả lời mẫu cho câu hỏi trong kịch bản"""
+        index = self._scenarios.get(scenario)
+        if index is None:
+            return None
+        return index.match(text, self.threshold)
+
+
+_index: Optional[TemplateIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_template_index() -> TemplateIndex:
+    """Lấy index dùng chung của process (xây dựng lần đầu từ QA_TEMPLATES)"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = TemplateIndex()
+    return _index
@@ -0,0 +1,71 @@
+# tests/conftest.py
+# Fixture dùng chung: Ollama giả lập (mock_ollama) chạy trên cổng trống trong cùng process
+
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from mock_ollama import MockOllamaServer  # noqa: E402
+
+# config đọc OLLAMA_BASE_URL lúc import: server phải chạy trước khi test import module của repo
+_server = MockOllamaServer(port=0, latency=0.01, tokens_per_second=2000.0, response_tokens=8).start()
+os.environ["OLLAMA_BASE_URL"] = _server.base_url
+os.environ.pop("OLLAMA_BACKENDS", None)
+
+_DEFAULTS = {
+    'latency': _server.latency,
+    'tokens_per_second': _server.tokens_per_second,
+    'response_tokens': _server.response_tokens,
+    'error_rate': _server.error_rate
+}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def workdir(tmp_path_factory):
+    """Chạy test trong thư mục tạm (jobs.db / sessions.db mặc định được tạo ở thư mục hiện tại)"""
+    path = tmp_path_factory.mktemp("cwd")
+    previous = os.getcwd()
+    os.chdir(path)
+    yield path
+    os.chdir(previous)
+
+
+@pytest.fixture
+def mock_ollama():
+    """Server giả lập; test được đổi latency / tốc độ sinh token, tự trả lại sau mỗi test"""
+    yield _server
+    for name, value in _DEFAULTS.items():
+        setattr(_server, name, value)
+
+
+@pytest.fixture
+def client(mock_ollama):
+    """DeepSeekClient với cache, singleflight và scheduler riêng (không dính trạng thái test khác)"""
+    from deepseek_client import DeepSeekClient
+    from response_cache import ResponseCache
+    from scheduler import AdmissionController
+    from singleflight import SingleFlight
+
+    return DeepSeekClient(
+        cache=ResponseCache(),
+        singleflight=SingleFlight(),
+        scheduler=AdmissionController()
+    )
+
+
+@pytest.fixture
+def wait_until():
+    """wait_until(điều kiện, timeout): chờ tới khi điều kiện đúng, False nếu hết giờ"""
+    def wait(predicate, timeout: float = 10.0, interval: float = 0.02) -> bool:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if predicate():
+                return True
+            time.sleep(interval)
+        return bool(predicate())
+    return wait
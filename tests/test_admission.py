@@ -0,0 +1,118 @@
+# tests/test_admission.py
+# Admission control: hàng đợi ưu tiên, 429 khi hàng đợi đầy, 503 khi chờ quá lâu
+
+import threading
+
+import pytest
+
+from errors import QueueFullError, QueueTimeoutError
+from scheduler import PRIORITY_BATCH, PRIORITY_INTERACTIVE, AdmissionController
+
+
+def acquire_in_thread(scheduler, priority=PRIORITY_INTERACTIVE, timeout=None):
+    """Chờ lượt trong thread riêng, trả về (thread, dict kết quả)"""
+    outcome = {}
+
+    def run():
+        try:
+            scheduler.acquire(priority, timeout)
+            outcome['granted'] = True
+        except Exception as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def test_queue_full_and_timeout(wait_until):
+    scheduler = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=0.2)
+    scheduler.acquire()
+    waiting, outcome = acquire_in_thread(scheduler)
+    assert wait_until(lambda: scheduler.stats()['queued'] == 1)
+
+    with pytest.raises(QueueFullError) as full:
+        scheduler.acquire()
+    assert full.value.http_status == 429 and full.value.retry_after >= 1
+
+    waiting.join(5)
+    assert isinstance(outcome['error'], QueueTimeoutError)
+    assert outcome['error'].http_status == 503
+    stats = scheduler.stats()
+    assert (stats['active'], stats['queued']) == (1, 0)
+
+
+def test_release_hands_slot_to_highest_priority(wait_until):
+    scheduler = AdmissionController(max_concurrency=1, max_queue=4, queue_timeout=5)
+    scheduler.acquire()
+    batch, batch_outcome = acquire_in_thread(scheduler, PRIORITY_BATCH)
+    assert wait_until(lambda: scheduler.stats()['queued'] == 1)
+    interactive, interactive_outcome = acquire_in_thread(scheduler, PRIORITY_INTERACTIVE)
+    assert wait_until(lambda: scheduler.stats()['queued'] == 2)
+
+    scheduler.release()
+    interactive.join(5)
+    assert interactive_outcome == {'granted': True}
+    assert not batch_outcome
+
+    scheduler.release()
+    batch.join(5)
+    assert batch_outcome == {'granted': True}
+
+
+def test_interactive_displaces_batch_when_full(wait_until):
+    scheduler = AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=5)
+    scheduler.acquire()
+    batch, batch_outcome = acquire_in_thread(scheduler, PRIORITY_BATCH)
+    assert wait_until(lambda: scheduler.stats()['queued'] == 1)
+
+    interactive, interactive_outcome = acquire_in_thread(scheduler, PRIORITY_INTERACTIVE)
+    batch.join(5)
+    assert isinstance(batch_outcome['error'], QueueFullError)
+
+    scheduler.release()
+    interactive.join(5)
+    assert interactive_outcome == {'granted': True}
+
+
+@pytest.fixture
+def api(mock_ollama):
+    import api_server
+    return api_server.app.test_client()
+
+
+@pytest.fixture
+def busy_scheduler(monkeypatch):
+    """Scheduler dùng chung của process với một lượt chạy đang bị giữ"""
+    from scheduler import get_scheduler
+
+    scheduler = get_scheduler()
+    monkeypatch.setattr(scheduler, 'max_concurrency', 1)
+    monkeypatch.setattr(scheduler, 'max_queue', 0)
+    monkeypatch.setattr(scheduler, 'queue_timeout', 0.2)
+    scheduler.acquire()
+    yield scheduler
+    scheduler.release()
+
+
+@pytest.mark.parametrize("path", ["/api/chat", "/api/chat/stream"])
+def test_api_returns_429_when_queue_full(api, busy_scheduler, path):
+    response = api.post(path, json={'message': f'Câu hỏi khi hàng đợi đầy {path}'})
+    assert response.status_code == 429
+    assert int(response.headers['Retry-After']) >= 1
+    assert response.get_json()['success'] is False
+
+
+@pytest.mark.parametrize("path", ["/api/chat", "/api/chat/stream"])
+def test_api_returns_503_when_queue_wait_too_long(api, busy_scheduler, monkeypatch, path):
+    monkeypatch.setattr(busy_scheduler, 'max_queue', 1)
+    response = api.post(path, json={'message': f'Câu hỏi chờ quá lâu {path}'})
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+
+
+def test_api_chat_ok(api):
+    response = api.post('/api/chat', json={'message': 'Câu hỏi bình thường cho mock'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['success'] is True and body['response']
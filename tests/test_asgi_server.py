@@ -0,0 +1,110 @@
+# tests/test_asgi_server.py
+# asgi_server chạy qua giao thức ASGI (scope / receive / send tự dựng, không cần uvicorn)
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+from backend_pool import BackendPool
+from metrics import ACTIVE_SESSIONS
+
+
+async def call(app, method: str, path: str, body=None):
+    """Gửi một request HTTP tới ASGI app, trả về (status, headers, body)"""
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": method, "scheme": "http", "path": path, "raw_path": path.encode(),
+        "root_path": "", "query_string": b"", "server": ("test", 80), "client": ("127.0.0.1", 1),
+        "headers": [(b"host", b"test"), (b"content-type", b"application/json"),
+                    (b"content-length", str(len(data)).encode())],
+    }
+    messages = [{"type": "http.request", "body": data, "more_body": False}]
+    started, chunks = {}, []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            started.update(message)
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return started["status"], dict(started.get("headers", [])), b"".join(chunks)
+
+
+@pytest.fixture
+def asgi(mock_ollama, monkeypatch):
+    import asgi_server
+
+    pool = BackendPool([mock_ollama.base_url])
+    monkeypatch.setattr(asgi_server, "get_backend_pool", lambda: pool)
+    yield asgi_server
+    pool.stop_health_checker()
+
+
+def run_with_lifespan(asgi_server, body):
+    async def main():
+        async with asgi_server.lifespan(asgi_server.app):
+            return await body()
+    return asyncio.run(main())
+
+
+def test_chat_and_stream(asgi):
+    async def body():
+        status, _, data = await call(asgi.app, "POST", "/api/chat", {
+            "message": "Câu hỏi qua ASGI", "temperature": 0.7
+        })
+        assert status == 200
+        assert json.loads(data)["success"]
+
+        status, headers, data = await call(asgi.app, "POST", "/api/chat/stream", {
+            "message": "Câu hỏi stream qua ASGI", "temperature": 0.7
+        })
+        assert status == 200 and headers[b"content-type"].startswith(b"text/event-stream")
+        events = [json.loads(frame[6:]) for frame in data.decode().split("\n\n") if frame]
+        assert events[-1]["type"] == "done"
+
+    run_with_lifespan(asgi, body)
+
+
+def test_startup_does_not_block_on_health_check(asgi, monkeypatch):
+    pool = asgi.get_backend_pool()
+    original = pool.check_health
+
+    def slow_check():
+        time.sleep(0.5)
+        return original()
+
+    monkeypatch.setattr(pool, "check_health", slow_check)
+
+    async def body():
+        return time.perf_counter()
+
+    started = time.perf_counter()
+    ready = run_with_lifespan(asgi, body)
+    assert ready - started < 0.3
+
+
+def test_metrics_render_off_event_loop(asgi):
+    threads = []
+
+    def probe():
+        threads.append(threading.current_thread())
+        return 1
+
+    ACTIVE_SESSIONS.set_function(probe)
+    try:
+        status, _, data = asyncio.run(call(asgi.app, "GET", "/metrics"))
+    finally:
+        ACTIVE_SESSIONS.set_function(lambda: len(asgi.sessions))
+    assert status == 200
+    assert b"deepseek_active_sessions 1" in data
+    assert threads and threads[0] is not threading.main_thread()
@@ -0,0 +1,54 @@
+# tests/test_async_client.py
+# AsyncDeepSeekClient (aiohttp) chạy trên mock Ollama
+
+import asyncio
+
+import pytest
+
+from async_client import AsyncDeepSeekClient
+from errors import QueueFullError
+from response_cache import ResponseCache
+from scheduler import AdmissionController
+
+
+def make_client(**kwargs) -> AsyncDeepSeekClient:
+    kwargs.setdefault('scheduler', AdmissionController())
+    return AsyncDeepSeekClient(cache=ResponseCache(), **kwargs)
+
+
+def test_concurrent_chats(mock_ollama):
+    async def main():
+        async with make_client() as client:
+            return await asyncio.gather(*(
+                client.chat_detailed(f"Câu hỏi async {i}", temperature=0.7) for i in range(4)
+            ))
+
+    results = asyncio.run(main())
+    assert all(result.ok and result.content for result in results)
+    assert all(result.usage()['completion_tokens'] == mock_ollama.response_tokens for result in results)
+
+
+def test_stream_events_and_history(mock_ollama):
+    async def main():
+        async with make_client() as client:
+            events = [event async for event in client.chat_stream_events(
+                "Câu hỏi stream async", temperature=0.7, use_history=True
+            )]
+            return events, client.get_history()
+
+    events, history = asyncio.run(main())
+    tokens = [event['content'] for event in events if event['type'] == 'token']
+    assert len(tokens) == mock_ollama.response_tokens
+    assert events[-1]['type'] == 'done'
+    assert [m['role'] for m in history] == ['user', 'assistant']
+    assert history[1]['content'] == "".join(tokens)
+
+
+def test_overload_raises_before_first_event(mock_ollama):
+    async def main():
+        async with make_client(scheduler=AdmissionController(max_concurrency=0, max_queue=0)) as client:
+            async for _ in client.chat_stream_events("Câu hỏi khi quá tải", temperature=0.7):
+                pass
+
+    with pytest.raises(QueueFullError):
+        asyncio.run(main())
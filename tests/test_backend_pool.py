@@ -0,0 +1,82 @@
+# tests/test_backend_pool.py
+# Nhiều Ollama backend: chọn backend, chuyển backend khi lỗi, health check nền không chặn
+
+import time
+
+import pytest
+
+from backend_pool import BackendPool
+from deepseek_client import DeepSeekClient
+
+# Cổng không có gì lắng nghe: kết nối bị từ chối ngay
+DEAD_URL = "http://127.0.0.1:9"
+
+
+@pytest.fixture
+def pool(mock_ollama):
+    pool = BackendPool([DEAD_URL, mock_ollama.base_url], failure_threshold=1, eject_seconds=60)
+    yield pool
+    pool.stop_health_checker()
+
+
+def test_acquire_prefers_least_outstanding(mock_ollama):
+    pool = BackendPool([mock_ollama.base_url, mock_ollama.base_url + "/"])
+    first = pool.acquire("m")
+    second = pool.acquire("m")
+    assert first is not second
+    pool.release(first)
+    assert pool.acquire("m") is first
+
+
+def test_chat_fails_over_to_healthy_backend(pool, client):
+    client.backends = pool
+    result = client.chat_detailed("Câu hỏi qua nhiều backend", temperature=0.7)
+    assert result.ok
+
+    stats = pool.stats()
+    dead, alive = stats['backends']
+    assert dead['errors'] >= 1 and not dead['healthy']
+    assert alive['requests'] >= 1 and alive['healthy']
+    assert stats['failovers'] >= 1
+
+
+def test_health_checker_does_not_block(pool, wait_until, monkeypatch):
+    original = pool.check_health
+
+    def slow_check():
+        time.sleep(0.5)
+        return original()
+
+    monkeypatch.setattr(pool, "check_health", slow_check)
+    started = time.perf_counter()
+    pool.start_health_checker()
+    assert time.perf_counter() - started < 0.2
+
+    assert wait_until(lambda: pool.last_check is not None, timeout=5)
+    assert pool.connected()
+    assert pool.stats()['healthy'] == 1
+
+
+def test_connected_without_check_runs_in_background(mock_ollama, wait_until):
+    pool = BackendPool([mock_ollama.base_url])
+    assert not pool.connected()
+    assert wait_until(lambda: pool.last_check is not None, timeout=5)
+    assert pool.connected()
+    assert BackendPool([DEAD_URL]).check_health() == 0
+
+
+def test_health_endpoint_uses_checker_state(mock_ollama, wait_until, monkeypatch):
+    import api_server
+    from backend_pool import get_backend_pool
+
+    api = api_server.app.test_client()
+    shared = get_backend_pool()
+    api.get('/health')
+    assert wait_until(lambda: shared.last_check is not None, timeout=5)
+
+    calls = []
+    monkeypatch.setattr(shared, "check_health", lambda: calls.append(1) or 1)
+    body = api.get('/health').get_json()
+    assert body['ollama_connected'] is True
+    assert calls == []
+    assert DeepSeekClient().backends is shared
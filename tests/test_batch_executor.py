@@ -0,0 +1,79 @@
+# tests/test_batch_executor.py
+# BatchExecutor: giới hạn số item chạy cùng lúc, item_timeout và deadline
+
+import threading
+import time
+
+from batch_executor import BatchExecutor
+
+
+class ConcurrencyProbe:
+    """fn giả: ngủ theo item, ghi lại số item chạy cùng lúc nhiều nhất"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = 0
+        self.peak = 0
+
+    def __call__(self, seconds):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            if seconds < 0:
+                raise ValueError("item lỗi")
+            time.sleep(seconds)
+            return seconds
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def test_run_keeps_input_order_and_limit():
+    probe = ConcurrencyProbe()
+    results = BatchExecutor(max_in_flight=3, item_timeout=5, deadline=None).run(
+        [0.05, 0.01, 0.03, 0.02, 0.04, 0.01], probe
+    )
+    assert [r['index'] for r in results] == list(range(6))
+    assert all(r['status'] == 'ok' for r in results)
+    assert probe.peak == 3
+
+
+def test_error_is_reported_per_item():
+    executor = BatchExecutor(max_in_flight=2, item_timeout=5, deadline=None)
+    results = executor.run([0.01, -1], ConcurrencyProbe())
+    assert [r['status'] for r in results] == ['ok', 'error']
+    assert results[1]['error'] == "item lỗi"
+
+
+def test_timed_out_item_still_holds_its_worker():
+    probe = ConcurrencyProbe()
+    start = time.monotonic()
+    results = BatchExecutor(max_in_flight=1, item_timeout=0.1, deadline=None).run(
+        [0.4, 0.05, 0.05], probe
+    )
+    assert [r['status'] for r in results] == ['timeout', 'ok', 'ok']
+    # Item sau chỉ chạy khi thread của item bị timeout trả về: không vượt max_in_flight
+    assert probe.peak == 1
+    assert time.monotonic() - start >= 0.5
+    # Thời gian tính từ lúc gửi, item không bị xếp hàng ngầm trong pool
+    assert all(r['elapsed'] < 0.1 for r in results[1:])
+
+
+def test_deadline_times_out_remaining_items():
+    results = BatchExecutor(max_in_flight=1, item_timeout=None, deadline=0.15).run(
+        [0.1, 0.1, 0.1, 0.1], ConcurrencyProbe()
+    )
+    statuses = [r['status'] for r in results]
+    assert statuses[0] == 'ok'
+    assert statuses[-1] == 'timeout'
+    assert all(r['error'] == 'Batch deadline exceeded' for r in results if r['status'] == 'timeout')
+
+
+def test_batch_over_mock(client):
+    questions = [f"Câu hỏi batch {i}" for i in range(5)]
+    results = BatchExecutor(max_in_flight=2, item_timeout=30, deadline=60).run(
+        questions, lambda message: client.chat_detailed(message, temperature=0.7)
+    )
+    assert all(r['status'] == 'ok' and r['value'].ok for r in results)
+    assert [r['item'] for r in results] == questions
@@ -0,0 +1,48 @@
+# tests/test_batch_stream.py
+# /api/batch/stream: mỗi câu một dòng NDJSON ngay khi xong, dòng cuối là tổng kết
+
+import json
+
+import pytest
+
+
+@pytest.fixture
+def api(mock_ollama):
+    import api_server
+    return api_server.app.test_client()
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+def test_results_then_summary(api):
+    messages = [f"Câu hỏi batch số {i}" for i in range(5)]
+    response = api.post('/api/batch/stream', json={
+        'messages': messages, 'temperature': 0.7, 'max_concurrency': 2
+    })
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+
+    lines = ndjson(response)
+    results, summary = lines[:-1], lines[-1]
+    assert sorted(r['index'] for r in results) == list(range(5))
+    assert all(r['type'] == 'result' and r['success'] for r in results)
+    assert all(r['message'] == messages[r['index']] for r in results)
+    assert summary['type'] == 'summary'
+    assert summary['total_messages'] == 5 and summary['successful'] == 5
+
+
+def test_failures_are_counted(api, mock_ollama):
+    mock_ollama.error_rate = 1.0
+    lines = ndjson(api.post('/api/batch/stream', json={
+        'messages': ["Câu lỗi một", "Câu lỗi hai"], 'temperature': 0.7
+    }))
+    assert [r['success'] for r in lines[:-1]] == [False, False]
+    assert all(r['error'] for r in lines[:-1])
+    assert lines[-1]['failed'] == 2 and lines[-1]['successful'] == 0
+
+
+def test_rejects_empty_batch(api):
+    response = api.post('/api/batch/stream', json={'messages': []})
+    assert response.status_code == 400
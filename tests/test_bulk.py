@@ -0,0 +1,101 @@
+# tests/test_bulk.py
+# cli bulk: checkpoint và chạy tiếp sau khi bị dừng (file kết quả bị cắt về checkpoint)
+
+import argparse
+import json
+
+import pytest
+
+from cli import BulkCheckpoint, run_bulk
+
+
+@pytest.fixture
+def bulk_args(tmp_path, mock_ollama):
+    source = tmp_path / "prompts.jsonl"
+    with open(source, "w", encoding="utf-8") as f:
+        for i in range(1, 7):
+            f.write(json.dumps({"id": i, "message": f"Câu hỏi bulk số {i}"}, ensure_ascii=False) + "\n")
+    return argparse.Namespace(
+        input=str(source),
+        output=str(tmp_path / "results.jsonl"),
+        checkpoint=None,
+        restart=False,
+        scenario="default",
+        workers=1,
+        item_timeout=30.0,
+        checkpoint_every=1
+    )
+
+
+def read_output(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_bulk_runs_every_line(bulk_args):
+    assert run_bulk(bulk_args) == 0
+    records = read_output(bulk_args.output)
+    assert sorted(r["line"] for r in records) == list(range(1, 7))
+    assert all(r["success"] for r in records)
+
+    checkpoint = BulkCheckpoint(f"{bulk_args.output}.ckpt", bulk_args.input)
+    assert checkpoint.load()
+    assert (checkpoint.watermark, checkpoint.completed) == (6, set())
+
+
+def test_resume_truncates_output_written_after_checkpoint(bulk_args):
+    assert run_bulk(bulk_args) == 0
+    with open(bulk_args.output, "rb") as f:
+        lines = f.readlines()
+
+    # Giả lập process chết: checkpoint cuối ở dòng 3, sau đó đã ghi thêm dòng 4 và nửa dòng 5
+    checkpoint = BulkCheckpoint(f"{bulk_args.output}.ckpt", bulk_args.input)
+    for line_number in (1, 2, 3):
+        checkpoint.mark(line_number)
+    checkpoint.save(sum(len(line) for line in lines[:3]))
+    with open(bulk_args.output, "wb") as f:
+        f.writelines(lines[:4])
+        f.write(lines[4][:10])
+
+    assert run_bulk(bulk_args) == 0
+    records = read_output(bulk_args.output)
+    assert [r["line"] for r in records] == [1, 2, 3, 4, 5, 6]
+    assert records[:3] == [json.loads(line) for line in lines[:3]]
+
+
+def test_resume_refuses_output_shorter_than_checkpoint(bulk_args):
+    assert run_bulk(bulk_args) == 0
+    with open(bulk_args.output, "r+b") as f:
+        f.truncate(10)
+    assert run_bulk(bulk_args) == 1
+
+
+def test_existing_output_without_checkpoint(bulk_args):
+    with open(bulk_args.output, "w", encoding="utf-8") as f:
+        f.write("{}\n")
+    assert run_bulk(bulk_args) == 1
+
+    bulk_args.restart = True
+    assert run_bulk(bulk_args) == 0
+    assert len(read_output(bulk_args.output)) == 6
+
+
+def test_checkpoint_watermark_and_roundtrip(tmp_path):
+    path = str(tmp_path / "run.ckpt")
+    checkpoint = BulkCheckpoint(path, "prompts.jsonl")
+    checkpoint.mark(2)
+    checkpoint.mark(3)
+    assert (checkpoint.watermark, checkpoint.completed) == (0, {2, 3})
+    assert checkpoint.is_done(3) and not checkpoint.is_done(1)
+    checkpoint.mark(1)
+    checkpoint.mark(5)
+    assert (checkpoint.watermark, checkpoint.completed) == (3, {5})
+    checkpoint.save(123)
+
+    loaded = BulkCheckpoint(path, "prompts.jsonl")
+    assert loaded.load()
+    assert (loaded.watermark, loaded.completed, loaded.output_offset) == (3, {5}, 123)
+    assert not loaded.is_done(4) and loaded.is_done(5)
+
+    with pytest.raises(ValueError):
+        BulkCheckpoint(path, "other.jsonl").load()
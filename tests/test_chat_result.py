@@ -0,0 +1,47 @@
+# tests/test_chat_result.py
+# ChatResult: số token / thời gian từng pha từ Ollama và dạng JSON trả về từ API
+
+from chat_result import ChatResult
+from errors import UpstreamTimeoutError
+
+
+def test_from_ollama_converts_durations():
+    result = ChatResult.from_ollama("xin chào", {
+        "prompt_eval_count": 12,
+        "eval_count": 40,
+        "load_duration": 500_000_000,
+        "prompt_eval_duration": 250_000_000,
+        "eval_duration": 2_000_000_000,
+        "total_duration": 2_800_000_000
+    }, model="m")
+
+    assert result.ok and not result.cached
+    assert result.usage() == {"prompt_tokens": 12, "completion_tokens": 40}
+    assert result.tokens_per_second == 20.0
+    assert result.timings() == {
+        "load": 0.5, "prompt_eval": 0.25, "eval": 2.0, "total": 2.8,
+        "elapsed": None, "tokens_per_second": 20.0
+    }
+
+
+def test_failure_to_dict():
+    result = ChatResult.failure(UpstreamTimeoutError("hết giờ"))
+    data = result.to_dict()
+    assert not result.ok
+    assert data["response"] == "Lỗi: hết giờ"
+    assert data["error_type"] == "UpstreamTimeoutError"
+    assert data["usage"] == {"prompt_tokens": None, "completion_tokens": None}
+
+
+def test_api_chat_returns_usage_and_timings(mock_ollama):
+    import api_server
+
+    message = "Câu hỏi để xem số token"
+    body = api_server.app.test_client().post('/api/chat', json={
+        'message': message, 'temperature': 0.7
+    }).get_json()
+    assert body['success'] and body['source'] == 'model'
+    assert body['usage']['completion_tokens'] == mock_ollama.response_tokens
+    assert body['usage']['prompt_tokens'] >= len(message) // 3
+    assert body['timings']['eval'] is not None
+    assert body['timings']['elapsed'] is not None
@@ -0,0 +1,47 @@
+# tests/test_context_mode.py
+# Chế độ hội thoại "context": giữ context token của /api/generate, mỗi lượt chỉ gửi câu hỏi mới
+
+import pytest
+
+
+@pytest.fixture
+def context_client(client):
+    client.conversation_mode = "context"
+    return client
+
+
+def test_second_turn_sends_only_new_message(context_client):
+    first = context_client.chat_detailed("Lượt đầu tiên", use_history=True, temperature=0.7)
+    assert first.ok and context_client._context
+
+    message = "Lượt thứ hai chỉ gửi câu này"
+    second = context_client.chat_detailed(message, use_history=True, temperature=0.7)
+    assert second.ok
+    # mock đếm token prompt theo số ký tự được gửi: không có system prompt / lịch sử
+    assert second.prompt_tokens == len(message) // 3
+    assert len(context_client.get_history()) == 4
+    assert context_client._context_len == 4
+
+
+def test_falls_back_to_chat_when_context_does_not_cover_history(context_client):
+    context_client.chat_detailed("Lượt đầu tiên", use_history=True, temperature=0.7)
+    # Lịch sử bị sửa từ ngoài: context không còn khớp, gửi lại lịch sử qua /api/chat
+    context_client.conversation_history.append({"role": "user", "content": "chèn thêm"})
+    context_client.conversation_history.append({"role": "assistant", "content": "đáp thêm"})
+    message = "Lượt sau khi sửa lịch sử"
+    result = context_client.chat_detailed(message, use_history=True, temperature=0.7)
+    assert result.ok
+    assert result.prompt_tokens > len(message) // 3
+
+
+def test_changing_scenario_falls_back(context_client):
+    context_client.chat_detailed("Lượt ở kịch bản mặc định", use_history=True, temperature=0.7)
+    assert not context_client._context_usable("teacher")
+    assert context_client._context_usable("default")
+
+
+def test_clear_history_drops_context(context_client):
+    context_client.chat_detailed("Lượt sẽ bị xóa", use_history=True, temperature=0.7)
+    context_client.clear_history()
+    assert context_client._context is None
+    assert context_client._context_usable("default")
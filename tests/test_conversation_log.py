@@ -0,0 +1,89 @@
+# tests/test_conversation_log.py
+# File log hội thoại: mở lại sau khi process ghi bị dừng giữa chừng, đọc file hỏng
+
+import importlib.util
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+from conversation_log import ConversationLogWriter, iter_messages, iter_records
+
+# Ghi một message rồi thoát ngay (không close): gzip member / zstd frame còn dở
+_CRASHING_WRITER = textwrap.dedent("""
+    import os, sys
+    sys.path.insert(0, {root!r})
+    from conversation_log import ConversationLogWriter
+    writer = ConversationLogWriter({path!r})
+    writer.append({{"role": "user", "content": "trước khi dừng"}})
+    os._exit(0)
+""")
+
+_LOG_NAMES = [
+    "log.jsonl",
+    "log.jsonl.gz",
+    pytest.param("log.jsonl.zst", marks=pytest.mark.skipif(
+        importlib.util.find_spec("zstandard") is None, reason="chưa cài zstandard"
+    )),
+]
+
+
+def crash_writer(path: str):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = _CRASHING_WRITER.format(root=root, path=str(path))
+    subprocess.run([sys.executable, "-c", code], check=True, timeout=60)
+
+
+@pytest.mark.parametrize("name", _LOG_NAMES)
+def test_reopen_after_crash(tmp_path, name):
+    path = tmp_path / name
+    crash_writer(path)
+    with ConversationLogWriter(str(path)) as writer:
+        writer.append({"role": "assistant", "content": "sau khi mở lại"})
+
+    assert [m["content"] for m in iter_messages(str(path))] == ["trước khi dừng", "sau khi mở lại"]
+    sessions = [r for r in iter_records(str(path)) if r.get("type") == "session"]
+    assert len(sessions) == 2
+
+
+@pytest.mark.parametrize("name", _LOG_NAMES)
+def test_reopen_twice_after_crash(tmp_path, name):
+    path = tmp_path / name
+    crash_writer(path)
+    crash_writer(path)
+    with ConversationLogWriter(str(path)) as writer:
+        writer.append({"role": "assistant", "content": "lần ba"})
+
+    assert [m["content"] for m in iter_messages(str(path))] == [
+        "trước khi dừng", "trước khi dừng", "lần ba"
+    ]
+    assert [m["content"] for m in iter_messages(str(path), last_session=True)] == ["lần ba"]
+
+
+def test_plain_log_drops_torn_line(tmp_path):
+    path = tmp_path / "log.jsonl"
+    with ConversationLogWriter(str(path)) as writer:
+        writer.append({"role": "user", "content": "đủ dòng"})
+    with open(path, "ab") as f:
+        f.write(b'{"role": "assistant", "cont')
+
+    assert [m["content"] for m in iter_messages(str(path))] == ["đủ dòng"]
+    with ConversationLogWriter(str(path)) as writer:
+        writer.append({"role": "assistant", "content": "sau khi sửa"})
+    assert [m["content"] for m in iter_messages(str(path))] == ["đủ dòng", "sau khi sửa"]
+
+
+@pytest.mark.parametrize("name", _LOG_NAMES[1:])
+def test_corrupt_tail_keeps_earlier_records(tmp_path, name):
+    path = tmp_path / name
+    with ConversationLogWriter(str(path)) as writer:
+        writer.extend([
+            {"role": "user", "content": "câu một"},
+            {"role": "assistant", "content": "câu hai"},
+        ])
+    with open(path, "ab") as f:
+        f.write(b"\x00not compressed data" * 4)
+
+    assert [m["content"] for m in iter_messages(str(path))] == ["câu một", "câu hai"]
@@ -0,0 +1,57 @@
+# tests/test_history_window.py
+# Cửa sổ lịch sử theo số lượt / ngân sách token khi use_history=True
+
+from config import HISTORY_TOKEN_BUDGET
+from history_window import estimate_tokens, window_start
+
+
+def turns(count: int, size: int):
+    history = []
+    for i in range(count):
+        history.append({"role": "user", "content": f"hỏi {i} " + "x" * size})
+        history.append({"role": "assistant", "content": f"đáp {i} " + "y" * size})
+    return history
+
+
+def test_window_start_limits():
+    counts = [10, 10, 10, 10, 10, 10]
+    assert window_start(counts) == 0
+    assert window_start(counts, max_turns=1) == 4
+    assert window_start(counts, token_budget=45, reserved_tokens=5) == 2
+    # Không đủ cho cả lượt gần nhất: bỏ hết lịch sử, không cắt đôi một lượt
+    assert window_start(counts, token_budget=15, reserved_tokens=0) == 6
+    assert window_start([10, 10, 10], max_turns=5) == 1
+
+
+def test_window_keeps_newest_turns(client):
+    client.conversation_history = turns(50, 300)
+    messages = client._build_messages("câu hỏi mới", "system", use_history=True)
+    kept = messages[1:-1]
+    assert kept and kept[-1] is client.conversation_history[-1]
+    assert kept[0]["role"] == "user"
+    assert sum(estimate_tokens(m["content"]) for m in messages) <= HISTORY_TOKEN_BUDGET
+
+
+def test_replaced_history_is_recounted(client):
+    client.conversation_history = turns(4, 10)
+    assert len(client._build_messages("hỏi", "system", use_history=True)) == 10
+
+    # Cùng độ dài nhưng là list khác với message dài hơn nhiều: phải đếm lại
+    client.conversation_history = turns(4, 2000)
+    kept = client._build_messages("hỏi", "system", use_history=True)[1:-1]
+    assert len(kept) < 8
+
+    # Sửa tại chỗ (xóa rồi nạp lại cùng số message) cũng được phát hiện
+    history = client.conversation_history
+    history.clear()
+    history.extend(turns(4, 10))
+    assert len(client._build_messages("hỏi", "system", use_history=True)) == 10
+
+
+def test_prompt_size_is_bounded_over_mock(client):
+    client.conversation_history = turns(40, 600)
+    result = client.chat_detailed("Câu hỏi với lịch sử dài", use_history=True, temperature=0.7)
+    assert result.ok
+    # mock tính prompt_eval_count ~ số ký tự / 3, cùng cách ước lượng với history_window
+    assert result.prompt_tokens <= HISTORY_TOKEN_BUDGET
+    assert len(client.conversation_history) == 82
@@ -0,0 +1,25 @@
+# tests/test_http_transport.py
+# Connection pool keep-alive dùng chung giữa các DeepSeekClient
+
+from deepseek_client import DeepSeekClient
+from http_transport import OllamaTransport, get_transport
+from response_cache import ResponseCache
+
+
+def test_clients_share_process_transport(mock_ollama):
+    assert DeepSeekClient().transport is DeepSeekClient().transport is get_transport()
+
+
+def test_connections_are_reused(mock_ollama):
+    transport = OllamaTransport()
+    clients = [DeepSeekClient(transport=transport, cache=ResponseCache()) for _ in range(2)]
+    for i in range(4):
+        result = clients[i % 2].chat_detailed(f"Câu hỏi keep-alive {i}", temperature=0.7)
+        assert result.ok
+
+    stats = transport.stats()
+    assert stats['requests'] == 4
+    assert stats['connections_opened'] == 1
+    assert stats['connections_reused'] == 3
+    transport.close()
+
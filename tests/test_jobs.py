@@ -0,0 +1,125 @@
+# tests/test_jobs.py
+# Job batch chạy nền: hủy job đang chạy, chạy tiếp job của process đã chết
+
+import pytest
+
+from jobs import JobManager, JobStore
+from scheduler import AdmissionController
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+@pytest.fixture
+def make_manager(store, client):
+    managers = []
+
+    def make(**kwargs):
+        manager = JobManager(store=store, client=client, max_running=1, poll_interval=0.05, **kwargs)
+        managers.append(manager)
+        manager.start()
+        return manager
+
+    yield make
+    for manager in managers:
+        manager.stop()
+
+
+def test_job_completes(make_manager, wait_until):
+    manager = make_manager()
+    job = manager.submit([f"Câu hỏi job số {i}" for i in range(5)], max_concurrency=2)
+
+    assert wait_until(lambda: manager.get(job['job_id'])['status'] == 'completed')
+    done = manager.get(job['job_id'])
+    assert (done['completed'], done['succeeded'], done['progress']) == (5, 5, 100.0)
+    results = manager.store.results(job['job_id'])
+    assert [item['index'] for item in results] == list(range(5))
+    assert all(item['status'] == 'ok' for item in results)
+
+
+def test_cancel_running_job(make_manager, mock_ollama, wait_until):
+    mock_ollama.latency = 0.2
+    manager = make_manager()
+    job = manager.submit([f"Câu hỏi bị hủy {i}" for i in range(20)], max_concurrency=1)
+    job_id = job['job_id']
+
+    assert wait_until(lambda: manager.get(job_id)['completed'] >= 1)
+    assert manager.cancel(job_id)
+    assert wait_until(lambda: job_id not in manager.stats()['running_here'])
+
+    cancelled = manager.get(job_id)
+    assert cancelled['status'] == 'cancelled'
+    assert cancelled['completed'] < 20
+    # Job đã kết thúc: hủy lần nữa không có tác dụng, stream kết quả dừng
+    assert not manager.cancel(job_id)
+    _, finished = manager.poll_results(job_id, after_seq=cancelled['completed'])
+    assert finished is not None and finished['status'] == 'cancelled'
+
+
+def test_resume_job_of_dead_process(store, make_manager, wait_until):
+    job = store.create([f"Câu hỏi chạy tiếp {i}" for i in range(4)], "default", None, 2, 30.0)
+    job_id = job['job_id']
+    # Process cũ nhận job, lưu được một kết quả rồi chết (không còn heartbeat)
+    assert store.claim("dead-owner")['job_id'] == job_id
+    store.save_result(job_id, 0, 'ok', {'success': True, 'response': 'của process cũ'})
+
+    manager = make_manager(stale_after=0.2)
+    assert wait_until(lambda: store.get(job_id)['status'] == 'completed')
+
+    done = store.get(job_id)
+    assert (done['completed'], done['succeeded']) == (4, 4)
+    results = store.results(job_id)
+    # Câu đã có kết quả không chạy lại, các câu còn lại do process mới chạy
+    assert results[0]['response'] == 'của process cũ'
+    assert all(item['status'] == 'ok' for item in results)
+    assert manager.stats()['running_here'] == []
+
+
+def test_running_job_is_not_stolen(store):
+    job = store.create(["Câu hỏi"], "default", None, 1, 30.0)
+    assert store.claim("owner-a")['job_id'] == job['job_id']
+    # Heartbeat còn mới: process khác không nhận lại
+    assert store.claim("owner-b", stale_after=60) is None
+
+
+def test_overloaded_items_stop_at_item_timeout(make_manager, client, wait_until):
+    # Hàng đợi luôn đầy: câu hỏi chờ thử lại nhưng không quá item_timeout
+    client.scheduler = AdmissionController(max_concurrency=0, max_queue=0)
+    manager = make_manager()
+    job = manager.submit(["Câu hỏi lúc quá tải"], item_timeout=0.5)
+
+    assert wait_until(lambda: manager.get(job['job_id'])['status'] == 'completed', timeout=5)
+    done = manager.get(job['job_id'])
+    assert (done['completed'], done['failed']) == (1, 1)
+    result = manager.store.results(job['job_id'])[0]
+    assert not result['success'] and result['elapsed_time'] < 2
+
+
+def test_heartbeat_reports_lost_jobs(store):
+    job = store.create(["Câu hỏi"], "default", None, 1, 30.0)
+    job_id = job['job_id']
+    assert store.claim("owner-a")['job_id'] == job_id
+    assert store.heartbeat([job_id], "owner-a") == []
+
+    # owner-a mất heartbeat quá lâu, owner-b nhận lại job
+    assert store.claim("owner-b", stale_after=-1)['job_id'] == job_id
+    assert store.heartbeat([job_id], "owner-a") == [job_id]
+    assert store.heartbeat([job_id], "owner-b") == []
+
+
+def test_lost_heartbeat_stops_worker(store, make_manager, mock_ollama, wait_until):
+    mock_ollama.latency = 0.1
+    manager = make_manager(stale_after=0.3)
+    job = manager.submit([f"Câu hỏi bị nhận lại {i}" for i in range(30)], max_concurrency=1)
+    job_id = job['job_id']
+    assert wait_until(lambda: manager.get(job_id)['completed'] >= 1)
+
+    # Worker khác đã nhận lại job (ví dụ process này bị treo quá stale_after)
+    store._connection().execute("UPDATE jobs SET owner = 'other-worker' WHERE job_id = ?", (job_id,))
+    assert wait_until(lambda: job_id not in manager.stats()['running_here'], timeout=5)
+
+    # Worker cũ dừng mà không kết thúc job của worker mới
+    taken = store.get(job_id)
+    assert taken['status'] == 'running' and taken['completed'] < 30
@@ -0,0 +1,68 @@
+# tests/test_loadgen.py
+# Bộ tạo tải open-loop: báo cáo theo endpoint khi chạy trên api_server + mock Ollama
+
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from loadgen import STREAM_PATH, LoadGenerator, arrival_times, build_report
+
+
+@pytest.fixture
+def api_url(mock_ollama):
+    import api_server
+
+    server = make_server("127.0.0.1", 0, api_server.app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    thread.join(timeout=5)
+
+
+def test_arrival_times():
+    assert list(arrival_times(4, 3, "constant", None)) == [0, 0.25, 0.5]
+    poisson = list(arrival_times(10, 50, "poisson", seed=1))
+    assert poisson == sorted(poisson) and poisson == list(arrival_times(10, 50, "poisson", seed=1))
+
+
+def test_report_over_mock(api_url):
+    items = [
+        {"path": "/api/chat", "body": {"message": "Câu hỏi tải", "temperature": 0.7}, "unique": True},
+        {"path": STREAM_PATH, "body": {"message": "Câu hỏi stream tải", "temperature": 0.7},
+         "unique": True},
+    ]
+    report = LoadGenerator(api_url, concurrency=8, timeout=30).run(items, rate=50, count=10, seed=1)
+
+    assert report["requests"] == 10
+    chat, stream = report["endpoints"]["/api/chat"], report["endpoints"][STREAM_PATH]
+    assert chat["requests"] == stream["requests"] == 5
+    assert chat["errors"] == stream["errors"] == 0
+    assert chat["statuses"] == {"200": 5}
+    assert chat["latency"]["p50"] > 0
+    assert chat["latency_corrected"]["p99"] >= chat["latency"]["p99"]
+    assert "ttft" in stream and "ttft" not in chat
+
+
+def test_unexpected_error_is_recorded(api_url):
+    # Body thiếu "message" với unique=True: lỗi không phải RequestException vẫn có bản ghi
+    items = [{"path": "/api/chat", "body": {}, "unique": True}]
+    report = LoadGenerator(api_url, concurrency=2).run(items, rate=100, count=3)
+
+    summary = report["endpoints"]["/api/chat"]
+    assert report["requests"] == 3
+    assert summary["errors"] == 3 and summary["statuses"] == {"KeyError": 3}
+
+
+def test_build_report_counts_connection_errors():
+    records = [
+        {"path": "/x", "scheduled": 0.0, "sent": 0.0, "end": 0.1, "first_token": None,
+         "status": 200, "ok": True},
+        {"path": "/x", "scheduled": 0.0, "sent": 0.5, "end": 0.6, "first_token": None,
+         "status": None, "ok": False, "error": "ConnectionError"},
+    ]
+    report = build_report(records, rate=2, duration=1.0)
+    assert report["max_send_lag"] == 0.5
+    assert report["endpoints"]["/x"]["statuses"] == {"200": 1, "ConnectionError": 1}
+    assert report["endpoints"]["/x"]["error_rate"] == 0.5
@@ -0,0 +1,47 @@
+# tests/test_metrics.py
+# Số liệu Prometheus: định dạng text của Registry và GET /metrics sau một lượt chat qua mock
+
+from metrics import HTTP_REQUESTS, Registry
+
+
+def test_registry_renders_text_format():
+    registry = Registry()
+    counter = registry.counter("demo_total", "Bộ đếm", ("kind",))
+    gauge = registry.gauge("demo_live", "Giá trị hiện tại")
+    histogram = registry.histogram("demo_seconds", "Thời gian", buckets=(0.1, 1.0))
+
+    counter.inc("a")
+    counter.inc("a", amount=2)
+    gauge.set_function(lambda: 7)
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+
+    text = registry.render()
+    assert "# TYPE demo_total counter" in text
+    assert 'demo_total{kind="a"} 3' in text
+    assert "demo_live 7" in text
+    # Bucket tích lũy, có bucket +Inf
+    assert 'demo_seconds_bucket{le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{le="1.0"} 2' in text
+    assert 'demo_seconds_bucket{le="+Inf"} 2' in text
+    assert "demo_seconds_count 2" in text
+
+
+def test_metrics_endpoint_after_chat(mock_ollama):
+    import api_server
+    api = api_server.app.test_client()
+
+    before_http = HTTP_REQUESTS.value('/api/chat', 'default', '200')
+    response = api.post('/api/chat', json={'message': 'Câu hỏi để đo số liệu', 'temperature': 0.7})
+    assert response.status_code == 200
+    # Số liệu request được ghi khi response đóng (để tính cả response streaming)
+    response.close()
+    assert HTTP_REQUESTS.value('/api/chat', 'default', '200') == before_http + 1
+
+    metrics = api.get('/metrics')
+    assert metrics.status_code == 200
+    text = metrics.get_data(as_text=True)
+    assert 'deepseek_http_requests_total{endpoint="/api/chat",scenario="default",status="200"}' in text
+    assert "deepseek_active_sessions" in text
+    assert 'outcome="ok"' in text
+    assert "deepseek_upstream_duration_seconds_count" in text
@@ -0,0 +1,87 @@
+# tests/test_mock_ollama.py
+# Mock Ollama (mock_ollama.py) và phần so sánh baseline của benchmark.py
+
+import json
+import time
+
+import requests
+
+from benchmark import compare, percentile, summarize
+
+
+def test_tags_and_ps(mock_ollama):
+    tags = requests.get(f"{mock_ollama.base_url}/api/tags", timeout=5).json()
+    assert [model['name'] for model in tags['models']] == mock_ollama.models
+
+    requests.post(f"{mock_ollama.base_url}/api/generate",
+                  json={'model': mock_ollama.models[0]}, timeout=5)
+    ps = requests.get(f"{mock_ollama.base_url}/api/ps", timeout=5).json()
+    assert mock_ollama.models[0] in [model['name'] for model in ps['models']]
+
+
+def test_chat_non_stream_reports_counts(mock_ollama):
+    mock_ollama.response_tokens = 5
+    data = requests.post(f"{mock_ollama.base_url}/api/chat", json={
+        'model': mock_ollama.models[0],
+        'messages': [{'role': 'user', 'content': 'xin chào mock'}],
+        'stream': False,
+        'options': {'num_predict': 3}
+    }, timeout=5).json()
+
+    # num_predict nhỏ hơn response_tokens thì được dùng
+    assert data['done'] and data['eval_count'] == 3
+    assert len(data['message']['content'].split()) == 3
+    assert data['prompt_eval_count'] >= 1 and data['eval_duration'] > 0
+
+
+def test_chat_stream_is_ndjson_with_latency(mock_ollama):
+    mock_ollama.latency = 0.1
+    mock_ollama.response_tokens = 4
+    start = time.perf_counter()
+    with requests.post(f"{mock_ollama.base_url}/api/chat", json={
+        'model': mock_ollama.models[0],
+        'messages': [{'role': 'user', 'content': 'stream'}]
+    }, stream=True, timeout=5) as response:
+        chunks = [json.loads(line) for line in response.iter_lines() if line]
+
+    assert time.perf_counter() - start >= 0.1
+    assert [chunk['done'] for chunk in chunks] == [False] * 4 + [True]
+    assert chunks[-1]['eval_count'] == 4
+
+
+def test_generate_returns_growing_context(mock_ollama):
+    first = requests.post(f"{mock_ollama.base_url}/api/generate", json={
+        'model': mock_ollama.models[0], 'prompt': 'lượt một', 'stream': False
+    }, timeout=5).json()
+    second = requests.post(f"{mock_ollama.base_url}/api/generate", json={
+        'model': mock_ollama.models[0], 'prompt': 'lượt hai', 'stream': False,
+        'context': first['context']
+    }, timeout=5).json()
+    assert second['context'][:len(first['context'])] == first['context']
+    assert len(second['context']) > len(first['context'])
+
+
+def test_errors(mock_ollama):
+    missing = requests.post(f"{mock_ollama.base_url}/api/chat",
+                            json={'model': 'khong-co:1b', 'messages': []}, timeout=5)
+    assert missing.status_code == 404
+
+    mock_ollama.error_rate = 1.0
+    failed = requests.post(f"{mock_ollama.base_url}/api/chat",
+                           json={'messages': [{'role': 'user', 'content': 'lỗi'}]}, timeout=5)
+    assert failed.status_code == 500
+
+
+def test_summary_and_baseline_compare():
+    assert percentile([], 50) is None
+    assert percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.5
+
+    summary = summarize([0.1, 0.2, 0.3], errors=1, wall_time=1.0)
+    assert (summary['requests'], summary['errors'], summary['error_rate']) == (4, 1, 0.25)
+    assert summary['rps'] == 3.0
+
+    baseline = {'workloads': {'chat': {'p50': 0.1, 'p95': 0.2, 'p99': 0.3, 'rps': 100.0}}}
+    same = {'workloads': {'chat': {'p50': 0.105, 'p95': 0.2, 'p99': 0.3, 'rps': 98.0}}}
+    slower = {'workloads': {'chat': {'p50': 0.2, 'p95': 0.2, 'p99': 0.3, 'rps': 50.0}}}
+    assert compare(same, baseline, tolerance=0.15) == []
+    assert [r.split(':')[0] for r in compare(slower, baseline, tolerance=0.15)] == ['chat.p50', 'chat.rps']
@@ -0,0 +1,89 @@
+# tests/test_model_router.py
+# Định tuyến model theo kịch bản: model dự phòng, và câu mẫu / cache hit không đi qua bộ định tuyến
+
+import pytest
+
+from backend_pool import BackendPool
+from config import LARGE_MODEL_NAME, MODEL_NAME
+from deepseek_client import DeepSeekClient
+from metrics import MODEL_ROUTING
+from model_router import ModelRouter
+from response_cache import ResponseCache
+from scheduler import AdmissionController
+from singleflight import SingleFlight
+from template_index import TemplateIndex
+
+TEMPLATES = {
+    "creative": [{"question": "Bạn có thể viết thơ không?", "answer": "Có, mình viết được thơ"}]
+}
+
+
+def routed_total(scenario: str) -> float:
+    return sum(
+        MODEL_ROUTING.value(scenario, model, reason)
+        for model in (MODEL_NAME, LARGE_MODEL_NAME)
+        for reason in ("preferred", "slo", "unavailable", "unchecked")
+    )
+
+
+@pytest.fixture
+def pool(mock_ollama, monkeypatch):
+    pool = BackendPool([mock_ollama.base_url])
+    pool.background_checks = 0
+    check = pool.check_health_background
+
+    def counted():
+        pool.background_checks += 1
+        check()
+
+    monkeypatch.setattr(pool, "check_health_background", counted)
+    return pool
+
+
+@pytest.fixture
+def routed_client(pool):
+    scheduler = AdmissionController()
+    return DeepSeekClient(
+        cache=ResponseCache(),
+        singleflight=SingleFlight(),
+        scheduler=scheduler,
+        templates=TemplateIndex(TEMPLATES, threshold=0.9),
+        backends=pool,
+        router=ModelRouter(backends=pool, scheduler=scheduler)
+    )
+
+
+def test_falls_back_when_preferred_model_missing(pool):
+    router = ModelRouter(backends=pool, scheduler=None)
+    pool.check_health()
+    # mock chỉ có model nhỏ
+    assert router.route("creative") == MODEL_NAME
+    assert router.route("default") == MODEL_NAME
+    assert router.preferred_model("creative") == LARGE_MODEL_NAME
+    assert router.stats()["models"][MODEL_NAME]["fallbacks"] == 1
+
+
+def test_template_hit_skips_routing(routed_client, pool):
+    before = routed_total("creative")
+    result = routed_client.chat_detailed("Bạn có thể viết thơ không?", scenario="creative")
+    assert result.source == "template"
+    assert pool.background_checks == 0 and pool.last_check is None
+    assert routed_total("creative") == before
+
+
+def test_cache_hit_skips_routing(routed_client):
+    before = MODEL_ROUTING.value("default", MODEL_NAME, "preferred")
+    first = routed_client.chat_detailed("Câu hỏi để cache", temperature=0.0)
+    second = routed_client.chat_detailed("Câu hỏi để cache", temperature=0.0)
+    assert first.source == "model" and second.source == "cache"
+    assert second.content == first.content
+    assert MODEL_ROUTING.value("default", MODEL_NAME, "preferred") == before + 1
+
+
+def test_fallback_answer_is_cached_under_fallback_model(routed_client, pool):
+    pool.check_health()
+    first = routed_client.chat_detailed("Viết một câu slogan", scenario="creative", temperature=0.0)
+    assert first.ok and first.model == MODEL_NAME
+
+    second = routed_client.chat_detailed("Viết một câu slogan", scenario="creative", temperature=0.0)
+    assert second.source == "cache" and second.content == first.content
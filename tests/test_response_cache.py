@@ -0,0 +1,56 @@
+# tests/test_response_cache.py
+# Cache câu trả lời: LRU / TTL / giới hạn byte, và cache trong DeepSeekClient
+
+import time
+
+from response_cache import ResponseCache, make_cache_key
+
+
+def test_key_ignores_whitespace_only():
+    messages = [{"role": "user", "content": "Xin   chào  bạn"}]
+    same = [{"role": "user", "content": " Xin chào bạn "}]
+    other = [{"role": "user", "content": "Xin chào bạn!"}]
+    key = make_cache_key("m", "system", messages, {"temperature": 0})
+    assert key == make_cache_key("m", "system", same, {"temperature": 0})
+    assert key != make_cache_key("m", "system", other, {"temperature": 0})
+    assert key != make_cache_key("m", "system", messages, {"temperature": 0.1})
+
+
+def test_lru_eviction_and_bytes_limit():
+    cache = ResponseCache(max_entries=2, max_bytes=10_000, ttl=60)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"  # "a" mới dùng: "b" bị loại trước
+    cache.set("c", "3")
+    assert cache.get("b") is None and cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.stats()['evictions'] == 1
+
+    small = ResponseCache(max_entries=10, max_bytes=20, ttl=60)
+    small.set("k", "x" * 100)  # Lớn hơn cả cache: không lưu
+    assert len(small) == 0
+
+
+def test_ttl_expiry():
+    cache = ResponseCache(ttl=0.05)
+    cache.set("k", "v")
+    assert cache.get("k") == "v"
+    time.sleep(0.06)
+    assert cache.get("k") is None
+    assert cache.stats()['entries'] == 0
+
+
+def test_client_serves_deterministic_repeat_from_cache(client, mock_ollama):
+    first = client.chat_detailed("Câu hỏi cache xác định", temperature=0)
+    mock_ollama.error_rate = 1.0  # Lần sau mà gọi model thì sẽ lỗi
+    second = client.chat_detailed("Câu hỏi   cache xác định", temperature=0)
+
+    assert (first.source, second.source) == ("model", "cache")
+    assert second.ok and second.content == first.content
+    assert client.cache.stats()['hits'] == 1
+
+
+def test_client_skips_cache_for_sampled_requests(client):
+    client.chat_detailed("Câu hỏi có temperature cao", temperature=0.9)
+    second = client.chat_detailed("Câu hỏi có temperature cao", temperature=0.9)
+    assert second.source == "model"
+    assert len(client.cache) == 0
@@ -0,0 +1,59 @@
+# tests/test_server_startup.py
+# Import server không chạy thread nền, không tạo file DB; thread chỉ chạy khi phục vụ request
+
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Chạy trong process riêng: các test khác có thể đã khởi động thread nền của process test
+_IMPORT_ONLY = textwrap.dedent("""
+    import os, sys, threading
+    sys.path.insert(0, {root!r})
+    import {module}
+    assert not getattr({module}, '_background_started', False)
+    print(sorted(t.name for t in threading.enumerate()), sorted(os.listdir('.')))
+""")
+
+_JOBS_ON_DEMAND = textwrap.dedent("""
+    import os, sys
+    sys.path.insert(0, {root!r})
+    import api_server
+    api = api_server.app.test_client()
+    api.get('/api/scenarios')
+    assert api.get('/health').get_json()['jobs'] is None
+    assert not os.path.exists('jobs.db')
+    assert api.get('/api/jobs').status_code == 200
+    assert os.path.exists('jobs.db')
+    assert api.get('/health').get_json()['jobs'] is not None
+""")
+
+
+def run_python(code: str, cwd) -> str:
+    return subprocess.run(
+        [sys.executable, "-c", code], cwd=cwd, check=True, timeout=60,
+        capture_output=True, text=True
+    ).stdout
+
+
+@pytest.mark.parametrize("module", ["api_server", "app", "asgi_server"])
+def test_import_starts_no_threads(tmp_path, module):
+    output = run_python(_IMPORT_ONLY.format(root=ROOT, module=module), tmp_path)
+    # Không thread nền, không file DB (session / job) trong thư mục hiện tại
+    assert output.strip() == "['MainThread'] []"
+
+
+def test_jobs_db_created_on_first_jobs_request(tmp_path):
+    run_python(_JOBS_ON_DEMAND.format(root=ROOT), tmp_path)
+
+
+def test_first_request_starts_sweeper(mock_ollama):
+    import api_server
+
+    api_server.app.test_client().get('/api/scenarios')
+    assert api_server._background_started
+    assert api_server.sessions._sweeper is not None and api_server.sessions._sweeper.is_alive()
@@ -0,0 +1,83 @@
+# tests/test_session_store.py
+# Kho session trong bộ nhớ: TTL, LRU, dọn nền và lịch sử chat qua API
+
+import time
+
+import pytest
+
+from deepseek_client import DeepSeekClient
+from response_cache import ResponseCache
+from session_store import SessionStore
+
+
+def make_store(**kwargs) -> SessionStore:
+    return SessionStore(client_factory=lambda: DeepSeekClient(cache=ResponseCache()), **kwargs)
+
+
+def test_idle_sessions_expire():
+    store = make_store(idle_ttl=0.05)
+    session_id, session = store.create()
+    assert store.get(session_id) is session
+    time.sleep(0.06)
+    assert store.get(session_id) is None
+
+    # Hết hạn thì get_or_create tạo session mới cùng id
+    _, fresh = store.get_or_create(session_id)
+    assert fresh is not session
+    assert store.stats()['expired'] == 1
+
+
+def test_least_recently_used_session_is_evicted():
+    store = make_store(max_sessions=2)
+    first, _ = store.create()
+    second, _ = store.create()
+    store.get_or_create(first)  # first mới được dùng: second bị loại
+    third, _ = store.create()
+    assert first in store and third in store and second not in store
+    assert store.stats()['evicted'] == 1
+
+
+def test_sweeper_removes_expired_sessions(wait_until):
+    store = make_store(idle_ttl=0.05, sweep_interval=0.02)
+    for _ in range(3):
+        store.create()
+    store.start_sweeper()
+    try:
+        assert wait_until(lambda: len(store) == 0, timeout=2)
+    finally:
+        store.stop_sweeper()
+
+
+def test_session_history_over_mock():
+    store = make_store()
+    session_id, session = store.get_or_create()
+    session['client'].chat_detailed("Câu hỏi thứ nhất của session", use_history=True, temperature=0.7)
+    store.save(session_id)
+
+    _, again = store.get_or_create(session_id)
+    assert len(again['client'].get_history()) == 2
+    assert store.clear_history(session_id)
+    assert again['client'].get_history() == []
+    assert store.delete(session_id) and not store.delete(session_id)
+
+
+@pytest.fixture
+def api(mock_ollama):
+    import api_server
+    return api_server.app.test_client()
+
+
+def test_api_session_lifecycle(api):
+    session_id = api.post('/api/session').get_json()['session_id']
+    for message in ("Câu một qua API", "Câu hai qua API"):
+        response = api.post('/api/chat', json={
+            'message': message, 'session_id': session_id, 'use_history': True, 'temperature': 0.7
+        })
+        assert response.status_code == 200
+
+    info = api.get(f'/api/session/{session_id}').get_json()
+    assert info['message_count'] == 4
+    assert api.delete(f'/api/session/{session_id}/history').status_code == 200
+    assert api.get(f'/api/session/{session_id}').get_json()['message_count'] == 0
+    assert api.delete(f'/api/session/{session_id}').status_code == 200
+    assert api.get(f'/api/session/{session_id}').status_code == 404
@@ -0,0 +1,154 @@
+# tests/test_singleflight.py
+# Gộp request giống hệt nhau và cắt stream gốc khi không còn ai nghe
+
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight
+from streaming import AbortHandle
+
+
+def run_in_threads(count, target):
+    results = [None] * count
+
+    def run(index):
+        try:
+            results[index] = target()
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_do_shares_result_with_followers(wait_until):
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "kết quả"
+
+    threads, results = run_in_threads(4, lambda: flight.do("key", fn))
+    assert wait_until(lambda: flight.stats()['coalesced'] == 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(calls) == 1
+    assert sorted(shared for _, shared in results) == [False, True, True, True]
+    assert {value for value, _ in results} == {"kết quả"}
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_do_shares_leader_error():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(5)
+        raise ValueError("leader lỗi")
+
+    leader, results = run_in_threads(1, lambda: flight.do("key", fn))
+    started.wait(5)
+    followers, follower_results = run_in_threads(1, lambda: flight.do("key", fn))
+    time.sleep(0.05)
+    release.set()
+    for thread in leader + followers:
+        thread.join(5)
+    assert isinstance(results[0], ValueError) and isinstance(follower_results[0], ValueError)
+
+
+def test_follower_wait_is_bounded():
+    flight = SingleFlight(wait_timeout=0.1)
+    started, release = threading.Event(), threading.Event()
+
+    def fn():
+        started.set()
+        release.wait(5)
+        return "chậm"
+
+    leader, results = run_in_threads(1, lambda: flight.do("key", fn))
+    started.wait(5)
+    with pytest.raises(TimeoutError):
+        flight.do("key", fn)
+    release.set()
+    leader[0].join(5)
+    assert results[0] == ("chậm", False)
+
+
+def test_stream_replays_from_start_for_late_subscriber():
+    flight = SingleFlight()
+    gate = threading.Event()
+
+    def factory(abort):
+        yield 1
+        gate.wait(5)
+        yield 2
+        yield 3
+
+    first = flight.stream("key", factory)
+    assert next(first) == 1
+    second = flight.stream("key", factory)
+    gate.set()
+    assert list(first) == [2, 3]
+    assert list(second) == [1, 2, 3]
+    assert flight.stats() == {'leaders': 1, 'coalesced': 1, 'in_flight': 0}
+
+
+def test_last_unsubscribe_aborts_source():
+    flight = SingleFlight()
+    source_aborted = threading.Event()
+
+    def factory(abort):
+        abort.add(source_aborted.set)
+        yield "token"
+        # Stream gốc đang chờ model: chỉ abort mới làm nó dừng
+        source_aborted.wait(5)
+
+    subscriber = flight.stream("key", factory)
+    assert next(subscriber) == "token"
+    subscriber.close()
+    assert source_aborted.wait(1)
+    assert flight.stats()['in_flight'] == 0
+
+
+def test_subscriber_abort_wakes_waiting_reader():
+    flight = SingleFlight()
+    handle = AbortHandle()
+    release = threading.Event()
+
+    def factory(abort):
+        abort.add(release.set)
+        release.wait(5)
+        yield "muộn"
+
+    subscriber = flight.stream("key", factory, handle)
+    reader, items = run_in_threads(1, lambda: list(subscriber))
+    time.sleep(0.05)
+    handle.abort()
+    reader[0].join(1)
+    assert not reader[0].is_alive()
+    assert items[0] == []
+
+
+
+def test_identical_client_requests_share_one_model_call(client, mock_ollama):
+    mock_ollama.latency = 0.3
+    threads, results = run_in_threads(
+        4, lambda: client.chat_detailed("Câu hỏi giống hệt nhau", temperature=0)
+    )
+    for thread in threads:
+        thread.join(10)
+
+    assert all(result.ok for result in results)
+    assert len({result.content for result in results}) == 1
+    assert client.singleflight.stats()['leaders'] == 1
+    assert sum(result.coalesced for result in results) == 3
@@ -0,0 +1,72 @@
+# tests/test_sqlite_session_store.py
+# Kho session SQLite dùng chung giữa nhiều worker (mỗi worker một SQLiteSessionStore)
+
+import pytest
+
+from deepseek_client import DeepSeekClient
+from response_cache import ResponseCache
+from sqlite_session_store import SQLiteSessionStore
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    def make(**kwargs):
+        return SQLiteSessionStore(
+            db_path=str(tmp_path / "sessions.db"),
+            client_factory=lambda: DeepSeekClient(cache=ResponseCache()),
+            **kwargs
+        )
+    return make
+
+
+def turn(store, session_id, message):
+    _, session = store.get_or_create(session_id)
+    result = session['client'].chat_detailed(message, use_history=True, temperature=0.7)
+    assert result.ok
+    store.save(session_id)
+
+
+def test_history_is_shared_between_workers(make_store):
+    worker_a, worker_b = make_store(), make_store()
+    session_id, _ = worker_a.create()
+    turn(worker_a, session_id, "Lượt một ở worker A")
+    turn(worker_b, session_id, "Lượt hai ở worker B")
+    turn(worker_a, session_id, "Lượt ba ở worker A")
+
+    history = worker_b.get(session_id)['client'].get_history()
+    assert [m['content'] for m in history if m['role'] == 'user'] == [
+        "Lượt một ở worker A", "Lượt hai ở worker B", "Lượt ba ở worker A"
+    ]
+    assert len(worker_a.get(session_id)['client'].get_history()) == 6
+
+
+def test_concurrent_saves_append_instead_of_overwriting(make_store):
+    worker_a, worker_b = make_store(), make_store()
+    session_id, _ = worker_a.create()
+    # Cả hai worker nạp session trước khi worker kia kịp ghi
+    _, session_a = worker_a.get_or_create(session_id)
+    _, session_b = worker_b.get_or_create(session_id)
+    session_a['client'].chat_detailed("Câu của A", use_history=True, temperature=0.7)
+    session_b['client'].chat_detailed("Câu của B", use_history=True, temperature=0.7)
+    worker_a.save(session_id)
+    worker_b.save(session_id)
+
+    reader = make_store()
+    history = reader.get(session_id)['client'].get_history()
+    assert [m['content'] for m in history if m['role'] == 'user'] == ["Câu của A", "Câu của B"]
+    # Worker B đọc lại từ DB ở lần sau thay vì giữ bản sao thiếu lượt của A
+    assert len(worker_b.get(session_id)['client'].get_history()) == 4
+
+
+def test_delete_clear_and_sweep(make_store):
+    store = make_store(idle_ttl=60)
+    session_id, _ = store.create()
+    turn(store, session_id, "Câu sẽ bị xóa")
+    assert store.clear_history(session_id)
+    assert make_store().get(session_id)['client'].get_history() == []
+
+    assert store.delete(session_id) and store.get(session_id) is None
+    expiring = make_store(idle_ttl=0)
+    expiring.create()
+    assert expiring.sweep() >= 1
+    assert len(expiring) == 0
@@ -0,0 +1,62 @@
+# tests/test_sse_streaming.py
+# /api/chat/stream: sự kiện SSE dạng JSON, lưu lịch sử, báo lỗi và hủy giữa chừng
+
+import json
+
+import pytest
+
+from scheduler import AdmissionController
+
+
+@pytest.fixture
+def api(mock_ollama):
+    import api_server
+    return api_server.app.test_client()
+
+
+def sse_events(response):
+    events = []
+    for frame in response.get_data(as_text=True).split("\n\n"):
+        if frame.startswith("data: "):
+            events.append(json.loads(frame[len("data: "):]))
+    return events
+
+
+def test_stream_events_and_history(api):
+    response = api.post('/api/chat/stream', json={
+        'message': 'Câu hỏi stream\nnhiều dòng', 'use_history': True, 'temperature': 0.7
+    })
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+
+    events = sse_events(response)
+    done = events[-1]
+    assert done['type'] == 'done' and done['session_id']
+    assert done['time_to_first_token'] is not None
+    text = "".join(e['content'] for e in events if e['type'] == 'token')
+
+    info = api.get(f"/api/session/{done['session_id']}").get_json()
+    assert [m['content'] for m in info['history']] == ['Câu hỏi stream\nnhiều dòng', text]
+
+
+def test_stream_reports_upstream_error(api, mock_ollama):
+    mock_ollama.error_rate = 1.0
+    events = sse_events(api.post('/api/chat/stream', json={
+        'message': 'Câu hỏi stream bị lỗi', 'temperature': 0.7
+    }))
+    assert events[-1]['type'] == 'error'
+    assert events[-1]['error']
+
+
+def test_closing_stream_releases_upstream(client, mock_ollama, wait_until):
+    mock_ollama.tokens_per_second = 5.0
+    mock_ollama.response_tokens = 50
+    client.scheduler = AdmissionController(max_concurrency=1)
+
+    events = client.chat_stream_events("Câu hỏi stream bị bỏ dở", temperature=0.7, use_history=True)
+    assert next(events)['type'] == 'token'
+    events.close()
+
+    # Lượt chạy được trả ngay, lịch sử không ghi câu trả lời dở
+    assert wait_until(lambda: client.scheduler.stats()['active'] == 0, timeout=1)
+    assert client.get_history() == []
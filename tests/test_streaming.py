@@ -0,0 +1,107 @@
+# tests/test_streaming.py
+# Pipeline streaming: giải mã NDJSON theo khối byte, gộp token, hủy stream đang đọc dở
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from scheduler import AdmissionController
+from streaming import (
+    AbortHandle,
+    NDJSONDecoder,
+    TokenCoalescer,
+    acoalesce_events,
+    coalesce_events,
+    iter_ndjson,
+)
+
+OBJECTS = [{"message": {"content": "Xin chào"}, "done": False}, {"done": True, "eval_count": 2}]
+PAYLOAD = "".join(json.dumps(o, ensure_ascii=False) + "\n" for o in OBJECTS).encode("utf-8")
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, len(PAYLOAD)])
+def test_ndjson_split_at_any_byte(size):
+    # Khối byte cắt ngang dòng và cả ký tự UTF-8 nhiều byte
+    chunks = [PAYLOAD[i:i + size] for i in range(0, len(PAYLOAD), size)]
+    assert list(iter_ndjson(chunks)) == OBJECTS
+
+
+def test_ndjson_last_line_without_newline():
+    decoder = NDJSONDecoder()
+    assert decoder.feed(b'{"a": 1}\n\n{"b"') == [{"a": 1}]
+    assert decoder.feed(b': 2}') == []
+    assert decoder.close() == [{"b": 2}]
+    assert decoder.close() == []
+
+
+def test_coalescer_sends_first_token_immediately():
+    coalescer = TokenCoalescer(max_delay=0.03, max_bytes=8)
+    assert coalescer.add("Xin", 0.0) == "Xin"
+    assert coalescer.add(" chào", 0.01) is None
+    assert coalescer.deadline == pytest.approx(0.03)
+    # Đủ max_bytes: gửi luôn không chờ hạn
+    assert coalescer.add(" bạn nhé", 0.02) == " chào bạn nhé"
+    assert coalescer.flush(0.05) is None
+
+
+def slow_tokens(count: int, gap: float):
+    for i in range(count):
+        time.sleep(gap)
+        yield {"type": "token", "content": f"t{i} "}
+    yield {"type": "done"}
+
+
+def test_coalesce_events_merges_tokens():
+    events = list(coalesce_events(slow_tokens(20, 0.005), max_delay=0.05))
+    tokens = [e for e in events if e["type"] == "token"]
+    assert "".join(e["content"] for e in tokens) == "".join(f"t{i} " for i in range(20))
+    assert 1 < len(tokens) < 20
+    assert events[-1] == {"type": "done"}
+
+
+def test_acoalesce_events_merges_tokens():
+    async def tokens():
+        for i in range(20):
+            await asyncio.sleep(0.005)
+            yield {"type": "token", "content": f"t{i} "}
+        yield {"type": "done"}
+
+    async def collect():
+        return [e async for e in acoalesce_events(tokens(), max_delay=0.05)]
+
+    events = asyncio.run(collect())
+    assert "".join(e["content"] for e in events[:-1]) == "".join(f"t{i} " for i in range(20))
+    assert len(events) < 21 and events[-1] == {"type": "done"}
+
+
+def test_stream_over_mock_is_coalesced(client, mock_ollama):
+    mock_ollama.tokens_per_second = 400.0
+    mock_ollama.response_tokens = 60
+    raw = list(client.chat_stream_events("Câu hỏi stream dài", temperature=0.7))
+    merged = list(coalesce_events(
+        client.chat_stream_events("Câu hỏi stream dài khác", temperature=0.7), max_delay=0.03
+    ))
+    assert raw[-1]["type"] == merged[-1]["type"] == "done"
+    assert len(merged) < len(raw)
+
+
+def test_aborted_stream_releases_scheduler_slot(client, mock_ollama, wait_until):
+    # Model sinh token chậm: nếu không cắt kết nối, lượt chạy bị giữ tới hết câu trả lời
+    mock_ollama.tokens_per_second = 5.0
+    mock_ollama.response_tokens = 50
+    client.scheduler = AdmissionController(max_concurrency=1)
+    handle = AbortHandle()
+
+    # Như /api/chat/stream: thread nền của coalesce_events đang đọc stream khi client bỏ đi
+    events = coalesce_events(
+        client.chat_stream_events("Câu hỏi stream sẽ bị hủy", temperature=0.7, abort=handle),
+        abort=handle
+    )
+    assert next(events)['type'] == 'token'
+    assert client.scheduler.stats()['active'] == 1
+
+    events.close()
+    assert handle.aborted
+    assert wait_until(lambda: client.scheduler.stats()['active'] == 0, timeout=2)
@@ -0,0 +1,55 @@
+# tests/test_template_index.py
+# Fast path câu mẫu (QA_TEMPLATES): khớp theo từng từ nội dung, có / không dấu
+
+import pytest
+
+from template_index import TemplateIndex
+
+TEMPLATES = {
+    "support": [
+        {"question": "Làm sao để đổi mật khẩu?", "answer": "Vào Cài đặt > Bảo mật"},
+        {"question": "Tôi quên mật khẩu", "answer": "Bấm Quên mật khẩu"},
+    ]
+}
+
+
+@pytest.fixture
+def index():
+    return TemplateIndex(TEMPLATES, threshold=0.9)
+
+
+@pytest.mark.parametrize("text, answer", [
+    ("Làm sao để đổi mật khẩu?", "Vào Cài đặt > Bảo mật"),
+    ("lam sao de doi mat khau", "Vào Cài đặt > Bảo mật"),
+    ("Tôi quen mat khau", "Bấm Quên mật khẩu"),
+    ("  TÔI QUÊN MẬT KHẨU!!  ", "Bấm Quên mật khẩu"),
+])
+def test_matches_same_question(index, text, answer):
+    match = index.match("support", text)
+    assert match is not None and match.answer == answer
+
+
+@pytest.mark.parametrize("text", [
+    "Làm sao để đổi mật khẩu ví?",      # Thêm từ nội dung không có trong câu mẫu
+    "Làm sao để đổi mật khẩu wifi nhà hàng xóm?",
+    "Tôi quên",
+    "Mật khẩu mạnh là gì?",
+])
+def test_rejects_different_question(index, text):
+    assert index.match("support", text) is None
+
+
+def test_unknown_scenario(index):
+    assert index.match("teacher", "Tôi quên mật khẩu") is None
+
+
+def test_client_answers_template_without_model(mock_ollama, client):
+    client.templates = TemplateIndex(TEMPLATES)
+    mock_ollama.error_rate = 1.0  # Gọi model thì sẽ lỗi
+    result = client.chat_detailed("tôi quên mật khẩu", scenario="support")
+    assert result.ok and result.source == "template"
+    assert result.content == "Bấm Quên mật khẩu"
+
+    mock_ollama.error_rate = 0.0
+    missed = client.chat_detailed("Tôi quên mật khẩu email công ty", scenario="support")
+    assert missed.source == "model"
@@ -0,0 +1,49 @@
+# tests/test_warmup.py
+# Làm nóng lúc khởi động: nạp model, prefill system prompt, bỏ qua backend chết
+
+import pytest
+
+from backend_pool import BackendPool
+from config import MODEL_NAME
+from mock_ollama import MockOllamaServer
+from warmup import Warmup
+
+
+@pytest.fixture
+def fresh_ollama():
+    # Mock riêng để model chưa được "nạp" ở các test khác
+    server = MockOllamaServer(port=0, latency=0.01).start()
+    yield server
+    server.stop()
+
+
+def test_warmup_loads_model_and_prefills(fresh_ollama):
+    warmup = Warmup(models=[MODEL_NAME], scenarios=True, backends=BackendPool([fresh_ollama.base_url]))
+    warmup.start()
+    assert warmup.wait(timeout=10)
+
+    stats = warmup.stats()
+    assert stats['state'] == 'ready' and stats['failed'] == []
+    assert MODEL_NAME in fresh_ollama.loaded
+    assert stats['load_duration'] > 0
+    assert stats['completed'] > 1
+
+
+def test_warmup_skips_dead_backend(fresh_ollama):
+    # Chưa có health check nào: warm-up tự kiểm tra trước, không chờ timeout ở backend chết
+    pool = BackendPool(["http://127.0.0.1:9", fresh_ollama.base_url])
+    warmup = Warmup(models=[MODEL_NAME], scenarios=False, backends=pool)
+    warmup.run()
+
+    stats = warmup.stats()
+    assert pool.last_check is not None
+    assert stats['state'] == 'degraded'
+    assert [step['kind'] for step in stats['failed']] == ['backend']
+    assert stats['completed'] == 1
+
+
+def test_missing_model_is_not_loaded(fresh_ollama):
+    warmup = Warmup(models=["khong-co:1b"], scenarios=False, backends=BackendPool([fresh_ollama.base_url]))
+    warmup.run()
+    assert warmup.ready and warmup.stats()['completed'] == 0
+    assert fresh_ollama.loaded == {}
@@ -0,0 +1,190 @@
+# warmup.py
+# Làm nóng lúc khởi động: nạp sẵn model (giữ bằng keep_alive) và prefill system prompt của các kịch bản
+
+import threading
+import time
+from typing import Dict, List, Optional
+
+import requests
+
+from config import (
+    MODEL_NAME,
+    SCENARIOS,
+    OLLAMA_KEEP_ALIVE,
+    WARMUP_ENABLED,
+    WARMUP_MODELS,
+    WARMUP_SCENARIOS,
+    WARMUP_TIMEOUT,
+)
+from backend_pool import BackendPool, get_backend_pool
+from http_transport import OllamaTransport, get_transport
+
+
+def warmup_models() -> List[str]:
+    """
+    Model cần nạp sẵn: WARMUP_MODELS, mặc định chỉ MODEL_NAME (không tự nạp
+    model lớn của các kịch bản, máy có thể chưa pull hoặc không đủ RAM)
+    """
+    if WARMUP_MODELS is not None:
+        return list(WARMUP_MODELS)
+    return [MODEL_NAME]
+
+
+class Warmup:
+    """
+    Làm nóng mọi Ollama backend trước khi nhận traffic
+
+    1. Nạp model: /api/generate không có prompt, kèm keep_alive để Ollama giữ
+       model trong RAM (request đầu tiên không phải trả load_duration)
+    2. Prefill: gửi system prompt của từng kịch bản với num_predict = 0 để
+       Ollama đánh giá sẵn phần prefix dùng chung của các request sau
+
+    Chạy trong thread nền; `ready` chuyển True khi xong (kể cả khi có bước
+    lỗi - lỗi được ghi lại trong stats() để không chặn server mãi mãi).
+    """
+
+    def __init__(
+        self,
+        models: Optional[List[str]] = None,
+        scenarios: bool = WARMUP_SCENARIOS,
+        backends: Optional[BackendPool] = None,
+        transport: Optional[OllamaTransport] = None,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        timeout: float = WARMUP_TIMEOUT
+    ):
+        self.models = models if models is not None else warmup_models()
+        self.scenarios = scenarios
+        self.backends = backends or get_backend_pool()
+        self.transport = transport or get_transport()
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.state = "pending"
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.steps: List[Dict] = []
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Chờ warm-up xong, trả về ready"""
+        return self._done.wait(timeout)
+
+    def _post(self, url: str, body: Dict) -> Dict:
+        response = self.transport.post(url, json=body, timeout=(5, self.timeout))
+        response.raise_for_status()
+        return response.json()
+
+    def _step(self, kind: str, backend_url: str, name: str, body: Dict, path: str):
+        """Chạy một request warm-up và ghi lại kết quả"""
+        start = time.perf_counter()
+        step = {"kind": kind, "backend": backend_url, "name": name}
+        try:
+            data = self._post(f"{backend_url}{path}", body)
+            step["ok"] = True
+            step["load_duration"] = round(data.get("load_duration", 0) / 1e9, 3)
+            step["prompt_eval_count"] = data.get("prompt_eval_count")
+        except (requests.exceptions.RequestException, ValueError) as e:
+            step["ok"] = False
+            step["error"] = f"{type(e).__name__}: {e}"
+        step["elapsed"] = round(time.perf_counter() - start, 3)
+        with self._lock:
+            self.steps.append(step)
+
+    def run(self):
+        """Chạy warm-up (đồng bộ)"""
+        with self._lock:
+            self.state = "running"
+            self.started_at = time.time()
+
+        if self.backends.last_check is None:
+            # Health checker chạy lần kiểm tra đầu trong thread của nó: tự kiểm
+            # tra để biết backend nào sống và có model nào trước khi nạp
+            self.backends.check_health()
+
+        for backend in self.backends.backends:
+            if not backend.available(time.time()):
+                # Backend đang bị loại (health check lỗi): bỏ qua thay vì chờ timeout từng bước
+                with self._lock:
+                    self.steps.append({
+                        "kind": "backend", "backend": backend.url, "name": backend.url,
+                        "ok": False, "error": backend.last_error, "elapsed": 0.0
+                    })
+                continue
+            models = [model for model in self.models if backend.has_model(model)]
+            for model in models:
+                # Chỉ request nạp model mang keep_alive, request chat / prefill
+                # dùng mặc định của Ollama
+                body = {"model": model}
+                if self.keep_alive is not None:
+                    body["keep_alive"] = self.keep_alive
+                self._step("model", backend.url, model, body, "/api/generate")
+
+            if not self.scenarios:
+                continue
+            for key, scenario in SCENARIOS.items():
+                # Prefill cho cả model ưu tiên và model dự phòng của kịch bản
+                for model in (scenario.get("model", MODEL_NAME), scenario.get("fallback_model")):
+                    if model not in models:
+                        continue
+                    body = {
+                        "model": model,
+                        "messages": [{"role": "system", "content": scenario["system_prompt"]}],
+                        "stream": False,
+                        "options": {
+                            "temperature": scenario.get("temperature", 0.7),
+                            "num_predict": 0
+                        }
+                    }
+                    self._step("scenario", backend.url, f"{key}@{model}", body, "/api/chat")
+
+        with self._lock:
+            failed = any(not step["ok"] for step in self.steps)
+            self.state = "degraded" if failed else "ready"
+            self.finished_at = time.time()
+        self._done.set()
+
+    def start(self):
+        """Chạy warm-up trong thread nền (daemon), gọi nhiều lần chỉ chạy một lần"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self.run, name='warmup', daemon=True)
+        self._thread.start()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            duration = None
+            if self.started_at is not None:
+                duration = round((self.finished_at or time.time()) - self.started_at, 3)
+            return {
+                'state': self.state,
+                'ready': self.ready,
+                'duration': duration,
+                'models': list(self.models),
+                'completed': sum(1 for step in self.steps if step["ok"]),
+                'failed': [step for step in self.steps if not step["ok"]],
+                'load_duration': round(sum(
+                    step.get("load_duration") or 0 for step in self.steps
+                ), 3)
+            }
+
+
+_warmup: Optional[Warmup] = None
+_warmup_lock = threading.Lock()
+
+
+def get_warmup() -> Optional[Warmup]:
+    """Lấy warm-up dùng chung của process (None nếu bị tắt)"""
+    global _warmup
+    if not WARMUP_ENABLED:
+        return None
+    if _warmup is None:
+        with _warmup_lock:
+            if _warmup is None:
+                _warmup = Warmup()
+    return _warmup